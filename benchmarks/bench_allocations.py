@@ -0,0 +1,67 @@
+# Allocation benchmark: transient memory and latency jitter of BallDetector.detect
+#
+# Run from the repository root:
+#   python -m benchmarks.bench_allocations
+
+import argparse
+import time
+import tracemalloc
+import numpy as np
+from src.detection import BallDetector
+from benchmarks.bench_detection import make_frame
+from benchmarks.synthetic import make_color_ranges
+
+
+def measure(detector, frames, repeats):
+    """
+    :return: Tuple of (mean transient MB allocated per frame, p50 ms, p99 ms).
+    """
+    for frame in frames:
+        detector.detect(frame)  # Warm up, buffers get allocated here
+
+    # Latency is measured without tracemalloc, which slows every allocation down
+    timings = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        detector.detect(frames[i % len(frames)])
+        timings.append(time.perf_counter() - start)
+
+    # High-water mark of memory allocated and released again within a frame
+    tracemalloc.start()
+    transient = []
+    for i in range(min(repeats, 50)):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        detector.detect(frames[i % len(frames)])
+        _, peak = tracemalloc.get_traced_memory()
+        transient.append(peak - before)
+    tracemalloc.stop()
+
+    timings = np.array(timings) * 1000
+    return float(np.mean(transient)) / 1e6, float(np.percentile(timings, 50)), float(np.percentile(timings, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BallDetector allocations and latency jitter.")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--colors", type=int, default=15)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    color_ranges = make_color_ranges(args.colors)
+    frames = [make_frame(color_ranges, args.width, args.height, ball_radius=30, seed=seed) for seed in range(4)]
+
+    print(f"{'method':>10} {'downscale':>9} {'buffers':>8} {'MB/frame':>9} {'p50 ms':>7} {'p99 ms':>7}")
+    for method, downscale in (("per_color", 1), ("lut", 1), ("lut", 2), ("components", 1), ("components", 2)):
+        for reuse in (False, True):
+            config = {"profile": "benchmark", "radius": 20, "method": method, "show_masks": False,
+                      "downscale": downscale, "reuse_buffers": reuse}
+            detector = BallDetector(config, color_ranges=color_ranges)
+            megabytes, p50, p99 = measure(detector, frames, args.repeats)
+            label = "reused" if reuse else "new"
+            print(f"{method:>10} {downscale:>9} {label:>8} {megabytes:>9.2f} {p50:>7.2f} {p99:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Detection benchmark: per-frame cost against the number of profile colors
+#
+# Run from the repository root:
+#   python -m benchmarks.bench_detection
+
+import argparse
+import time
+import cv2 as cv
+import numpy as np
+from src.detection import BallDetector
+from benchmarks.synthetic import CLOTH_HSV, make_color_ranges
+
+
+def make_frame(color_ranges, width, height, ball_radius, seed=0):
+    """
+    Render a table frame with one ball per color range.
+    :return: BGR frame.
+    """
+    rng = np.random.default_rng(seed)
+    hsv = np.empty((height, width, 3), np.uint8)
+    hsv[:] = CLOTH_HSV
+    for color in color_ranges.values():
+        hue = (color["H_lower"] + color["H_upper"]) // 2
+        center = (int(rng.integers(ball_radius, width - ball_radius)),
+                  int(rng.integers(ball_radius, height - ball_radius)))
+        cv.circle(hsv, center, ball_radius, (hue, 200, 200), -1)
+    return cv.cvtColor(hsv, cv.COLOR_HSV2BGR)
+
+
+def time_detect(detector, frame, repeats):
+    """
+    :return: Median time of a detect call in milliseconds.
+    """
+    detector.detect(frame)  # Warm up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        detector.detect(frame)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BallDetector against the number of colors.")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--colors", type=int, nargs="+", default=[1, 2, 4, 8, 15])
+    parser.add_argument("--downscale", type=int, default=1, help="Coarse-to-fine factor for the lut and components methods")
+    args = parser.parse_args()
+
+    print(f"{'colors':>6} {'per_color ms':>13} {'lut ms':>8} {'components ms':>14}")
+    for count in args.colors:
+        color_ranges = make_color_ranges(count)
+        frame = make_frame(color_ranges, args.width, args.height, ball_radius=30)
+        row = []
+        for method in ("per_color", "lut", "components"):
+            config = {"profile": "benchmark", "radius": 20, "method": method, "show_masks": False,
+                      "downscale": args.downscale}
+            detector = BallDetector(config, color_ranges=color_ranges)
+            row.append(time_detect(detector, frame, args.repeats))
+        print(f"{count:>6} {row[0]:>13.2f} {row[1]:>8.2f} {row[2]:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
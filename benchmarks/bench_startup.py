@@ -0,0 +1,71 @@
+# Startup benchmark: time from a fresh interpreter until the first frame can be processed
+#
+# Every run is a new process, so imports and config loading are paid in full.
+# Cold runs remove the compiled config cache first, warm runs reuse it.
+#
+# Run from the repository root:
+#   python -m benchmarks.bench_startup
+
+import os
+import sys
+import glob
+import argparse
+import subprocess
+import time
+import numpy as np
+from config.cache import CACHE_DIR
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = {
+    "import src.main": "import src.main",
+    "load_config": "from config.config import load_config; load_config('default')",
+    "detector + tracker": (
+        "from config.config import load_config\n"
+        "from src.detection import BallDetector\n"
+        "from src.tracking import MultiBallTracker\n"
+        "config = load_config('default')\n"
+        "BallDetector(dict(config['detector'], show_masks=False))\n"
+        "MultiBallTracker(dict(config['tracking'], log_path=''))\n"
+    ),
+}
+
+
+def clear_cache():
+    """
+    Remove the parsed config files and derived tables of the compiled config cache.
+    """
+    paths = glob.glob(os.path.join(CACHE_DIR, "*.yaml.json")) + glob.glob(os.path.join(CACHE_DIR, "lut-*.npy"))
+    for path in paths:
+        os.remove(path)
+
+
+def time_process(code, repeats, cold):
+    """
+    :return: Wall clock milliseconds of each run of the code in a fresh interpreter.
+    """
+    timings = []
+    for _ in range(repeats):
+        if cold:
+            clear_cache()
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold and warm start up of the tracker.")
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    baseline = time_process("pass", args.repeats, cold=False)
+    print(f"Bare interpreter: {np.median(baseline):.1f} ms, subtracted below")
+    print(f"{'stage':>20} {'cold p50 ms':>12} {'warm p50 ms':>12} {'warm min ms':>12}")
+    for name, code in STAGES.items():
+        cold = time_process(code, args.repeats, cold=True) - np.median(baseline)
+        warm = time_process(code, args.repeats, cold=False) - np.median(baseline)
+        print(f"{name:>20} {np.median(cold):>12.1f} {np.median(warm):>12.1f} {warm.min():>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Tracking benchmark: greedy against optimal assignment
+#
+# Run from the repository root:
+#   python -m benchmarks.bench_tracking
+
+import argparse
+import time
+import cv2 as cv
+import numpy as np
+from src.tracking import MultiBallTracker
+
+
+def make_detection(position, radius, color):
+    """
+    Build a detection in the BallDetector output format.
+    """
+    center = (int(position[0]), int(position[1]))
+    contour = cv.ellipse2Poly(center, (radius, radius), 0, 0, 360, 10).reshape(-1, 1, 2)
+    return {"position": center, "radius": radius, "color": color, "contour": contour}
+
+
+def make_sequence(frames, balls, noise, width=1920, height=1080, radius=30, seed=0):
+    """
+    Simulate balls moving and bouncing off the rails, with noise detections.
+    :return: List of (detections, ground truth ball index per detection or -1 for noise).
+    """
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform([radius, radius], [width - radius, height - radius], (balls, 2))
+    velocities = rng.normal(0, 6, (balls, 2))
+    low, high = np.array([radius, radius]), np.array([width - radius, height - radius])
+
+    sequence = []
+    for _ in range(frames):
+        positions += velocities
+        bounced = (positions < low) | (positions > high)
+        velocities[bounced] *= -1
+        positions = np.clip(positions, low, high)
+
+        detections = [make_detection(p + rng.normal(0, 1, 2), radius, f"ball_{i}") for i, p in enumerate(positions)]
+        truth = list(range(balls))
+        for _ in range(rng.poisson(noise)):
+            detections.append(make_detection(rng.uniform(low, high), radius, "noise"))
+            truth.append(-1)
+
+        order = rng.permutation(len(detections))
+        sequence.append(([detections[i] for i in order], [truth[i] for i in order]))
+    return sequence
+
+
+def run(config, sequence):
+    """
+    :return: Tuple of (median ms per update, p99 ms per update, ID switches).
+    """
+    tracker = MultiBallTracker(config)
+    timings = []
+    last_id = {}
+    switches = 0
+
+    for detections, truth in sequence:
+        start = time.perf_counter()
+        tracker.update_tracks(detections)
+        timings.append(time.perf_counter() - start)
+
+        # A ball switches ID when the track holding its detection changes
+        track_at = {track["position"]: track["id"] for track in tracker.get_tracks()}
+        for detection, ball in zip(detections, truth):
+            if ball < 0:
+                continue
+            track_id = track_at.get(detection["position"])
+            if ball in last_id and track_id != last_id[ball]:
+                switches += 1
+            last_id[ball] = track_id
+
+    timings = np.array(timings) * 1000
+    return float(np.median(timings)), float(np.percentile(timings, 99)), switches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MultiBallTracker assignment modes.")
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--balls", type=int, default=16)
+    parser.add_argument("--noise", type=float, default=4.0, help="Mean noise detections per frame")
+    args = parser.parse_args()
+
+    sequence = make_sequence(args.frames, args.balls, args.noise)
+    base = {"buffer_size": 64, "max_distance": 50, "min_area": 1000}
+
+    print(f"{'assignment':>10} {'median ms':>10} {'p99 ms':>8} {'ID switches':>12}")
+    for assignment in ("greedy", "optimal"):
+        config = dict(base, assignment=assignment, max_missed_frames=5 if assignment == "optimal" else 0)
+        median, p99, switches = run(config, sequence)
+        print(f"{assignment:>10} {median:>10.3f} {p99:>8.3f} {switches:>12}")
+
+
+if __name__ == "__main__":
+    main()
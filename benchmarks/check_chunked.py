@@ -0,0 +1,127 @@
+# Consistency check: chunked against sequential track IDs
+#
+# Renders a synthetic table long enough to span several chunks, tracks it
+# once in a single pass and once in parallel chunks, and compares the track
+# IDs frame by frame. Both runs track with the chunk tracker settings, which
+# always use optimal assignment. Stitching is only correct when both runs
+# number every ball the same, the check exits with status 1 otherwise.
+#
+# Run from the repository root:
+#   python -m benchmarks.check_chunked
+#   python -m benchmarks.check_chunked --frames 900 --chunk-frames 300 --overlap-frames 60
+#   python -m benchmarks.check_chunked --moving 0.9 --occluders 3
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import cv2 as cv
+from config.config import load_config
+from src.batch import iter_frames, TrackWriter
+from src.chunked import run_chunked, chunk_tracker_config
+from src.detection import BallDetector
+from src.physics import AdaptiveDetectionInterval
+from src.tracking import MultiBallTracker, track_frame
+from benchmarks.synthetic import SyntheticTable
+
+
+def render(table, frames, directory):
+    """
+    Write the frames of a synthetic table to an image directory, losslessly
+    so both runs see exactly the same pixels.
+    """
+    for i in range(frames):
+        frame, _ = table.step()
+        cv.imwrite(os.path.join(directory, f"{i:06d}.png"), frame)
+
+
+def run_sequential(input_path, output_path, config, color_ranges):
+    """
+    Track a recording in a single pass, the way run_batch does, with the
+    tracker settings of the chunks.
+    """
+    tracker_config = chunk_tracker_config(config)
+    detector = BallDetector(dict(config["detector"], show_masks=False), color_ranges=color_ranges)
+    tracker = MultiBallTracker(tracker_config)
+    interval = AdaptiveDetectionInterval(**tracker_config.get("detection_interval", {}))
+    writer = TrackWriter(output_path)
+    try:
+        for frame_index, timestamp, frame in iter_frames(input_path, reuse_buffer=True):
+            track_frame(frame, detector, tracker, interval, None, frame_index, timestamp)
+            writer.write(frame_index, timestamp, tracker.get_tracks())
+    finally:
+        writer.close()
+        tracker.close()
+
+
+def read_ids(path):
+    """
+    :return: {frame_index: [(track ID, color, position)]} of a JSONL track file.
+    """
+    frames = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            frames[record["frame"]] = [(t["id"], t["color"], tuple(t["position"])) for t in record["tracks"]]
+    return frames
+
+
+def compare(sequential, chunked):
+    """
+    :return: Frame indexes whose tracks differ between the two runs, in order.
+    """
+    return [index for index in sorted(set(sequential) | set(chunked)) if sequential.get(index) != chunked.get(index)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that chunked processing numbers tracks like a sequential run.")
+    parser.add_argument("--profile", default="default", help="Configuration profile to track with")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--width", type=int, default=960)
+    parser.add_argument("--height", type=int, default=540)
+    parser.add_argument("--balls", type=int, default=16)
+    parser.add_argument("--moving", type=float, default=0.5, help="Fraction of the balls that start rolling")
+    parser.add_argument("--occluders", type=int, default=1, help="Number of cue-like bars over the table")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-frames", type=int, default=200, help="Frames per chunk, several chunks per clip")
+    parser.add_argument("--overlap-frames", type=int, default=None, help="Overlap of the chunks, the profile's by default")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes, 0 for one per core")
+    args = parser.parse_args()
+
+    table = SyntheticTable(args.width, args.height, args.balls, moving=args.moving,
+                           occluders=args.occluders, seed=args.seed)
+    color_ranges, radius, min_area = table.profile()
+    config = load_config(args.profile)
+    config["detector"] = dict(config["detector"], radius=radius)
+    config["tracking"] = dict(config["tracking"], min_area=min_area)
+    config["chunked"] = dict(config.get("chunked", {}), chunk_frames=args.chunk_frames, workers=args.workers)
+    if args.overlap_frames is not None:
+        config["chunked"]["overlap_frames"] = args.overlap_frames
+
+    with tempfile.TemporaryDirectory() as directory:
+        frames_path = os.path.join(directory, "frames")
+        os.mkdir(frames_path)
+        render(table, args.frames, frames_path)
+
+        sequential_path = os.path.join(directory, "sequential.jsonl")
+        chunked_path = os.path.join(directory, "chunked.jsonl")
+        run_sequential(frames_path, sequential_path, config, color_ranges)
+        run_chunked(frames_path, chunked_path, config, color_ranges=color_ranges)
+        sequential, chunked = read_ids(sequential_path), read_ids(chunked_path)
+
+    chunks = -(-args.frames // args.chunk_frames)
+    mismatched = compare(sequential, chunked)
+    if not mismatched:
+        print(f"{len(sequential)} frames in {chunks} chunks: chunked track IDs match the sequential run.")
+        return
+
+    first = mismatched[0]
+    print(f"{len(mismatched)} of {len(sequential)} frames in {chunks} chunks differ, the first is frame {first}:")
+    print(f"  sequential {sequential.get(first)}")
+    print(f"  chunked    {chunked.get(first)}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
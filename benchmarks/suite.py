@@ -0,0 +1,277 @@
+# End to end benchmark on synthetic table footage
+#
+# Times detection, tracking and drawing separately and together, checks the
+# detections against the rendered ground truth, and compares the results
+# with a saved baseline.
+#
+# Run from the repository root:
+#   python -m benchmarks.suite --save results.json
+#   python -m benchmarks.suite --baseline results.json
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import cv2 as cv
+import numpy as np
+from config.config import load_config
+from src.detection import BallDetector
+from src.physics import AdaptiveDetectionInterval
+from src.tracking import MultiBallTracker, track_frame
+from src.util import solve_assignment
+from benchmarks.synthetic import SyntheticTable
+
+STAGES = ("detect", "update_tracks", "draw_tracks", "end_to_end")
+HIGHER_IS_BETTER = ("fps", "recall", "precision")
+
+
+def build(config, table):
+    """
+    Create the detector, tracker and detection interval for a synthetic table,
+    using the profile settings with the colors and sizes of the rendered balls.
+    """
+    color_ranges, radius, min_area = table.profile()
+    detector_config = dict(config["detector"], radius=radius, show_masks=False)
+    tracking_config = dict(config["tracking"], min_area=min_area)
+
+    detector = BallDetector(detector_config, color_ranges=color_ranges)
+    tracker = MultiBallTracker(tracking_config)
+    interval = None
+    if "detection_interval" in tracking_config:
+        interval = AdaptiveDetectionInterval(**tracking_config["detection_interval"])
+    return detector, tracker, interval
+
+
+def summarize(timings):
+    """
+    :param timings: Per-frame durations in seconds.
+    :return: Latency percentiles in milliseconds and the matching throughput.
+    """
+    timings = np.asarray(timings) * 1000
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "mean_ms": float(np.mean(timings)),
+        "fps": float(1000 / np.mean(timings)),
+    }
+
+
+def match_truth(detections, truth):
+    """
+    Match detections to the visible balls, a pair only counts when the
+    detected center lies inside the true ball.
+    :return: Tuple of (matched pairs, center errors of the matches).
+    """
+    visible = [ball for ball in truth if ball["visible"]]
+    if not detections or not visible:
+        return 0, []
+
+    detected = np.array([ball["position"] for ball in detections], dtype=np.float64)
+    expected = np.array([ball["position"] for ball in visible], dtype=np.float64)
+    distances = np.linalg.norm(detected[:, None] - expected[None], axis=2)
+    rows, cols = solve_assignment(distances)
+    errors = [distances[r, c] for r, c in zip(rows, cols) if distances[r, c] <= visible[c]["radius"]]
+    return len(errors), errors
+
+
+def run_stages(config, scenario, frames):
+    """
+    Run detection on every frame and time each stage on its own.
+    :return: Tuple of (timings per stage, accuracy summary).
+    """
+    table = SyntheticTable(**scenario)
+    detector, tracker, _ = build(config, table)
+    timings = {stage: [] for stage in STAGES[:3]}
+    matched, detected, expected, errors = 0, 0, 0, []
+
+    for _ in range(frames):
+        frame, truth = table.step()
+
+        start = time.perf_counter()
+        detections = detector.detect(frame)
+        timings["detect"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        tracker.update_tracks(detections)
+        timings["update_tracks"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        tracker.draw_tracks(frame)
+        timings["draw_tracks"].append(time.perf_counter() - start)
+
+        count, frame_errors = match_truth(detections, truth)
+        matched += count
+        detected += len(detections)
+        expected += sum(ball["visible"] for ball in truth)
+        errors.extend(frame_errors)
+
+    accuracy = {
+        "recall": matched / max(expected, 1),
+        "precision": matched / max(detected, 1),
+        "center_error_px": float(np.mean(errors)) if errors else None,
+        "track_ids": tracker.next_ball_id,
+    }
+    return timings, accuracy
+
+
+def run_end_to_end(config, scenario, frames):
+    """
+    Run the same loop as the application, including the adaptive detection
+    interval, and time each frame as a whole.
+    :return: Per-frame durations in seconds.
+    """
+    table = SyntheticTable(**scenario)
+    detector, tracker, interval = build(config, table)
+    timings = []
+
+    for _ in range(frames):
+        frame, _ = table.step()
+        start = time.perf_counter()
+        track_frame(frame, detector, tracker, interval)
+        tracker.draw_tracks(frame)
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+def peak_memory(config, scenario, frames):
+    """
+    Highest memory traced while frames are processed, rendering excluded.
+    :return: Peak in megabytes.
+    """
+    table = SyntheticTable(**scenario)
+    detector, tracker, interval = build(config, table)
+    frame, _ = table.step()
+    track_frame(frame, detector, tracker, interval)  # Warm up, buffers get allocated here
+
+    peak = 0
+    tracemalloc.start()
+    for _ in range(frames):
+        frame, _ = table.step()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        track_frame(frame, detector, tracker, interval)
+        tracker.draw_tracks(frame)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return peak / 1e6
+
+
+def run_suite(config, scenario, frames, memory_frames=30):
+    """
+    :return: Benchmark report, ready to be saved as JSON.
+    """
+    timings, accuracy = run_stages(config, scenario, frames)
+    timings["end_to_end"] = run_end_to_end(config, scenario, frames)
+
+    return {
+        "scenario": dict(scenario, frames=frames),
+        "environment": {
+            "python": platform.python_version(),
+            "opencv": cv.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+        },
+        "results": {
+            **{stage: summarize(timings[stage]) for stage in STAGES},
+            "peak_memory_mb": peak_memory(config, scenario, min(frames, memory_frames)),
+            "accuracy": accuracy,
+        },
+    }
+
+
+def flatten(results, prefix=""):
+    """
+    :return: {"stage.metric": value} for every numeric result.
+    """
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(report, baseline, tolerance):
+    """
+    Compare a report with a baseline report.
+    :param tolerance: Relative change that counts as a regression.
+    :return: List of (metric, baseline value, current value, relative change) that regressed.
+    """
+    if report["scenario"] != baseline["scenario"]:
+        print("Warning: the baseline was recorded with a different scenario.")
+
+    current, previous = flatten(report["results"]), flatten(baseline["results"])
+    regressions = []
+    for metric, old in previous.items():
+        new = current.get(metric)
+        if new is None or old == 0 or metric.endswith("track_ids"):
+            continue
+        change = (new - old) / abs(old)
+        worse = -change if metric.rsplit(".", 1)[-1] in HIGHER_IS_BETTER else change
+        if worse > tolerance:
+            regressions.append((metric, old, new, change))
+    return regressions
+
+
+def print_report(report):
+    results = report["results"]
+    print(f"{'stage':>14} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8} {'fps':>8}")
+    for stage in STAGES:
+        row = results[stage]
+        print(f"{stage:>14} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['mean_ms']:>8.2f} {row['fps']:>8.1f}")
+    print(f"Peak memory per frame: {results['peak_memory_mb']:.2f} MB")
+
+    accuracy = results["accuracy"]
+    error = accuracy["center_error_px"]
+    print(f"Recall {accuracy['recall']:.3f}, precision {accuracy['precision']:.3f}, "
+          f"center error {error if error is None else round(error, 2)} px, {accuracy['track_ids']} track IDs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection and tracking on synthetic table footage.")
+    parser.add_argument("--profile", default="default", help="Configuration profile to benchmark")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--balls", type=int, default=16)
+    parser.add_argument("--colors", type=int, default=None, help="Distinct ball colors, one per ball by default")
+    parser.add_argument("--moving", type=float, default=0.25, help="Fraction of the balls that start rolling")
+    parser.add_argument("--speed", type=float, default=12.0, help="Mean initial speed in pixels per frame")
+    parser.add_argument("--noise", type=float, default=4.0, help="Standard deviation of the pixel noise")
+    parser.add_argument("--gradient", type=float, default=0.25, help="Strength of the lighting falloff")
+    parser.add_argument("--occluders", type=int, default=1, help="Number of cue-like bars over the table")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="Write the report to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a report saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative change flagged as a regression")
+    args = parser.parse_args()
+
+    scenario = {
+        "width": args.width, "height": args.height, "balls": args.balls, "colors": args.colors,
+        "moving": args.moving, "speed": args.speed, "noise": args.noise, "gradient": args.gradient,
+        "occluders": args.occluders, "seed": args.seed,
+    }
+    report = run_suite(load_config(args.profile), scenario, args.frames)
+    print_report(report)
+
+    if args.save:
+        with open(args.save, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.tolerance)
+        for metric, old, new, change in regressions:
+            print(f"REGRESSION {metric}: {old:.3f} -> {new:.3f} ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
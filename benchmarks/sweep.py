@@ -0,0 +1,333 @@
+# Parameter sweep: tracking accuracy against throughput over a grid of settings
+#
+# Every combination of the swept settings tracks the same clips, synthetic
+# tables rendered with their ground truth or recorded clips with an
+# annotation file, in parallel across cores. Each setting is scored on
+# throughput, ID switches, missed balls, false tracks and center error. The
+# settings no other setting beats on both speed and accuracy make up the
+# Pareto frontier, and the chosen one is written out as a config.yaml profile.
+#
+# An annotation file lists the true balls of every frame in the JSONL track
+# format of --output, so a corrected tracker output works as ground truth.
+#
+# Run from the repository root:
+#   python -m benchmarks.sweep --set detector.kernel_size=5,7,9 --set tracking.max_distance=50,100
+#   python -m benchmarks.sweep --clip footage.avi:truth.jsonl --min-fps 60 --emit tuned.yaml
+
+import os
+import copy
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+import numpy as np
+import yaml
+from config.config import load_config
+from config.schema import validate_config
+from src.batch import iter_frames
+from src.chunked import init_worker
+from src.detection import BallDetector
+from src.physics import AdaptiveDetectionInterval
+from src.tracking import MultiBallTracker, track_frame
+from src.util import solve_assignment
+from benchmarks.synthetic import SyntheticTable
+
+DEFAULT_GRID = {
+    "detector.kernel_size": [5, 7, 9],
+    "detector.dilate_iterations": [1, 2],
+    "detector.approx_epsilon": [0.02, 0.04],
+}
+
+
+def parse_setting(spec):
+    """
+    Parse a --set argument of the form section.key=value[,value...].
+    :return: Tuple of (dotted path, list of values), the values parsed as YAML scalars.
+    """
+    path, separator, values = spec.partition("=")
+    if not separator or not path or not values:
+        raise ValueError(f"Invalid setting '{spec}', expected section.key=value[,value...]")
+    return path, [yaml.safe_load(value) for value in values.split(",")]
+
+
+def expand_grid(grid):
+    """
+    :param grid: {dotted path: list of values}.
+    :return: List of {dotted path: value}, one per combination.
+    """
+    paths = list(grid)
+    return [dict(zip(paths, values)) for values in itertools.product(*(grid[path] for path in paths))]
+
+
+def apply_settings(config, settings):
+    """
+    :param config: Profile configuration.
+    :param settings: {dotted path: value} to set.
+    :return: A copy of the configuration with the settings applied.
+    """
+    config = copy.deepcopy(config)
+    for path, value in settings.items():
+        *sections, key = path.split(".")
+        section = config
+        for name in sections:
+            section = section.setdefault(name, {})
+        section[key] = value
+    return config
+
+
+def load_annotations(path):
+    """
+    Read ground truth in the JSONL track format.
+    :return: {frame index: list of true balls with id, position and radius}.
+    """
+    truth = {}
+    with open(path) as truth_file:
+        for line in truth_file:
+            if line.strip():
+                record = json.loads(line)
+                truth[record["frame"]] = record["tracks"]
+    return truth
+
+
+def iter_clip(clip, frames):
+    """
+    Frames of a clip with the visible true balls of each.
+    :param clip: ("synthetic", scenario) or ("recorded", (video path, annotation path)).
+    :param frames: Frames to render of a synthetic clip.
+    :return: Generator of (frame_index, timestamp, frame, truth).
+    """
+    kind, source = clip
+    if kind == "synthetic":
+        table = SyntheticTable(**source)
+        for index in range(frames):
+            frame, truth = table.step()
+            yield index, index / 30.0, frame, [ball for ball in truth if ball["visible"]]
+        return
+
+    video_path, annotation_path = source
+    truth = load_annotations(annotation_path)
+    for index, timestamp, frame in iter_frames(video_path, reuse_buffer=True):
+        yield index, timestamp, frame, truth.get(index, [])
+
+
+def build(config, settings, clip):
+    """
+    Create the detector, tracker and detection interval for a clip. On a
+    synthetic table the colors and sizes of its rendered balls replace the
+    profile's, unless the swept settings set them.
+    """
+    color_ranges = None
+    if clip[0] == "synthetic":
+        color_ranges, radius, min_area = SyntheticTable(**clip[1]).profile()
+        config = apply_settings(config, {"detector.radius": radius, "tracking.min_area": min_area})
+    config = apply_settings(config, settings)
+    detector_config = dict(config["detector"], show_masks=False)
+    tracking_config = dict(config["tracking"], log_path="")
+
+    detector = BallDetector(detector_config, color_ranges=color_ranges)
+    tracker = MultiBallTracker(tracking_config)
+    interval = None
+    if "detection_interval" in tracking_config:
+        interval = AdaptiveDetectionInterval(**tracking_config["detection_interval"])
+    return detector, tracker, interval
+
+
+def score_clip(task):
+    """
+    Track one clip with one setting, matching the tracks to the ground truth
+    on every frame. A true ball is found when a track is within its radius.
+    :param task: Tuple of (setting index, base configuration, settings, clip, frames).
+    :return: Tuple of (setting index, counts summed over the clip).
+    """
+    index, config, settings, clip, frames = task
+    detector, tracker, interval = build(config, settings, clip)
+    counts = {"frames": 0, "seconds": 0.0, "balls": 0, "missed": 0, "false_tracks": 0,
+              "id_switches": 0, "matched": 0, "center_error": 0.0}
+    last_track = {}  # True ball id -> track id it was last matched to
+
+    for frame_index, timestamp, frame, truth in iter_clip(clip, frames):
+        start = time.perf_counter()
+        track_frame(frame, detector, tracker, interval, None, frame_index, timestamp)
+        counts["seconds"] += time.perf_counter() - start
+        counts["frames"] += 1
+
+        tracks = tracker.get_tracks()
+        matches = []
+        if tracks and truth:
+            found = np.array([track["position"] for track in tracks], dtype=np.float64)
+            expected = np.array([ball["position"] for ball in truth], dtype=np.float64)
+            distances = np.linalg.norm(expected[:, None] - found[None], axis=2)
+            rows, cols = solve_assignment(distances)
+            matches = [(r, c, distances[r, c]) for r, c in zip(rows, cols) if distances[r, c] <= truth[r]["radius"]]
+
+        for r, c, distance in matches:
+            ball_id, track_id = truth[r]["id"], tracks[c]["id"]
+            if last_track.get(ball_id, track_id) != track_id:
+                counts["id_switches"] += 1
+            last_track[ball_id] = track_id
+            counts["center_error"] += distance
+        counts["balls"] += len(truth)
+        counts["matched"] += len(matches)
+        counts["missed"] += len(truth) - len(matches)
+        counts["false_tracks"] += len(tracks) - len(matches)
+
+    tracker.close()
+    return index, counts
+
+
+def summarize(counts):
+    """
+    :param counts: Counts summed over all clips of a setting.
+    :return: Throughput and accuracy, MOTA combining misses, false tracks and
+             ID switches into one score of at most 1.
+    """
+    balls = max(counts["balls"], 1)
+    return {
+        "fps": counts["frames"] / counts["seconds"] if counts["seconds"] > 0 else 0.0,
+        "mota": 1.0 - (counts["missed"] + counts["false_tracks"] + counts["id_switches"]) / balls,
+        "id_switches": counts["id_switches"],
+        "missed": counts["missed"],
+        "false_tracks": counts["false_tracks"],
+        "center_error_px": counts["center_error"] / counts["matched"] if counts["matched"] else None,
+    }
+
+
+def pareto_frontier(results):
+    """
+    Keep the results that no other result beats on both throughput and MOTA,
+    a lower center error breaking ties in MOTA.
+    :param results: List of {"settings": ..., "scores": ...}.
+    :return: The frontier, fastest first.
+    """
+    def accuracy(result):
+        error = result["scores"]["center_error_px"]
+        return result["scores"]["mota"], -error if error is not None else -np.inf
+
+    frontier = []
+    best = None
+    for result in sorted(results, key=lambda result: (-result["scores"]["fps"], tuple(-value for value in accuracy(result)))):
+        if best is None or accuracy(result) > best:
+            frontier.append(result)
+            best = accuracy(result)
+    return frontier
+
+
+def choose(frontier, min_fps=0.0):
+    """
+    :return: The most accurate frontier result with at least min_fps, or the fastest when none is that fast.
+    """
+    fast_enough = [result for result in frontier if result["scores"]["fps"] >= min_fps]
+    return fast_enough[-1] if fast_enough else frontier[0]
+
+
+def run_sweep(config, grid, clips, frames, workers=0):
+    """
+    Score every setting of the grid on every clip.
+    :param config: Base profile configuration.
+    :param grid: {dotted path: list of values}.
+    :param clips: List of clips, see iter_clip.
+    :param frames: Frames of each synthetic clip.
+    :param workers: Worker processes, 0 for one per core.
+    :return: List of {"settings": ..., "scores": ...} in grid order.
+    """
+    settings = expand_grid(grid)
+    tasks = [(i, config, setting, clip, frames) for i, setting in enumerate(settings) for clip in clips]
+    totals = [None] * len(settings)
+
+    workers = workers or os.cpu_count() or 1
+    # One OpenCV thread per worker, so parallel settings do not skew each other's timings as much
+    with multiprocessing.Pool(min(workers, len(tasks)), initializer=init_worker, initargs=(1,)) as pool:
+        for done, (index, counts) in enumerate(pool.imap_unordered(score_clip, tasks), 1):
+            if totals[index] is None:
+                totals[index] = counts
+            else:
+                totals[index] = {name: totals[index][name] + value for name, value in counts.items()}
+            print(f"\r{done}/{len(tasks)} runs", end="", flush=True)
+    print()
+
+    return [{"settings": setting, "scores": summarize(counts)} for setting, counts in zip(settings, totals)]
+
+
+def print_results(results, frontier):
+    paths = list(results[0]["settings"]) if results else []
+    header = " ".join(f"{path.rsplit('.', 1)[-1]:>18}" for path in paths)
+    print(f"  {header} {'fps':>8} {'MOTA':>7} {'switches':>8} {'missed':>7} {'false':>7} {'error px':>8}")
+    for result in sorted(results, key=lambda result: -result["scores"]["fps"]):
+        scores = result["scores"]
+        error = scores["center_error_px"]
+        marker = "*" if any(result is member for member in frontier) else " "
+        values = " ".join(f"{str(result['settings'][path]):>18}" for path in paths)
+        print(f"{marker} {values} {scores['fps']:>8.1f} {scores['mota']:>7.3f} {scores['id_switches']:>8} "
+              f"{scores['missed']:>7} {scores['false_tracks']:>7} {'-' if error is None else f'{error:.2f}':>8}")
+    print("* Pareto frontier")
+
+
+def emit_profile(path, name, config):
+    """
+    Write a profile in the config.yaml format, to be merged into config/config.yaml.
+    """
+    validate_config(config)
+    with open(path, "w") as profile_file:
+        yaml.dump({"profiles": {name: config}}, profile_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep detector and tracker settings for accuracy against speed.")
+    parser.add_argument("--profile", default="default", help="Configuration profile the settings are applied to")
+    parser.add_argument("--set", action="append", default=[], metavar="SECTION.KEY=V1,V2",
+                        help="Setting to sweep and its values, repeat for a grid (default: detector kernel, dilations and approx epsilon)")
+    parser.add_argument("--clip", action="append", default=[], metavar="VIDEO:ANNOTATIONS",
+                        help="Recorded clip with its JSONL ground truth, repeat for more clips (default: synthetic tables)")
+    parser.add_argument("--synthetic", type=int, default=None,
+                        help="Synthetic tables to render, with different seeds (default: 2 without --clip)")
+    parser.add_argument("--frames", type=int, default=150, help="Frames of every synthetic table")
+    parser.add_argument("--width", type=int, default=960)
+    parser.add_argument("--height", type=int, default=540)
+    parser.add_argument("--balls", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes, 0 for one per core")
+    parser.add_argument("--min-fps", type=float, default=0.0, help="Choose the most accurate setting at least this fast")
+    parser.add_argument("--save", help="Write all results to this JSON file")
+    parser.add_argument("--emit", help="Write the chosen setting as a profile to this YAML file")
+    parser.add_argument("--name", default="tuned", help="Name of the emitted profile")
+    args = parser.parse_args()
+
+    config = load_config(args.profile)
+    if config is None:
+        return
+    try:
+        grid = dict(parse_setting(spec) for spec in args.set) or DEFAULT_GRID
+    except ValueError as error:
+        parser.error(str(error))
+
+    clips = []
+    for spec in args.clip:
+        video_path, separator, annotation_path = spec.rpartition(":")
+        if not separator:
+            parser.error(f"Invalid clip '{spec}', expected VIDEO:ANNOTATIONS")
+        clips.append(("recorded", (video_path, annotation_path)))
+    synthetic = args.synthetic if args.synthetic is not None else (0 if clips else 2)
+    for seed in range(synthetic):
+        clips.append(("synthetic", {"width": args.width, "height": args.height, "balls": args.balls, "seed": seed}))
+    if not clips:
+        parser.error("Nothing to sweep over, give --clip or --synthetic")
+
+    results = run_sweep(config, grid, clips, args.frames, args.workers)
+    frontier = pareto_frontier(results)
+    print_results(results, frontier)
+
+    chosen = choose(frontier, args.min_fps)
+    print(f"Chosen: {', '.join(f'{path}={value}' for path, value in chosen['settings'].items())} "
+          f"({chosen['scores']['fps']:.1f} fps, MOTA {chosen['scores']['mota']:.3f})")
+
+    if args.save:
+        with open(args.save, "w") as results_file:
+            json.dump({"grid": grid, "clips": clips, "results": results,
+                       "frontier": [results.index(result) for result in frontier]}, results_file, indent=2)
+    if args.emit:
+        emit_profile(args.emit, args.name, apply_settings(config, chosen["settings"]))
+        print(f"Profile '{args.name}' written to {args.emit}")
+
+
+if __name__ == "__main__":
+    main()
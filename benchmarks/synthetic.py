@@ -0,0 +1,190 @@
+# Procedural pool table frames with ground truth
+
+import cv2 as cv
+import numpy as np
+
+CLOTH_HSV = (60, 60, 120)  # Low saturation so it never falls inside a ball range
+RAIL_HSV = (15, 120, 60)
+OCCLUDER_BGR = (45, 50, 55)  # Dull so the cue is never taken for a ball
+
+
+def make_color_ranges(count):
+    """
+    Build `count` non-overlapping color ranges spread over the hue circle.
+    :param count: Number of colors.
+    :return: Color ranges in the colors.yaml format.
+    """
+    step = 180 // count
+    ranges = {}
+    for i in range(count):
+        ranges[f"color_{i}"] = {
+            "H_lower": i * step, "H_upper": i * step + max(step - 2, 0),
+            "S_lower": 120, "S_upper": 255,
+            "V_lower": 80, "V_upper": 255,
+        }
+    return ranges
+
+
+class SyntheticTable:
+    def __init__(self, width=1920, height=1080, balls=16, colors=None, moving=0.25, speed=12.0,
+                 friction=0.985, noise=4.0, gradient=0.25, occluders=1, seed=0):
+        """
+        Render a pool table seen from above, one frame at a time, with the
+        true position of every ball.
+        :param width: Frame width in pixels.
+        :param height: Frame height in pixels.
+        :param balls: Number of balls on the table.
+        :param colors: Number of distinct ball colors, defaults to one per ball (at most 15).
+        :param moving: Fraction of the balls that start rolling.
+        :param speed: Mean initial speed of a rolling ball in pixels per frame.
+        :param friction: Fraction of the velocity kept from one frame to the next.
+        :param noise: Standard deviation of the per-pixel sensor noise.
+        :param gradient: Strength of the lighting falloff from the table center (0 disables).
+        :param occluders: Number of cue-like bars moving over the table.
+        :param seed: Random seed, the same seed renders the same sequence.
+        """
+        self.width, self.height = width, height
+        self.friction = friction
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+
+        self.color_ranges = make_color_ranges(colors or min(balls, 15))
+        names = list(self.color_ranges)
+        self.colors = [names[i % len(names)] for i in range(balls)]
+
+        # Playing surface inside the rails
+        self.rail = int(0.05 * height)
+        self.radius = max(int(0.028 * height), 4)
+        low = self.rail + self.radius
+        self.low = np.array([low, low], dtype=np.float64)
+        self.high = np.array([width - low, height - low], dtype=np.float64)
+
+        self.positions = self._place_balls(balls)
+        angles = self.rng.uniform(0, 2 * np.pi, balls)
+        speeds = np.where(self.rng.random(balls) < moving, self.rng.exponential(speed, balls), 0.0)
+        self.velocities = np.stack([np.cos(angles), np.sin(angles)], axis=1) * speeds[:, None]
+
+        # Cue-like bars that sweep over the table and hide the balls beneath them
+        self.occluders = []
+        for _ in range(occluders):
+            self.occluders.append({
+                "position": self.rng.uniform(self.low, self.high),
+                "velocity": self.rng.normal(0, 6, 2),
+                "size": (int(0.25 * height), max(int(0.02 * height), 3)),
+            })
+
+        self.background = self._render_background(gradient)
+        self.noise_buffer = np.empty((height, width, 3), np.int16)
+        cv.setRNGSeed(seed)
+        self.frame_index = 0
+
+    def profile(self):
+        """
+        Detector and tracker settings matched to the rendered ball size.
+        :return: Tuple of (color ranges, radius threshold, minimum contour area).
+        """
+        return self.color_ranges, 0.6 * self.radius, 0.3 * np.pi * self.radius ** 2
+
+    def step(self):
+        """
+        Advance the simulation by one frame.
+        :return: Tuple of (BGR frame, ground truth) where the ground truth lists
+                 every ball with its id, position, radius, color and visibility.
+        """
+        if self.frame_index > 0:
+            self._move()
+        self.frame_index += 1
+
+        frame = self.background.copy()
+        for position, color in zip(self.positions, self.colors):
+            self._draw_ball(frame, position, color)
+
+        occluder_masks = []
+        for occluder in self.occluders:
+            corners = cv.boxPoints(((*occluder["position"],), occluder["size"], float(np.degrees(
+                np.arctan2(occluder["velocity"][1], occluder["velocity"][0])))))
+            corners = corners.astype(np.int32)
+            cv.fillConvexPoly(frame, corners, OCCLUDER_BGR)
+            occluder_masks.append(corners)
+
+        if self.noise > 0:
+            cv.randn(self.noise_buffer, 0, self.noise)
+            frame = cv.add(frame, self.noise_buffer, dtype=cv.CV_8U)
+
+        truth = []
+        for i, (position, color) in enumerate(zip(self.positions, self.colors)):
+            hidden = any(cv.pointPolygonTest(corners, (float(position[0]), float(position[1])), False) >= 0
+                         for corners in occluder_masks)
+            truth.append({
+                "id": i,
+                "position": (float(position[0]), float(position[1])),
+                "radius": self.radius,
+                "color": color,
+                "visible": not hidden,
+            })
+
+        return frame, truth
+
+    def _place_balls(self, count, attempts=1000):
+        """
+        Scatter the balls at random without letting them overlap.
+        :return: (count, 2) array of positions.
+        """
+        positions = []
+        for _ in range(attempts):
+            if len(positions) == count:
+                break
+            candidate = self.rng.uniform(self.low, self.high)
+            if all(np.hypot(*(candidate - other)) > 2 * self.radius for other in positions):
+                positions.append(candidate)
+        if len(positions) < count:
+            raise ValueError(f"Cannot fit {count} balls on a {self.width}x{self.height} table")
+        return np.array(positions)
+
+    def _move(self):
+        """
+        Roll the balls and occluders, bouncing off the rails.
+        """
+        self.positions += self.velocities
+        self.velocities *= self.friction
+        for axis in range(2):
+            low, high = self.positions[:, axis] < self.low[axis], self.positions[:, axis] > self.high[axis]
+            self.velocities[low | high, axis] *= -1
+        self.positions = np.clip(self.positions, self.low, self.high)
+
+        for occluder in self.occluders:
+            occluder["position"] = occluder["position"] + occluder["velocity"]
+            for axis in range(2):
+                if not self.low[axis] <= occluder["position"][axis] <= self.high[axis]:
+                    occluder["velocity"][axis] *= -1
+
+    def _draw_ball(self, frame, position, color):
+        """
+        Draw a ball with a specular highlight, at sub-pixel precision.
+        """
+        shift = 4  # Fixed point bits for sub-pixel drawing
+        center = (int(round(position[0] * (1 << shift))), int(round(position[1] * (1 << shift))))
+        color_range = self.color_ranges[color]
+        hue = (color_range["H_lower"] + color_range["H_upper"]) // 2
+        bgr = cv.cvtColor(np.uint8([[[hue, 210, 210]]]), cv.COLOR_HSV2BGR)[0, 0].tolist()
+
+        cv.circle(frame, center, self.radius << shift, bgr, -1, cv.LINE_AA, shift)
+        highlight = (center[0] - (self.radius << shift) // 3, center[1] - (self.radius << shift) // 3)
+        cv.circle(frame, highlight, max(self.radius // 6, 1) << shift, (235, 235, 235), -1, cv.LINE_AA, shift)
+
+    def _render_background(self, gradient):
+        """
+        Cloth and rails with a lighting falloff from the center of the table.
+        """
+        hsv = np.empty((self.height, self.width, 3), np.uint8)
+        hsv[:] = RAIL_HSV
+        hsv[self.rail:self.height - self.rail, self.rail:self.width - self.rail] = CLOTH_HSV
+        background = cv.cvtColor(hsv, cv.COLOR_HSV2BGR)
+
+        if gradient > 0:
+            ys, xs = np.mgrid[0:self.height, 0:self.width].astype(np.float32)
+            distance = np.hypot((xs - self.width / 2) / self.width, (ys - self.height / 2) / self.height)
+            light = 1.0 + gradient * (0.5 - 2 * distance)
+            background = np.clip(background * light[..., None], 0, 255).astype(np.uint8)
+
+        return background
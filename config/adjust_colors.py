@@ -4,10 +4,13 @@ from tkinter import ttk
 import cv2
 import numpy as np
 from PIL import Image, ImageTk
-import threading
-import queue
 import yaml
 import os
+import sys
+
+# Run as a script from the config directory, the frame sources live in src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.frame_source import open_source
 
 # Load profiles from colors.yaml
 def load_profiles():
@@ -52,8 +55,9 @@ load_profiles()
 current_profile = "default"
 selected_color = "red"
 
-# Queue to store frames
-frame_queue = queue.Queue(maxsize=1)
+# Camera index, video file or image directory to calibrate on, camera 0 by default.
+# A thread keeps reading the camera and the feed always shows its newest frame.
+frame_source = open_source(sys.argv[1] if len(sys.argv) > 1 else 0, width=640, height=480)
 
 # Function to save profiles to a YAML file
 def save_to_yaml():
@@ -63,9 +67,11 @@ def save_to_yaml():
     # Construct the full path for colors.yaml
     yaml_path = os.path.join(script_dir, 'colors.yaml')
 
-    # Save the profiles to the YAML file
-    with open(yaml_path, 'w') as yaml_file:
+    # Save the profiles beside the YAML file and rename, so a running tracker never reloads half a file
+    temporary_path = yaml_path + ".tmp"
+    with open(temporary_path, 'w') as yaml_file:
         yaml.dump({"profiles": profiles}, yaml_file)
+    os.replace(temporary_path, yaml_path)
     messagebox.showinfo("Success", f"Profiles saved to {yaml_path}")
 
 
@@ -161,8 +167,9 @@ def update_color_hsv(val, color_index, lower_or_upper):
 
 # Function to update the video feed
 def update_video_feed():
-    if not frame_queue.empty():
-        frame = frame_queue.get()
+    item = frame_source.read(timeout=0)
+    if item is not None:
+        frame = item[2]
 
         # Resize the frame for faster processing
         frame = cv2.resize(frame, (640, 480))
@@ -194,20 +201,6 @@ def update_video_feed():
     masked_label.after(30, update_video_feed)
 
 
-# Video capture in a separate thread
-def capture_video():
-    cap = cv2.VideoCapture(0)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-    while True:
-        ret, frame = cap.read()
-        if ret:
-            if not frame_queue.full():
-                frame_queue.put(frame)
-        else:
-            break
-    cap.release()
-
 # Create the GUI
 root = tk.Tk()
 root.title("HSV Profiles Manager with Webcam")
@@ -261,7 +254,7 @@ tk.Button(root, text="Save to colors.yaml", command=save_to_yaml).pack(pady=10)
 masked_label = tk.Label(root)
 masked_label.pack(pady=10)
 
-# Start video thread and GUI loop
+# Start the video feed and GUI loop
 update_video_feed()
-threading.Thread(target=capture_video, daemon=True).start()
 root.mainloop()
+frame_source.close()
@@ -0,0 +1,113 @@
+# Compiled config cache: parsed YAML files and derived tables kept between runs
+#
+# A parsed file is kept in a __pycache__ directory beside it, and reused while
+# its modification time and size match, or failing that its content hash.
+# Derived tables are kept in config/__pycache__ under a hash of the settings
+# they were built from and the format version of their builder, so they never
+# go stale.
+
+import os
+import json
+import hashlib
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__")
+MAX_TABLES = 8  # Tables kept per kind, the least recently built are removed first
+
+
+def load_yaml(path):
+    """
+    Parse a YAML file, reusing the result of an earlier parse while the file is unchanged.
+    :param path: YAML file.
+    :return: The parsed document.
+    """
+    stat = os.stat(path)
+    cache_path = os.path.join(os.path.dirname(os.path.abspath(path)), "__pycache__", f"{os.path.basename(path)}.json")
+    cached = _read_json(cache_path)
+    if cached is not None and cached.get("mtime_ns") == stat.st_mtime_ns and cached.get("size") == stat.st_size:
+        return cached["data"]
+
+    with open(path, "rb") as yaml_file:
+        content = yaml_file.read()
+    digest = hashlib.sha256(content).hexdigest()
+    if cached is not None and cached.get("sha256") == digest:
+        data = cached["data"]  # Touched but not changed
+    else:
+        import yaml  # Only needed when the cache is cold
+        data = yaml.safe_load(content)
+
+    # Documents JSON cannot hold unchanged, e.g. with dates or numeric keys, are parsed every time
+    try:
+        if json.loads(json.dumps(data)) == data:
+            _write_atomic(cache_path, json.dumps({"mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+                                                  "sha256": digest, "data": data}).encode())
+    except (TypeError, ValueError):
+        pass
+    return data
+
+
+def cached_table(name, settings, build, version=1):
+    """
+    Load a derived table from the cache, building and storing it on a miss.
+    The table is memory mapped read-only, so only the pages used are read.
+    :param name: Kind of table, e.g. "lut".
+    :param settings: JSON serializable settings the table is built from.
+    :param build: Callable building the table as a numpy array.
+    :param version: Format version of the builder, bumped whenever it builds tables differently.
+    :return: The table.
+    """
+    import numpy as np  # Not needed to load the config itself
+
+    key = hashlib.sha256(json.dumps([version, settings]).encode()).hexdigest()[:16]
+    path = os.path.join(CACHE_DIR, f"{name}-{key}.npy")
+    try:
+        return np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        pass
+
+    table = build()
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(temporary, "wb") as table_file:
+            np.save(table_file, table)
+        os.replace(temporary, path)
+        _prune(name)
+    except OSError:
+        pass  # A read-only checkout still works, only slower to start
+    return table
+
+
+def _read_json(path):
+    try:
+        with open(path, "rb") as cache_file:
+            return json.loads(cache_file.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path, content):
+    """
+    Write beside the target and rename, so a concurrent reader never sees half a file.
+    """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporary, "wb") as cache_file:
+            cache_file.write(content)
+        os.replace(temporary, path)
+    except OSError:
+        pass
+
+
+def _prune(name):
+    """
+    Remove all but the MAX_TABLES most recently built tables of a kind.
+    """
+    tables = [os.path.join(CACHE_DIR, entry) for entry in os.listdir(CACHE_DIR)
+              if entry.startswith(f"{name}-") and entry.endswith(".npy")]
+    tables.sort(key=os.path.getmtime, reverse=True)
+    for path in tables[MAX_TABLES:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,5 +1,6 @@
 import os
-import yaml
+from config.cache import load_yaml
+from config.schema import validate_config
 
 def load_config(profile):
     # Get the script's directory
@@ -9,31 +10,153 @@ def load_config(profile):
     # Check if config.yaml exists
     if os.path.exists(yaml_path):
         try:
-            with open(yaml_path, 'r') as yaml_file:
-                data = yaml.safe_load(yaml_file)
-                if "profiles" in data and profile in data["profiles"]:
-                    return data["profiles"][profile]
-                elif "profiles" in data and "default" in data["profiles"]:
-                    return data["profiles"]["default"]
-                else:
-                    print("No profile found, returning default profile.")
-                    return data.get("profiles", {}).get("default", None)
+            # Parsed once, later starts reuse the cached parse until the file changes
+            data = load_yaml(yaml_path)
+            if "profiles" in data and profile in data["profiles"]:
+                config = data["profiles"][profile]
+            elif "profiles" in data and "default" in data["profiles"]:
+                config = data["profiles"]["default"]
+            else:
+                print("No profile found, returning default profile.")
+                return data.get("profiles", {}).get("default", None)
         except Exception as e:
             print(f"Error reading config.yaml: {e}")
+            return None
+
+        # Misspelled or out of range settings are reported here, not deep inside a run
+        try:
+            validate_config(config)
+        except ValueError as e:
+            print(f"Error in config.yaml profile '{profile}': {e}")
+            return None
+        return config
     else:
         print("config.yaml not found, creating a new one.")
         # Create default profiles if the config file doesn't exist
         profiles = {
             "profiles": {
                 "default": {
+                    "capture": {
+                        "prefetch": 0,  # Frames decoded ahead of the tracker, cameras always read ahead by one
+                        "width": 0,  # Requested camera frame size, 0 keeps the camera's default
+                        "height": 0,
+                    },
+                    "chunked": {
+                        "workers": 0,
+                        "chunk_frames": 1800,
+                        "overlap_frames": 120,
+                        "stitch_distance": 2.0,
+                        "opencv_threads": 1,
+                    },
                     "detector": {
                         "profile": "default",
                         "radius": 50,
+                        "method": "lut",
+                        "min_circularity": 0.3,
+                        "return_contours": False,
+                        "show_masks": True,
+                        "downscale": 1,  # Above 1, candidates are found on a smaller frame first
+                        "kernel_size": 7,
+                        "dilate_iterations": 2,
+                        "erode_iterations": 1,
+                        "approx_epsilon": 0.04,
+                        "min_vertices": 6,
+                        "incremental": {
+                            "enabled": False,
+                            "downscale": 4,
+                            "tile_size": 64,
+                            "threshold": 25,
+                            "refresh_frames": 300,
+                        },
+                    },
+                    "governor": {
+                        "enabled": False,
+                        "target_fps": 30.0,
+                        "degrade_above": 1.0,
+                        "restore_below": 0.7,
+                        "smoothing": 0.1,
+                        "cooldown_frames": 30,
+                        "steps": ["show_masks", "trail_length", "detection_interval", "dilate_iterations", "downscale"],
+                        "min_trail_length": 8,
+                        "max_detection_interval": 3,
+                        "min_dilate_iterations": 1,
+                        "max_downscale": 4,
+                    },
+                    "hot_reload": {
+                        "enabled": True,
+                        "poll_interval": 0.5,
+                    },
+                    "metrics": {
+                        "enabled": False,
+                        "path": "metrics.prom",
+                        "port": 0,
+                        "export_interval": 5.0,
+                        "window": 1000,
+                    },
+                    "pipeline": {
+                        "workers": 2,
+                        "queue_size": 4,
+                        "drop_policy": "drop_oldest",
+                        "max_latency_ms": 0,
+                    },
+                    "streaming": {
+                        "host": "127.0.0.1",
+                        "port": 8765,
+                        "queue_size": 8,
+                        "min_move": 1.0,
+                        "handshake_timeout": 0.5,
+                    },
+                    "supervisor": {
+                        "workers": 0,
+                        "cpu_affinity": [],
+                        "opencv_threads": 1,
+                        "ring_slots": 4,
+                        "stats_interval": 5.0,
+                    },
+                    "table": {
+                        "enabled": False,  # Needs the cloth range below to match the table
+                        "cloth": {
+                            "H_lower": 45, "H_upper": 85,
+                            "S_lower": 80, "S_upper": 255,
+                            "V_lower": 40, "V_upper": 255,
+                        },
+                        "margin": 10,
+                        "min_area": 0.2,
+                        "min_coverage": 0.6,
+                        "revalidate_seconds": 5.0,
                     },
                     "tracking": {
                         "buffer_size": 64,
                         "max_distance": 50,
                         "min_area": 1000,
+                        "assignment": "greedy",  # "optimal" matches all tracks and detections at once, e.g. with max_missed_frames 5
+                        "max_missed_frames": 0,  # Frames a track coasts without a detection before it is dropped
+                        "max_tracks": 64,
+                        "log_path": "",
+                        "log_flush_frames": 30,
+                        "motion_model": "linear",  # "kalman" predicts with the filter settings below
+                        "kalman": {
+                            "friction": 0.98,
+                            "process_noise": 1.0,
+                            "measurement_noise": 4.0,
+                        },
+                        "refine_scale": 2.0,
+                        "reid": {
+                            "enabled": False,
+                            "bins": [8, 4],
+                            "gallery_size": 32,
+                            "max_lost_frames": 90,
+                            "min_similarity": 0.8,
+                            "max_distance": 0,
+                            "update_interval": 5,
+                            "blend": 0.2,
+                        },
+                        "detection_interval": {
+                            "min_interval": 1,
+                            "max_interval": 1,  # Above 1, detection is skipped on up to max_interval - 1 frames while balls rest
+                            "rest_speed": 0.5,
+                            "fast_speed": 15.0,
+                        },
                         "circle_outline_color": [0, 255, 255],
                         "circle_thickness": 2,
                         "radius_line_color": [255, 0, 0],
@@ -44,11 +167,15 @@ def load_config(profile):
                         "font_scale": 0.5,
                         "font_thickness": 2,
                         "tracking_line_color": [0, 0, 255],
+                        "trail_length": 64,
+                        "trail_mode": "bands",
+                        "render_interval": 1,
                     },
                 }
             }
         }
         # Write the default profile to the YAML file
+        import yaml
         try:
             with open(yaml_path, 'w') as yaml_file:
                 yaml.dump(profiles, yaml_file)
@@ -0,0 +1,255 @@
+# Schema of the config.yaml profiles and the colors.yaml color ranges
+#
+# A setting is described by a tuple of (kind, ...):
+#   ("int", minimum, maximum)    whole number, None for no bound
+#   ("float", minimum, maximum)  any number
+#   ("bool",)  ("str",)
+#   ("choice", values)           one of the given strings
+#   ("color",)                   BGR triple of 0 - 255
+#   ("list", item)               list of items of the given kind
+# and a dictionary describes a section. Settings the code reads without a
+# default are listed in REQUIRED.
+
+HSV_MAXIMUM = {"H": 179, "S": 255, "V": 255}
+HSV_RANGE = {f"{channel}_{bound}": ("int", 0, maximum)
+             for channel, maximum in HSV_MAXIMUM.items() for bound in ("lower", "upper")}
+GOVERNOR_STEPS = ("show_masks", "trail_length", "detection_interval", "dilate_iterations", "downscale")
+
+SCHEMA = {
+    "capture": {
+        "height": ("int", 0, None),
+        "prefetch": ("int", 0, None),
+        "width": ("int", 0, None),
+    },
+    "chunked": {
+        "chunk_frames": ("int", 1, None),
+        "opencv_threads": ("int", 0, None),
+        "overlap_frames": ("int", 0, None),
+        "stitch_distance": ("float", 0, None),
+        "workers": ("int", 0, None),
+    },
+    "detector": {
+        "approx_epsilon": ("float", 0, None),
+        "dilate_iterations": ("int", 0, None),
+        "downscale": ("int", 1, None),
+        "erode_iterations": ("int", 0, None),
+        "incremental": {
+            "downscale": ("int", 1, None),
+            "enabled": ("bool",),
+            "refresh_frames": ("int", 0, None),
+            "threshold": ("int", 0, 255),
+            "tile_size": ("int", 1, None),
+        },
+        "kernel_size": ("int", 1, None),
+        "method": ("choice", ("lut", "components", "per_color")),
+        "min_circularity": ("float", 0, None),
+        "min_vertices": ("int", 0, None),
+        "profile": ("str",),
+        "radius": ("float", 0, None),
+        "return_contours": ("bool",),
+        "reuse_buffers": ("bool",),
+        "show_masks": ("bool",),
+    },
+    "governor": {
+        "cooldown_frames": ("int", 1, None),
+        "degrade_above": ("float", 0, None),
+        "enabled": ("bool",),
+        "max_detection_interval": ("int", 1, None),
+        "max_downscale": ("int", 1, None),
+        "min_dilate_iterations": ("int", 0, None),
+        "min_trail_length": ("int", 2, None),
+        "restore_below": ("float", 0, None),
+        "smoothing": ("float", 0, 1),
+        "steps": ("list", ("choice", GOVERNOR_STEPS)),
+        "target_fps": ("float", 0, None),
+    },
+    "hot_reload": {
+        "enabled": ("bool",),
+        "poll_interval": ("float", 0, None),
+    },
+    "metrics": {
+        "enabled": ("bool",),
+        "export_interval": ("float", 0, None),
+        "path": ("str",),
+        "port": ("int", 0, 65535),
+        "window": ("int", 1, None),
+    },
+    "pipeline": {
+        "drop_policy": ("choice", ("block", "drop_oldest", "drop_newest")),
+        "max_latency_ms": ("float", 0, None),
+        "queue_size": ("int", 1, None),
+        "workers": ("int", 1, None),
+    },
+    "streaming": {
+        "handshake_timeout": ("float", 0, None),
+        "host": ("str",),
+        "min_move": ("float", 0, None),
+        "port": ("int", 0, 65535),
+        "queue_size": ("int", 1, None),
+    },
+    "supervisor": {
+        "cpu_affinity": ("list", ("list", ("int", 0, None))),  # CPU list per worker
+        "opencv_threads": ("int", 0, None),
+        "ring_slots": ("int", 2, None),
+        "stats_interval": ("float", 0, None),
+        "workers": ("int", 0, None),
+    },
+    "table": {
+        "cloth": HSV_RANGE,
+        "enabled": ("bool",),
+        "margin": ("int", 0, None),
+        "min_area": ("float", 0, 1),
+        "min_coverage": ("float", 0, 1),
+        "revalidate_seconds": ("float", 0, None),
+    },
+    "tracking": {
+        "assignment": ("choice", ("greedy", "optimal")),
+        "buffer_size": ("int", 2, None),
+        "center_point_color": ("color",),
+        "center_point_radius": ("int", 0, None),
+        "circle_outline_color": ("color",),
+        "circle_thickness": ("int", -1, None),
+        "detection_interval": {
+            "fast_speed": ("float", 0, None),
+            "max_interval": ("int", 1, None),
+            "min_interval": ("int", 1, None),
+            "rest_speed": ("float", 0, None),
+        },
+        "font_color": ("color",),
+        "font_scale": ("float", 0, None),
+        "font_thickness": ("int", 1, None),
+        "kalman": {
+            "friction": ("float", 0, 1),
+            "measurement_noise": ("float", 0, None),
+            "process_noise": ("float", 0, None),
+        },
+        "log_flush_frames": ("int", 1, None),
+        "log_path": ("str",),
+        "max_distance": ("float", 0, None),
+        "max_missed_frames": ("int", 0, None),
+        "max_tracks": ("int", 1, None),
+        "min_area": ("float", 0, None),
+        "motion_model": ("choice", ("linear", "kalman")),
+        "radius_line_color": ("color",),
+        "radius_line_thickness": ("int", 1, None),
+        "refine_scale": ("float", 0, None),
+        "reid": {
+            "bins": ("list", ("int", 1, 256)),
+            "blend": ("float", 0, 1),
+            "enabled": ("bool",),
+            "gallery_size": ("int", 1, None),
+            "max_distance": ("float", 0, None),
+            "max_lost_frames": ("int", 0, None),
+            "min_similarity": ("float", 0, 1),
+            "update_interval": ("int", 1, None),
+        },
+        "render_interval": ("int", 1, None),
+        "trail_length": ("int", 0, None),
+        "trail_mode": ("choice", ("bands", "segments")),
+        "tracking_line_color": ("color",),
+    },
+}
+
+REQUIRED = (
+    "detector", "detector.profile", "detector.radius",
+    "tracking", "tracking.buffer_size", "tracking.max_distance", "tracking.min_area",
+    "tracking.center_point_color", "tracking.center_point_radius", "tracking.circle_outline_color",
+    "tracking.circle_thickness", "tracking.font_color", "tracking.font_scale", "tracking.font_thickness",
+    "tracking.radius_line_color", "tracking.radius_line_thickness", "tracking.tracking_line_color",
+)
+
+
+def validate_config(config):
+    """
+    Check a profile against the schema: every setting has the right type and
+    range, no setting is misspelled, and every required setting is present.
+    :param config: Profile configuration.
+    :raises ValueError: Describing the first problem found.
+    """
+    if not isinstance(config, dict):
+        raise ValueError("the profile is not a mapping of settings")
+    # Unknown settings first, a misspelled required setting is reported by its misspelling
+    _check_section(config, SCHEMA, "")
+    for path in REQUIRED:
+        section = config
+        for key in path.split("."):
+            if key not in section:
+                raise ValueError(f"missing setting '{path}'")
+            section = section[key]
+    if config.get("table", {}).get("enabled") and "cloth" not in config["table"]:
+        raise ValueError("table.cloth is needed when table.enabled is set")
+    chunked = config.get("chunked", {})
+    if chunked.get("overlap_frames", 120) >= chunked.get("chunk_frames", 1800):
+        raise ValueError("chunked.overlap_frames must be smaller than chunked.chunk_frames")
+    governor = config.get("governor", {})
+    if governor.get("restore_below", 0.7) >= governor.get("degrade_above", 1.0):
+        raise ValueError("governor.restore_below must be smaller than governor.degrade_above")
+    interval = config.get("tracking", {}).get("detection_interval", {})
+    if interval.get("min_interval", 1) > interval.get("max_interval", 1):
+        raise ValueError("tracking.detection_interval.min_interval must not exceed max_interval")
+    bins = config.get("tracking", {}).get("reid", {}).get("bins", [8, 4])
+    if len(bins) != 2:
+        raise ValueError(f"tracking.reid.bins must list the hue and the saturation bins, got {bins!r}")
+
+
+def validate_color_ranges(color_ranges):
+    """
+    Check that every color has all six HSV limits within range.
+    :param color_ranges: Color ranges of a profile (e.g., from colors.yaml).
+    :raises ValueError: Describing the first problem found.
+    """
+    if not isinstance(color_ranges, dict) or not color_ranges:
+        raise ValueError("the color profile holds no colors")
+    if len(color_ranges) > 255:
+        raise ValueError("a color profile can hold at most 255 colors")
+    for color_name, color_values in color_ranges.items():
+        if not isinstance(color_values, dict):
+            raise ValueError(f"{color_name} is not a mapping of HSV limits")
+        for key, spec in HSV_RANGE.items():
+            if key not in color_values:
+                raise ValueError(f"missing setting '{color_name}.{key}'")
+            _check_value(color_values[key], spec, f"{color_name}.{key}")
+
+
+def _check_section(section, schema, prefix):
+    if not isinstance(section, dict):
+        raise ValueError(f"{prefix.rstrip('.')} must be a section of settings, got {section!r}")
+    for key, value in section.items():
+        path = f"{prefix}{key}"
+        spec = schema.get(key)
+        if spec is None:
+            raise ValueError(f"unknown setting '{path}'")
+        if isinstance(spec, dict):
+            _check_section(value, spec, f"{path}.")
+        else:
+            _check_value(value, spec, path)
+
+
+def _check_value(value, spec, path):
+    kind = spec[0]
+    if kind in ("int", "float"):
+        integer = isinstance(value, int) and not isinstance(value, bool)
+        if not integer and not (kind == "float" and isinstance(value, float)):
+            raise ValueError(f"{path} must be {'an integer' if kind == 'int' else 'a number'}, got {value!r}")
+        minimum, maximum = spec[1], spec[2]
+        if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+            bounds = f"at least {minimum}" if maximum is None else f"from {minimum} to {maximum}"
+            raise ValueError(f"{path} must be {bounds}, got {value!r}")
+    elif kind == "bool":
+        if not isinstance(value, bool):
+            raise ValueError(f"{path} must be true or false, got {value!r}")
+    elif kind == "str":
+        if not isinstance(value, str):
+            raise ValueError(f"{path} must be a string, got {value!r}")
+    elif kind == "choice":
+        if value not in spec[1]:
+            raise ValueError(f"{path} must be one of {', '.join(spec[1])}, got {value!r}")
+    elif kind == "color":
+        if (not isinstance(value, (list, tuple)) or len(value) != 3
+                or not all(isinstance(channel, int) and not isinstance(channel, bool) and 0 <= channel <= 255 for channel in value)):
+            raise ValueError(f"{path} must be a BGR list of three integers from 0 to 255, got {value!r}")
+    elif kind == "list":
+        if not isinstance(value, (list, tuple)):
+            raise ValueError(f"{path} must be a list, got {value!r}")
+        for i, item in enumerate(value):
+            _check_value(item, spec[1], f"{path}[{i}]")
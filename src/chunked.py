@@ -0,0 +1,203 @@
+# Parallel offline processing: a recording split into overlapping chunks, track IDs stitched back together
+
+import os
+import time
+import multiprocessing as mp
+import cv2 as cv
+import numpy as np
+from src.batch import iter_frames, TrackWriter, IMAGE_EXTENSIONS
+from src.detection import BallDetector
+from src.tracking import MultiBallTracker, track_frame
+from src.physics import AdaptiveDetectionInterval
+from src.table_boundary import TableBoundary
+
+
+def count_frames(path):
+    """
+    :param path: Video file or image directory.
+    :return: Number of frames, as reported by the container for videos.
+    """
+    if os.path.isdir(path):
+        return sum(1 for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+
+    capture = cv.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError(f"Cannot open video {path}")
+    count = int(capture.get(cv.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    return count
+
+
+def plan_chunks(frame_count, chunk_frames, overlap_frames):
+    """
+    Split a recording into chunks. Every chunk but the first starts
+    overlap_frames early, the tracks of those frames are only used for stitching.
+    :return: List of (first frame read, first frame output, frame to stop before),
+             the last chunk reads to the end of the recording.
+    """
+    chunks = []
+    for start in range(0, max(frame_count, 1), chunk_frames):
+        stop = start + chunk_frames if start + chunk_frames < frame_count else None
+        chunks.append((max(start - overlap_frames, 0), start, stop))
+    return chunks
+
+
+def init_worker(opencv_threads):
+    """
+    Pool initializer: keep OpenCV from starting a thread per core in every worker.
+    """
+    if opencv_threads:
+        cv.setNumThreads(opencv_threads)
+
+
+def chunk_tracker_config(config):
+    """
+    Tracker settings of a chunk. Greedy assignment tries the tracks in ID
+    order, which a fresh tracker numbers differently from a sequential run,
+    so chunks always use optimal assignment, whose matches do not depend on
+    the order. Chunks keep no track log, the logs would overwrite each other.
+    :param config: Profile configuration.
+    :return: The tracking configuration of the profile with these overrides.
+    """
+    return dict(config.get("tracking", {}), log_path="", assignment="optimal")
+
+
+def process_chunk(input_path, config, fps, chunk, color_ranges=None):
+    """
+    Detect and track one chunk with a fresh detector and tracker.
+    :param input_path: Video file or image directory.
+    :param config: Profile configuration.
+    :param fps: Frame rate used to timestamp image sequences.
+    :param chunk: Tuple of (first frame read, first frame output, frame to stop before).
+    :param color_ranges: Optional color ranges, loaded from colors.yaml when omitted.
+    :return: Tuple of (overlap frames, output frames), each a list of
+             (frame_index, timestamp, tracks) with chunk local track IDs.
+    """
+    first, start, stop = chunk
+    tracker_config = chunk_tracker_config(config)
+    detector = BallDetector(dict(config.get("detector", {}), show_masks=False), color_ranges=color_ranges)
+    tracker = MultiBallTracker(tracker_config)
+    interval = AdaptiveDetectionInterval(**tracker_config.get("detection_interval", {}))
+    table = TableBoundary(config["table"]) if config.get("table", {}).get("enabled") else None
+
+    overlap, frames = [], []
+    for frame_index, timestamp, frame in iter_frames(input_path, fps, reuse_buffer=True, start=first, stop=stop):
+        track_frame(frame, detector, tracker, interval, table, frame_index, timestamp)
+        (overlap if frame_index < start else frames).append((frame_index, timestamp, tracker.get_tracks()))
+
+    return overlap, frames
+
+
+def _process_chunk(task):
+    return process_chunk(*task)
+
+
+class TrackStitcher:
+    def __init__(self, stitch_distance=2.0):
+        """
+        Renumber the tracks of consecutive chunks into one ID sequence. A
+        chunk's tracks take the ID of the track they last coincide with in the
+        overlap, every other track gets the next free ID in order of first
+        appearance, which is the order a single sequential run assigns them in.
+        The IDs match a sequential run with the same tracker settings, see
+        chunk_tracker_config.
+        :param stitch_distance: Largest distance, in pixels, between two positions of the same ball.
+        """
+        self.stitch_distance = stitch_distance
+        self.next_id = 0
+        self.tail = {}  # {frame_index: output tracks} of the previous chunk's last frames
+
+    def stitch(self, overlap, frames, tail_frames):
+        """
+        Renumber the tracks of the next chunk.
+        :param overlap: Overlap frames of the chunk, from process_chunk.
+        :param frames: Output frames of the chunk.
+        :param tail_frames: Number of final frames to keep for the next chunk's overlap.
+        :return: The output frames with global track IDs.
+        """
+        mapping = self._match(overlap)
+
+        stitched = []
+        for frame_index, timestamp, tracks in frames:
+            renumbered = []
+            for track in tracks:
+                if track["id"] not in mapping:
+                    mapping[track["id"]] = self.next_id
+                    self.next_id += 1
+                renumbered.append(dict(track, id=mapping[track["id"]]))
+            # Keep the ID order of MultiBallTracker.get_tracks
+            stitched.append((frame_index, timestamp, sorted(renumbered, key=lambda track: track["id"])))
+
+        self.tail = {frame_index: tracks for frame_index, _, tracks in stitched[-tail_frames:]} if tail_frames else {}
+        return stitched
+
+    def _match(self, overlap):
+        """
+        Find the previous chunk's track that each local track coincides with.
+        The fresh tracker of the chunk is still settling in the first overlap
+        frames, and the previous chunk may have renumbered a ball within the
+        overlap, so the pair seen last wins and the number of frames a pair
+        agrees on only breaks ties.
+        :return: {local ID: global ID}.
+        """
+        votes = {}  # {(local ID, global ID): (last overlap frame seen, frames seen)}
+        for position, (frame_index, _, tracks) in enumerate(overlap):
+            previous = self.tail.get(frame_index)
+            if not previous or not tracks:
+                continue
+            local = np.array([track["position"] for track in tracks], np.float64)
+            known = np.array([track["position"] for track in previous], np.float64)
+            distances = np.linalg.norm(local[:, None, :] - known[None, :, :], axis=2)
+            for row, col in zip(*np.nonzero(distances <= self.stitch_distance)):
+                if tracks[row]["color"] == previous[col]["color"]:
+                    pair = (tracks[row]["id"], previous[col]["id"])
+                    votes[pair] = (position, votes.get(pair, (0, 0))[1] + 1)
+
+        # Most recent, then most agreeing pairs first, every ID used once
+        mapping, taken = {}, set()
+        for (local_id, global_id), _ in sorted(votes.items(), key=lambda item: (-item[1][0], -item[1][1], item[0])):
+            if local_id not in mapping and global_id not in taken:
+                mapping[local_id] = global_id
+                taken.add(global_id)
+        return mapping
+
+
+def run_chunked(input_path, output_path, config, fps=30.0, color_ranges=None):
+    """
+    Detect and track balls over a recording using a process per chunk.
+    :param input_path: Video file or image directory.
+    :param output_path: Track output file (.jsonl or .csv).
+    :param config: Profile configuration (e.g., from load_config).
+    :param fps: Frame rate used to timestamp image sequences.
+    :param color_ranges: Optional color ranges, loaded from colors.yaml when omitted.
+    :return: Tuple of (frames processed, elapsed seconds).
+    """
+    chunked_config = config.get("chunked", {})
+    chunk_frames = chunked_config.get("chunk_frames", 1800)
+    # Frames a fresh tracker needs to settle, should exceed the reid max_lost_frames
+    overlap_frames = chunked_config.get("overlap_frames", 120)
+    if overlap_frames >= chunk_frames:
+        raise ValueError(f"overlap_frames ({overlap_frames}) must be smaller than chunk_frames ({chunk_frames})")
+    workers = chunked_config.get("workers", 0) or os.cpu_count()
+    if config.get("tracking", {}).get("assignment", "greedy") != "optimal":
+        print("Chunked processing tracks with optimal assignment, the profile's greedy assignment is not used.")
+    stitcher = TrackStitcher(chunked_config.get("stitch_distance", 2.0))
+
+    chunks = plan_chunks(count_frames(input_path), chunk_frames, overlap_frames)
+    tasks = [(input_path, config, fps, chunk, color_ranges) for chunk in chunks]
+    writer = TrackWriter(output_path)
+
+    frames = 0
+    start = time.perf_counter()
+    # Spawned workers inherit no OpenCV state, chunks come back in order as they finish
+    context = mp.get_context("spawn")
+    with context.Pool(min(workers, len(chunks)), init_worker, (chunked_config.get("opencv_threads", 1),)) as pool:
+        try:
+            for overlap, chunk_output in pool.imap(_process_chunk, tasks):
+                for frame_index, timestamp, tracks in stitcher.stitch(overlap, chunk_output, overlap_frames):
+                    writer.write(frame_index, timestamp, tracks)
+                    frames += 1
+        finally:
+            writer.close()
+
+    return frames, time.perf_counter() - start
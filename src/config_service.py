@@ -0,0 +1,151 @@
+# Hot reloading of config.yaml and colors.yaml into running detectors and trackers
+
+import os
+import threading
+from src.detection import BallDetector, load_color_ranges
+from src.tracking import MultiBallTracker
+from src.physics import AdaptiveDetectionInterval
+from src.metrics import DISABLED
+from config.cache import load_yaml
+from config.schema import validate_config
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config")
+LIVE_SECTIONS = ("detector", "tracking")  # Sections applied without a restart, and governor when one runs
+
+
+class ConfigService:
+    def __init__(self, profile, poll_interval=0.5, config_path=None, colors_path=None, metrics=None, config=None):
+        """
+        Watch the profile and color files. A change is loaded, validated and
+        compiled on a background thread, then handed to every watched detector,
+        tracker and detection interval, which swap it in between two frames.
+        Tracks are kept, and a file that fails validation leaves the running
+        settings untouched. Changes to the other sections are reported as
+        needing a restart.
+        :param profile: Name of the profile in config.yaml.
+        :param poll_interval: Seconds between checks of the file modification times.
+        :param config_path: Profile file, defaults to config/config.yaml.
+        :param colors_path: Color range file, defaults to config/colors.yaml.
+        :param metrics: Optional Metrics counting the reloads.
+        :param config: Profile configuration the running settings came from, changes are reported against it.
+        """
+        self.profile = profile
+        self.poll_interval = poll_interval
+        self.config_path = config_path or os.path.join(CONFIG_DIR, "config.yaml")
+        self.colors_path = colors_path or os.path.join(CONFIG_DIR, "colors.yaml")
+        self.metrics = metrics if metrics is not None else DISABLED
+
+        self.config = config
+        self.detectors = []
+        self.trackers = []
+        self.intervals = []
+        self.governors = []
+        self.signatures = self._signatures()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def watch(self, detectors=(), trackers=(), intervals=(), governors=()):
+        """
+        Register the detectors, trackers, AdaptiveDetectionIntervals and
+        QualityGovernors that receive new settings.
+        """
+        self.detectors.extend(detectors)
+        self.trackers.extend(trackers)
+        self.intervals.extend(intervals)
+        self.governors.extend(governors)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._poll_loop, name="config", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def check(self):
+        """
+        Reload if either file changed since the last check.
+        :return: True if new settings were handed out.
+        """
+        signatures = self._signatures()
+        if signatures == self.signatures:
+            return False
+        self.signatures = signatures
+        return self.reload()
+
+    def reload(self):
+        """
+        Load, validate and compile both files, then hand the result out.
+        :return: True if the new settings were valid.
+        """
+        try:
+            profiles = (load_yaml(self.config_path) or {}).get("profiles", {})
+            # Same fallback as load_config
+            config = profiles.get(self.profile, profiles.get("default"))
+            if config is None:
+                raise ValueError(f"profile '{self.profile}' not found in {self.config_path}")
+            validate_config(config)
+
+            detector_config = config["detector"]
+            color_ranges = load_color_ranges(self.colors_path, detector_config["profile"])  # Validated on load
+
+            # The expensive part, e.g. the label table, is built here and not on the frame loop
+            compiled_detector = BallDetector.compile(detector_config, color_ranges)
+            compiled_trackers = [MultiBallTracker.compile(config["tracking"], tracker.buffer_size)
+                                 for tracker in self.trackers]
+            compiled_interval = AdaptiveDetectionInterval.compile(config["tracking"].get("detection_interval", {}))
+        except Exception as e:
+            print(f"Config reload rejected, keeping the running settings: {e}")
+            self.metrics.increment("config_reloads_total", result="rejected")
+            return False
+
+        # Settings a detector works with during a frame, e.g. debug windows, are kept per detector
+        for detector in self.detectors:
+            detector.reconfigure(dict(compiled_detector, show_masks=detector.settings["show_masks"]))
+        for tracker, compiled in zip(self.trackers, compiled_trackers):
+            tracker.reconfigure(compiled)
+        for interval in self.intervals:
+            interval.reconfigure(compiled_interval)
+        # A governor takes the reloaded values as the settings it trades from, instead of restoring the old ones
+        compiled_by_tracker = {id(tracker): compiled for tracker, compiled in zip(self.trackers, compiled_trackers)}
+        for governor in self.governors:
+            compiled_tracker = compiled_by_tracker.get(id(governor.tracker))
+            if compiled_tracker is None:
+                compiled_tracker = MultiBallTracker.compile(config["tracking"], governor.tracker.buffer_size)
+            governor.reconfigure(config.get("governor", {}), compiled_detector, compiled_tracker, compiled_interval)
+
+        print(f"Config reloaded from {self.config_path} and {self.colors_path}.")
+        self._report_restart(config)
+        self.metrics.increment("config_reloads_total", result="applied")
+        return True
+
+    def _report_restart(self, config):
+        """
+        Print the sections that changed but only take effect after a restart, e.g. table.
+        """
+        live = LIVE_SECTIONS + (("governor",) if self.governors else ())
+        if self.config is not None:
+            for section in sorted(set(self.config) | set(config)):
+                if section not in live and self.config.get(section) != config.get(section):
+                    print(f"Config reload: the {section} settings changed, restart to apply them.")
+        self.config = config
+
+    def _poll_loop(self):
+        while not self.stop_event.wait(self.poll_interval):
+            self.check()
+
+    def _signatures(self):
+        """
+        :return: (modification time, size) of both files, None for a missing file.
+        """
+        signatures = []
+        for path in (self.config_path, self.colors_path):
+            try:
+                stat = os.stat(path)
+                signatures.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signatures.append(None)
+        return signatures
+
@@ -1,20 +1,128 @@
 # Ball detection logic
-import imutils
 import cv2 as cv
-import yaml
+import threading
 import numpy as np
-from src.util import get_limits
+from src.util import get_limits, build_label_lut, LUT_FORMAT, merge_rects, grab_contours
+from src.motion_gate import MotionGate
+from src.metrics import DISABLED
+from config.cache import load_yaml, cached_table
+from config.schema import validate_color_ranges
+
+MAX_FILL = 1.1  # A component filling more of its enclosing circle is square, not round (a square fills 4 / pi)
 
 class BallDetector:
-    def __init__(self, config):
+    def __init__(self, config, color_ranges=None, metrics=None):
         """
         Init ball detector with HSV color ranges
         :param config: The configuration dictionary (e.g., from load_config)
+        :param color_ranges: Optional color ranges, loaded from colors.yaml when omitted
+        :param metrics: Optional Metrics receiving per-step and per-color timings
+        """
+        self.metrics = metrics if metrics is not None else DISABLED
+        if color_ranges is None:
+            color_ranges = load_color_ranges(filepath="config/colors.yaml", profile=config["profile"])
+
+        # Frame-sized buffers reused across frames instead of reallocated on every call
+        self.reuse_buffers = config.get("reuse_buffers", True)
+        self.buffers = {}
+        self.roi = None  # Optional (rect, mask) limiting detection to the table
+        self.cached_balls = []
+        self.motion_gate = None
+        self.pending = None  # Settings from reconfigure() and adjust(), swapped in before the next frame
+        self.pending_lock = threading.Lock()
+        self.settings = {}  # Compiled settings in use
+        self.overrides = {}  # Settings from adjust(), kept on top of the compiled ones
+
+        self._apply(self.compile(config, color_ranges))
+
+    @staticmethod
+    def compile(config, color_ranges):
+        """
+        Build everything the detector derives from its settings, e.g. the
+        label table, without touching a running detector.
+        :param config: The detector configuration dictionary.
+        :param color_ranges: Color ranges of the profile.
+        :return: Dictionary of detector attributes, for reconfigure().
+        """
+        compiled = {
+            "config": config,
+            "profile": config["profile"],
+            "radius": config["radius"],
+            "method": config.get("method", "lut"),  # "lut", "components" or "per_color"
+            "min_circularity": config.get("min_circularity", 0.3),  # Smallest fill of the enclosing circle, components only
+            "return_contours": config.get("return_contours", False),  # Trace contours in the components backend
+            "show_masks": config.get("show_masks", True),  # Debug windows for the color masks
+            "color_ranges": color_ranges,
+            # Compile the profile into a single HSV -> label table
+            "color_names": list(color_ranges.keys()),
+            "label_lut": cached_table("lut", list(color_ranges.items()), lambda: build_label_lut(color_ranges), LUT_FORMAT),
+            "limits": [(color_name, *get_limits(color_values)) for color_name, color_values in color_ranges.items()],
+            "kernel": np.ones((config.get("kernel_size", 7),) * 2, np.uint8),  # Structuring element of the mask cleaning
+            "dilate_iterations": config.get("dilate_iterations", 2),  # Dilations closing gaps in a mask
+            "erode_iterations": config.get("erode_iterations", 1),  # Erosions removing noise after the dilations
+            "approx_epsilon": config.get("approx_epsilon", 0.04),  # Outline simplification, as a fraction of the perimeter
+            "min_vertices": config.get("min_vertices", 6),  # Corners a simplified outline needs to count as round
+            # Coarse-to-fine mode finds candidates on a frame this many times smaller
+            "downscale": config.get("downscale", 1),
+        }
+        return compiled
+
+    def reconfigure(self, compiled):
         """
-        self.config = config
-        self.profile = self.config["profile"]  # Access profile
-        self.radius = self.config["radius"]  # Access radius
-        self.color_ranges = self._load_color_ranges(filepath="config/colors.yaml", profile=self.profile)
+        Hand the detector new settings from compile(). They are swapped in by
+        the thread running the detector, before it starts on its next frame.
+        :param compiled: Result of BallDetector.compile().
+        """
+        with self.pending_lock:
+            self.pending = dict(self.pending or {}, **compiled)
+
+    def adjust(self, overrides):
+        """
+        Override some compiled settings, e.g. from the QualityGovernor. The
+        overrides are swapped in like reconfigure() and outlast later reconfigures.
+        :param overrides: Dictionary of settings, e.g. {"downscale": 3}, empty to drop all overrides.
+        """
+        with self.pending_lock:
+            self.pending = dict(self.pending or {}, overrides=dict(overrides))
+
+    def _apply(self, compiled):
+        """
+        Swap in compiled settings and overrides.
+        """
+        compiled = dict(compiled)
+        self.overrides = compiled.pop("overrides", self.overrides)
+        self.settings.update(compiled)
+        for name, value in dict(self.settings, **self.overrides).items():
+            setattr(self, name, value)
+        coarse_size = max(int(round(self.kernel.shape[0] / self.downscale)), 1)
+        self.coarse_kernel = np.ones((coarse_size, coarse_size), np.uint8)
+        # Blobs are grouped and padded by at least as far as the cleaning dilations reach
+        self.reach_iterations = max(self.dilate_iterations, 2)
+
+        # Incremental mode only re-detects regions that changed since the last frame
+        incremental_config = self.config.get("incremental", {})
+        if not incremental_config.get("enabled"):
+            self.motion_gate = None
+        elif self.motion_gate is None or self.motion_gate.config != incremental_config:
+            self.motion_gate = MotionGate(incremental_config)
+        else:
+            self.motion_gate.reset()  # Colors or sizes may have changed, detect everything again
+
+    def _apply_pending(self):
+        with self.pending_lock:
+            compiled, self.pending = self.pending, None
+        if compiled is not None:
+            self._apply(compiled)
+
+    def set_roi(self, roi):
+        """
+        Limit detection to a region of interest, e.g. from TableBoundary.
+        :param roi: Tuple of (rect, mask) with rect as (x0, y0, x1, y1) and a
+                    mask of the rect's size, or None to use the whole frame.
+        """
+        self.roi = roi  # Swapped as a single attribute so worker threads never see half an ROI
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
 
     def detect(self, frame):
         """
@@ -22,83 +130,509 @@ class BallDetector:
         :param frame: Input image frame.
         :return: List of detected balls with positions, colors, radius, and contours.
         """
-        hsv_frame = self._process_frame(frame)
+        if self.pending is not None:
+            self._apply_pending()
+        metrics = self.metrics
+        start = metrics.now()
+        if self.motion_gate is None:
+            detected_balls = self._detect_full(frame)
+            metrics.observe("detect_seconds", start, mode="full")
+            return detected_balls
+
+        regions = self.motion_gate.changed_regions(frame, self.cached_balls)
+        metrics.observe("detect_step_seconds", start, step="motion_gate")
+        if regions is None:
+            self.cached_balls = self._detect_full(frame)
+            metrics.observe("detect_seconds", start, mode="full")
+            return self.cached_balls
+
+        # Balls in unchanged regions are reused, the changed regions are detected again
+        def in_regions(ball):
+            x, y = ball["position"]
+            return any(x0 <= x < x1 and y0 <= y < y1 for x0, y0, x1, y1 in regions)
+
+        kept = [ball for ball in self.cached_balls if not in_regions(ball)]
+        self.cached_balls = kept + self.detect_regions(frame, regions)
+        metrics.increment("detect_regions_total", len(regions))
+        metrics.observe("detect_seconds", start, mode="incremental")
+
+        return self.cached_balls
+
+    def _detect_full(self, frame):
+        """
+        Detect balls in the whole frame, or the whole ROI if one is set.
+        :param frame: Input image frame.
+        :return: List of detected balls.
+        """
+        roi = self.roi
+        offset, roi_mask = (0, 0), None
+        if roi is not None:
+            # Convert and threshold only the table, outside pixels never reach the masks
+            (x0, y0, x1, y1), roi_mask = roi
+            frame = frame[y0:y1, x0:x1]
+            offset = (x0, y0)
+
+        if self.downscale > 1 and self.method != "per_color":
+            return self._detect_coarse_to_fine(frame, offset, roi_mask)
+
+        hsv_frame = self._process_frame(frame, dst=self._buffer("hsv", frame.shape))
+
+        if self.method == "per_color":
+            return self._detect_per_color(hsv_frame, offset, roi_mask)
+
+        detected_balls, foreground = self._detect_labels(hsv_frame, offset, roi_mask, buffered=True)
+        if self.show_masks:
+            cv.imshow("Ball Mask", foreground)  # Show the combined color mask for debugging
+
+        return detected_balls
+
+    def _detect_coarse_to_fine(self, frame, offset, roi_mask):
+        """
+        Find candidate balls on a downscaled frame, then measure each one in a
+        small full resolution window so centers and radii keep their accuracy.
+        :param frame: Input image frame, already cropped to the ROI.
+        :param offset: Position of the crop in the full frame.
+        :param roi_mask: Optional mask of the pixels to consider.
+        :return: List of detected balls in full frame coordinates.
+        """
+        scale = self.downscale
+        height, width = frame.shape[:2]
+        size = (max(width // scale, 1), max(height // scale, 1))
+
+        small = cv.resize(frame, size, dst=self._buffer("small", (size[1], size[0], 3)), interpolation=cv.INTER_LINEAR)
+        small_mask = None
+        if roi_mask is not None:
+            small_mask = cv.resize(roi_mask, size, dst=self._buffer("small_mask", (size[1], size[0])),
+                                   interpolation=cv.INTER_NEAREST)
+        hsv_small = self._process_frame(small, dst=self._buffer("hsv", small.shape))
+        candidates, foreground = self._detect_labels(hsv_small, roi_mask=small_mask, coarse=True, buffered=True)
+        if self.show_masks:
+            cv.imshow("Ball Mask", foreground)  # Show the coarse color mask for debugging
+
+        # Window around each candidate, large enough for the full resolution mask cleaning
+        frame_height, frame_width = height + offset[1], width + offset[0]
+        margin = scale + self.kernel.shape[0] * self.reach_iterations // 2
+        windows = []
+        for ball in candidates:
+            x = offset[0] + (ball["position"][0] + 0.5) * scale
+            y = offset[1] + (ball["position"][1] + 0.5) * scale
+            half = int(ball["radius"] * scale * 1.25) + margin
+            windows.append((max(int(x) - half, offset[0]), max(int(y) - half, offset[1]),
+                            min(int(x) + half, frame_width), min(int(y) + half, frame_height)))
+
+        return self._detect_windows(frame, offset, roi_mask, merge_rects(windows))
+
+    def _detect_windows(self, frame, offset, roi_mask, windows):
+        """
+        Detect balls at full resolution inside windows of a (cropped) frame.
+        :param frame: Input image frame, cropped to the ROI.
+        :param offset: Position of the crop in the full frame.
+        :param roi_mask: Optional mask of the crop.
+        :param windows: Non-overlapping (x0, y0, x1, y1) windows in full frame coordinates.
+        :return: List of detected balls in full frame coordinates.
+        """
+        detected_balls = []
+        for x0, y0, x1, y1 in windows:
+            local = (slice(y0 - offset[1], y1 - offset[1]), slice(x0 - offset[0], x1 - offset[0]))
+            window_mask = None if roi_mask is None else roi_mask[local]
+            balls, _ = self._detect_labels(self._process_frame(frame[local]), (x0, y0), window_mask)
+            detected_balls.extend(balls)
+
+        return detected_balls
+
+    def refine(self, frame, predictions, scale=2.0):
+        """
+        Detect balls only in small windows around predicted positions.
+        Overlapping windows are merged so a ball is never detected twice.
+        :param frame: Input image frame.
+        :param predictions: List of (position, radius) where balls are expected.
+        :param scale: Half the window size as a multiple of the ball radius.
+        :return: List of detected balls in frame coordinates.
+        """
+        if self.pending is not None:
+            self._apply_pending()
+        height, width = frame.shape[:2]
+        windows = []
+        for (x, y), radius in predictions:
+            half = int(max(radius, self.radius) * scale)
+            windows.append((max(int(x) - half, 0), max(int(y) - half, 0),
+                            min(int(x) + half, width), min(int(y) + half, height)))
+
+        return self.detect_regions(frame, merge_rects(windows))
+
+    def detect_regions(self, frame, regions):
+        """
+        Detect balls only inside the given regions of a frame.
+        :param frame: Input image frame.
+        :param regions: List of non-overlapping (x0, y0, x1, y1) rectangles.
+        :return: List of detected balls in frame coordinates.
+        """
+        roi = self.roi
         detected_balls = []
+        for x0, y0, x1, y1 in regions:
+            roi_mask = None
+            if roi is not None:
+                # Clip the region to the table and take the matching part of its mask
+                (rx0, ry0, rx1, ry1), mask = roi
+                x0, y0, x1, y1 = max(x0, rx0), max(y0, ry0), min(x1, rx1), min(y1, ry1)
+                roi_mask = mask[y0 - ry0:y1 - ry0, x0 - rx0:x1 - rx0]
 
-        # Iterate over color ranges loaded from config file
-        for color_name, color_values in self.color_ranges.items():
-            # Get lower and upper limits from base color
-            lower, upper = get_limits(color_values)
+            if x1 <= x0 or y1 <= y0:
+                continue  # Region is outside the frame or the table
 
+            hsv_window = self._process_frame(frame[y0:y1, x0:x1])
+            balls, _ = self._detect_labels(hsv_window, (x0, y0), roi_mask)
+            detected_balls.extend(balls)
+
+        return detected_balls
+
+    def _detect_labels(self, hsv_frame, offset=(0, 0), roi_mask=None, coarse=False, buffered=False):
+        """
+        Detect balls in a label image with the configured backend, see _detect_lut.
+        """
+        if self.method == "components":
+            return self._detect_components(hsv_frame, offset, roi_mask, coarse, buffered)
+        return self._detect_lut(hsv_frame, offset, roi_mask, coarse, buffered)
+
+    def _detect_lut(self, hsv_frame, offset=(0, 0), roi_mask=None, coarse=False, buffered=False):
+        """
+        Detect balls by classifying every pixel in a single lookup table pass.
+        Only the blobs found in the label image are cleaned and contoured, so
+        the cost no longer grows with the number of colors in the profile.
+        :param hsv_frame: Frame (or window of a frame) in HSV color space.
+        :param offset: Position of the window in the frame, added to all coordinates.
+        :param roi_mask: Optional mask of the pixels to consider.
+        :param coarse: The frame is downscaled, scale the kernel and radius threshold to match.
+        :param buffered: Write the frame-sized intermediates into the reusable buffers.
+        :return: Tuple of (detected balls ordered by profile color, foreground mask).
+        """
+        kernel = self.coarse_kernel if coarse else self.kernel
+        # Candidates are kept a little below the threshold and regardless of shape,
+        # the full resolution pass applies both checks exactly
+        min_radius = 0.8 * self.radius / self.downscale if coarse else self.radius
+
+        shape = hsv_frame.shape[:2]
+        buffer = self._buffer if buffered else (lambda name, shape: None)
+
+        metrics = self.metrics
+        start = metrics.now()
+        labels = self._classify(hsv_frame, buffered)
+        if roi_mask is not None:
+            labels = cv.bitwise_and(labels, roi_mask, dst=labels)
+        balls_by_label = [[] for _ in self.color_names]
+        metrics.observe("detect_step_seconds", start, step="classify")
+
+        # Group pixels into blobs that are separated by more than the cleaning reach
+        start = metrics.now()
+        foreground = cv.compare(labels, 0, cv.CMP_GT, dst=buffer("foreground", shape))
+        reach = cv.dilate(foreground, kernel, dst=buffer("reach", shape), iterations=self.reach_iterations)
+        blobs = grab_contours(cv.findContours(reach, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE))
+        metrics.observe("detect_step_seconds", start, step="blobs")
+
+        height, width = labels.shape
+        pad = kernel.shape[0] * self.reach_iterations // 2
+        for blob in blobs:
+            x, y, w, h = cv.boundingRect(blob)
+            x0, y0 = max(x - pad, 0), max(y - pad, 0)
+            x1, y1 = min(x + w + pad, width), min(y + h + pad, height)
+
+            # Restrict the labels to this blob so neighbouring blobs are not detected twice
+            in_blob = np.zeros((y1 - y0, x1 - x0), np.uint8)
+            cv.drawContours(in_blob, [blob], -1, 255, cv.FILLED, offset=(-x0, -y0))
+            region = cv.bitwise_and(labels[y0:y1, x0:x1], in_blob)
+
+            for label in np.unique(region):
+                if label == 0:
+                    continue
+
+                # Clean the mask of a single color within the blob
+                color_name = self.color_names[label - 1]
+                color_start = start = metrics.now()
+                mask = cv.compare(region, int(label), cv.CMP_EQ)
+                mask = self._clean_mask(mask, kernel)
+                metrics.observe("detect_step_seconds", start, step="morphology")
+
+                start = metrics.now()
+                contours = cv.findContours(mask, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE,
+                                           offset=(int(x0) + offset[0], int(y0) + offset[1]))
+                contours = grab_contours(contours)
+                metrics.observe("detect_step_seconds", start, step="contours")
+
+                balls_by_label[label - 1].extend(
+                    self._filter_contours(contours, color_name, min_radius, check_shape=not coarse))
+                metrics.observe("detect_color_seconds", color_start, color=color_name)
+
+        return [ball for balls in balls_by_label for ball in balls], foreground
+
+    def _detect_components(self, hsv_frame, offset=(0, 0), roi_mask=None, coarse=False, buffered=False):
+        """
+        Detect balls with connected components instead of contours. One native
+        call measures the area, bounding box and centroid of every component,
+        the size and shape checks run on those arrays, and no contour is
+        traced unless the records are configured to carry one.
+        :param hsv_frame: Frame (or window) in HSV color space.
+        :param offset: Position of the window in the frame, added to all coordinates.
+        :param roi_mask: Optional mask of the pixels to consider.
+        :param coarse: The frame is downscaled, scale the kernel and radius threshold to match.
+        :param buffered: Write the frame-sized intermediates into the reusable buffers.
+        :return: Tuple of (detected balls ordered by profile color, foreground mask).
+        """
+        kernel = self.coarse_kernel if coarse else self.kernel
+        min_radius = 0.8 * self.radius / self.downscale if coarse else self.radius
+        label_count = len(self.color_names) + 1
+
+        shape = hsv_frame.shape[:2]
+        buffer = self._buffer if buffered else (lambda name, shape: None)
+
+        metrics = self.metrics
+        start = metrics.now()
+        labels = self._classify(hsv_frame, buffered)
+        if roi_mask is not None:
+            labels = cv.bitwise_and(labels, roi_mask, dst=labels)
+        balls_by_label = [[] for _ in self.color_names]
+        metrics.observe("detect_step_seconds", start, step="classify")
+
+        # Group pixels into blobs that are separated by more than the cleaning reach.
+        # Tracing the outlines of a sparse mask is far cheaper than labelling all of its pixels.
+        start = metrics.now()
+        foreground = cv.compare(labels, 0, cv.CMP_GT, dst=buffer("foreground", shape))
+        reach = cv.dilate(foreground, kernel, dst=buffer("reach", shape), iterations=self.reach_iterations)
+        blobs = grab_contours(cv.findContours(reach, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE))
+        rects = np.array([cv.boundingRect(blob) for blob in blobs], np.int64).reshape(-1, 4)
+        # Blobs too small to hold a ball, even before cleaning shrinks them, are never looked at
+        large = np.flatnonzero(np.maximum(rects[:, 2], rects[:, 3]) / 2.0 > min_radius)
+        metrics.observe("detect_step_seconds", start, step="blobs")
+
+        for blob in large.tolist():
+            x0, y0, w, h = rects[blob].tolist()
+            x1, y1 = x0 + w, y0 + h
+
+            # Restrict the labels to this blob so neighbouring blobs are not detected twice
+            in_blob = np.zeros((h, w), np.uint8)
+            cv.drawContours(in_blob, blobs, blob, 255, cv.FILLED, offset=(-x0, -y0))
+            region = cv.bitwise_and(labels[y0:y1, x0:x1], in_blob)
+            counts = cv.calcHist([region], [0], None, [label_count], [0, label_count]).ravel()
+
+            for label in (np.flatnonzero(counts[1:]) + 1).tolist():
+                # Clean the mask of a single color within the blob
+                color_name = self.color_names[label - 1]
+                color_start = start = metrics.now()
+                mask = self._clean_mask(cv.compare(region, label, cv.CMP_EQ), kernel)
+                metrics.observe("detect_step_seconds", start, step="morphology")
+
+                start = metrics.now()
+                # Grana's block based labelling, several times faster than the default on one thread
+                count, components, stats, centroids = cv.connectedComponentsWithStatsWithAlgorithm(
+                    mask, 8, cv.CV_32S, cv.CCL_GRANA)
+                metrics.observe("detect_step_seconds", start, step="contours")
+
+                # Component 0 is the background
+                start = metrics.now()
+                areas = stats[1:, cv.CC_STAT_AREA]
+                radii = np.maximum(stats[1:, cv.CC_STAT_WIDTH], stats[1:, cv.CC_STAT_HEIGHT]) / 2.0
+                keep = radii > min_radius
+                if not coarse:
+                    # A disc fills about all of the circle around its bounding box, a streak far less
+                    fill = areas / (np.pi * radii ** 2)
+                    keep &= (fill >= self.min_circularity) & (fill <= MAX_FILL)
+
+                for index in (np.flatnonzero(keep) + 1).tolist():
+                    x, y = centroids[index]
+                    ball = {
+                        "position": (int(x) + x0 + offset[0], int(y) + y0 + offset[1]),
+                        "radius": int(radii[index - 1]),
+                        "color": color_name,
+                        "area": int(areas[index - 1]),
+                    }
+                    if self.return_contours:
+                        ball["contour"] = self._component_contour(components, stats[index], index,
+                                                                  (x0 + offset[0], y0 + offset[1]))
+                    balls_by_label[label - 1].append(ball)
+                metrics.observe("detect_step_seconds", start, step="filter")
+                metrics.observe("detect_color_seconds", color_start, color=color_name)
+                metrics.increment("contours_found_total", count - 1, color=color_name)
+                metrics.increment("contours_rejected_total", count - 1 - int(np.count_nonzero(keep)), color=color_name)
+
+        return [ball for balls in balls_by_label for ball in balls], foreground
+
+    def _component_contour(self, components, stats, component, offset):
+        """
+        Trace the outline of one connected component.
+        :return: Contour in frame coordinates.
+        """
+        x, y, w, h = stats[:4]
+        mask = cv.compare(components[y:y + h, x:x + w], int(component), cv.CMP_EQ)
+        contours = grab_contours(cv.findContours(mask, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE,
+                                                         offset=(int(x) + offset[0], int(y) + offset[1])))
+        return max(contours, key=cv.contourArea)
+
+    def _detect_per_color(self, hsv_frame, offset=(0, 0), roi_mask=None):
+        """
+        Detect balls by thresholding the whole frame once per color.
+        :param hsv_frame: Frame in HSV color space.
+        :param offset: Position of the frame crop, added to all coordinates.
+        :param roi_mask: Optional mask of the pixels to consider.
+        :return: List of detected balls, ordered by profile color.
+        """
+        detected_balls = []
+        shape = hsv_frame.shape[:2]
+
+        # Iterate over the color limits precomputed from the config file
+        metrics = self.metrics
+        for color_name, lower, upper in self.limits:
             # Create a binary mask for the color range
-            mask = cv.inRange(hsv_frame, lower, upper)
+            color_start = start = metrics.now()
+            mask = cv.inRange(hsv_frame, lower, upper, dst=self._buffer("mask", shape))
+            if roi_mask is not None:
+                mask = cv.bitwise_and(mask, roi_mask, dst=mask)
+            metrics.observe("detect_step_seconds", start, step="classify")
 
             # Clean the mask using morphological operations
-            mask = self._clean_mask(mask)
+            start = metrics.now()
+            mask = self._clean_mask(mask, scratch=self._buffer("scratch", shape))
+            metrics.observe("detect_step_seconds", start, step="morphology")
 
-            # Find contours in the mask
-            contours = cv.findContours(mask.copy(), cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
-            contours = imutils.grab_contours(contours)
+            # Find contours in the mask, findContours leaves its input untouched
+            start = metrics.now()
+            contours = cv.findContours(mask, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE, offset=offset)
+            contours = grab_contours(contours)
+            metrics.observe("detect_step_seconds", start, step="contours")
 
             # Filter contours by area and process them
-            for contour in contours:
+            detected_balls.extend(self._filter_contours(contours, color_name))
+            metrics.observe("detect_color_seconds", color_start, color=color_name)
+
+            if self.show_masks:
+                cv.imshow(f"{color_name} Mask", mask)  # Show the color mask for debugging
+
+        return detected_balls
+
+    def _filter_contours(self, contours, color_name, min_radius=None, check_shape=True):
+        """
+        Keep the contours that look like balls of at least the configured radius.
+        :param contours: Contours found in a color mask.
+        :param color_name: Name of the color the mask was built from.
+        :param min_radius: Radius threshold, defaults to the configured radius.
+        :param check_shape: Require the contour to be approximately a circle.
+        :return: List of detected balls.
+        """
+        if min_radius is None:
+            min_radius = self.radius
+
+        start = self.metrics.now()
+        detected_balls = []
+        for contour in contours:
+            if check_shape:
                 perimeter = cv.arcLength(contour, True)
-                approx = cv.approxPolyDP(contour, 0.04 * perimeter, True)
-                if len(approx) > 5:  # Check if the contour is approximately a circle
-                    ((x, y), radius) = cv.minEnclosingCircle(contour)
-                    M = cv.moments(contour)
-
-                    if M["m00"] > 0 and radius > self.radius:  # Use the radius from config
-                        center = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
-                        detected_balls.append({
-                            "position": center,
-                            "radius": int(radius),
-                            "color": color_name,
-                            "contour": contour  # Include the contour in the output
-                        })
-            
-            cv.imshow(f"{color_name} Mask", mask)  # Show the color mask for debugging
+                approx = cv.approxPolyDP(contour, self.approx_epsilon * perimeter, True)
+            if not check_shape or len(approx) >= self.min_vertices:  # Check if the contour is approximately a circle
+                ((x, y), radius) = cv.minEnclosingCircle(contour)
+                M = cv.moments(contour)
 
+                if M["m00"] > 0 and radius > min_radius:  # Use the radius from config
+                    center = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
+                    detected_balls.append({
+                        "position": center,
+                        "radius": int(radius),
+                        "color": color_name,
+                        "area": M["m00"],
+                        "contour": contour  # Include the contour in the output
+                    })
+
+        self.metrics.observe("detect_step_seconds", start, step="filter")
+        self.metrics.increment("contours_found_total", len(contours), color=color_name)
+        self.metrics.increment("contours_rejected_total", len(contours) - len(detected_balls), color=color_name)
         return detected_balls
 
+    def _classify(self, hsv_frame, buffered=False):
+        """
+        Label every pixel with the index of its color (0 for background).
+        :param hsv_frame: Frame in HSV color space.
+        :param buffered: Write into the reusable buffers instead of new arrays.
+        :return: Label image with the same height and width as the frame.
+        """
+        shape = hsv_frame.shape[:2]
+        if buffered:
+            packed, labels = self._buffer("packed", shape + (4,)), self._buffer("labels", shape)
+            index = self._buffer("index", shape, np.intp)
+        else:
+            packed, labels = np.zeros(shape + (4,), np.uint8), np.empty(shape, np.uint8)
+            index = np.empty(shape, np.intp)
+
+        # Pack each HSV pixel into a 32-bit integer that indexes the lookup table,
+        # the fourth byte of every pixel is never written and stays zero
+        cv.mixChannels([hsv_frame], [packed], [0, 0, 1, 1, 2, 2])
+
+        # take() would convert the indices into a temporary intp array, so widen them
+        # into a preallocated one; "clip" lets it write straight into the output
+        np.copyto(index, packed.view(np.uint32)[..., 0])
+        return np.take(self.label_lut, index, out=labels, mode="clip")
+
+    def _buffer(self, name, shape, dtype=np.uint8):
+        """
+        Get a zeroed-once buffer that is reused while the requested shape stays the same.
+        :param name: Name of the buffer.
+        :param shape: Required shape.
+        :param dtype: Required data type.
+        :return: The buffer, or a new array when buffer reuse is disabled.
+        """
+        buffer = self.buffers.get(name)
+        if not self.reuse_buffers or buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.zeros(shape, dtype)
+            self.buffers[name] = buffer
 
-    def _process_frame(self, frame):
+        return buffer
+
+    def _process_frame(self, frame, dst=None):
         """
         Process a frame by converting to HSV
         :param frame: frame to be processed
+        :param dst: Optional buffer to write the converted frame into
         :return: the processed frame
         """
-        hsv_frame = cv.cvtColor(frame, cv.COLOR_BGR2HSV)
+        start = self.metrics.now()
+        hsv_frame = cv.cvtColor(frame, cv.COLOR_BGR2HSV, dst=dst)
+        self.metrics.observe("detect_step_seconds", start, step="convert")
 
         return hsv_frame
-    
-    def _clean_mask(self, mask):
+
+    def _clean_mask(self, mask, kernel=None, scratch=None):
         """
         Clean the mask using morphological operations.
         :param mask: The binary mask to be cleaned.
+        :param kernel: Structuring element, defaults to the full resolution kernel.
+        :param scratch: Optional buffer of the mask's shape, the result is then written back into the mask.
         :return: The cleaned mask.
         """
+        if kernel is None:
+            kernel = self.kernel
+
         # Apply dilation to close gaps in the mask
-        kernel = np.ones((7, 7), np.uint8)
-        mask = cv.dilate(mask, kernel, iterations=2)
-        
+        dilated = cv.dilate(mask, kernel, dst=scratch, iterations=self.dilate_iterations)
+
         # Apply erosion to remove noise
-        mask = cv.erode(mask, kernel, iterations=1)
+        mask = cv.erode(dilated, kernel, dst=mask if scratch is not None else None, iterations=self.erode_iterations)
 
         return mask
-    
-    def _load_color_ranges(self, filepath, profile="default"):
-        """
-        Load color ranges from config file
-        :param filepath: filepath of config file
-        :param profile: color range profile to be used
-        :return: color ranges
-        """
-        with open(filepath, 'r') as file:
-            data = yaml.safe_load(file)
-        if "profiles" in data and profile in data["profiles"]:
-            return data["profiles"][profile]
-        else:
-            raise ValueError(f"Profile '{profile}' not found in {filepath}.")
-        
+
+
+def load_color_ranges(filepath, profile="default"):
+    """
+    Load color ranges from config file
+    :param filepath: filepath of config file
+    :param profile: color range profile to be used
+    :return: color ranges
+    """
+    data = load_yaml(filepath)
+    if "profiles" in data and profile in data["profiles"]:
+        color_ranges = data["profiles"][profile]
+    else:
+        raise ValueError(f"Profile '{profile}' not found in {filepath}.")
+
+    try:
+        validate_color_ranges(color_ranges)
+    except ValueError as e:
+        raise ValueError(f"Color profile '{profile}' in {filepath}: {e}") from e
+    return color_ranges
+
 
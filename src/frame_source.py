@@ -0,0 +1,311 @@
+# Frame sources: cameras, video files, image directories and shared memory rings behind one interface
+
+import os
+import time
+import queue
+import threading
+import cv2 as cv
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+_END = object()  # Queued by the prefetch thread when the source is exhausted
+
+
+class FrameSource:
+    def __init__(self, reuse_buffer=True, prefetch=0, drop_frames=False):
+        """
+        Base of the frame sources. Iterating a source, or calling read(),
+        gives (frame_index, timestamp, frame) tuples. With reuse_buffer the
+        frames are decoded into a small pool of buffers that is allocated once
+        and handed out without copying, so a frame is only valid until the
+        next one is read. With prefetch a background thread decodes ahead of
+        the reader.
+        :param reuse_buffer: Decode into pooled buffers instead of a new array per frame.
+        :param prefetch: Frames decoded ahead on a background thread, 0 decodes on demand.
+        :param drop_frames: When the reader falls behind, drop the oldest
+                            prefetched frame instead of waiting, for live sources.
+        """
+        self.reuse_buffer = reuse_buffer
+        self.prefetch = prefetch
+        self.drop_frames = drop_frames
+        self.finished = False
+        self.dropped = 0
+
+        self.buffer = None  # Buffer of the frame handed out last
+        self.thread = None
+        self.stop_event = threading.Event()
+        if prefetch:
+            # Prefetched frames, plus one being decoded and one held by the reader
+            self.free = queue.Queue()
+            for _ in range(prefetch + 2):
+                self.free.put(None)  # Allocated by the first decode into it
+            self.filled = queue.Queue(maxsize=prefetch)
+
+    def _read(self, buffer):
+        """
+        Decode the next frame.
+        :param buffer: Array to decode into, or None to allocate one.
+        :return: (frame_index, timestamp, frame), or None at the end of the source.
+        """
+        raise NotImplementedError
+
+    def _release(self):
+        """
+        Free the underlying device or file.
+        """
+
+    def read(self, timeout=None):
+        """
+        Get the next frame.
+        :param timeout: Seconds to wait for a prefetched frame, None waits
+                        as long as it takes and 0 never waits.
+        :return: (frame_index, timestamp, frame), or None when no frame arrived in
+                 time or the source is exhausted, which sets finished.
+        """
+        if self.finished:
+            return None
+        if not self.prefetch:
+            item = self._read(self.buffer if self.reuse_buffer else None)
+            if item is None:
+                self.finished = True
+                return None
+            self.buffer = item[2]
+            return item
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._prefetch_loop, name="prefetch", daemon=True)
+            self.thread.start()
+        try:
+            item = self.filled.get(timeout != 0, timeout or None)
+        except queue.Empty:
+            return None
+
+        # The frame handed out last is done with, its buffer can be decoded into again
+        if self.buffer is not None:
+            self.free.put(self.buffer if self.reuse_buffer else None)
+            self.buffer = None
+        if item is _END:
+            self.finished = True
+            return None
+        self.buffer = item[2]
+        return item
+
+    def __iter__(self):
+        while True:
+            item = self.read()
+            if item is None:
+                return
+            yield item
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Stop the prefetch thread and free the source.
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        self._release()
+
+    def _prefetch_loop(self):
+        """
+        Decode frames ahead of the reader into free buffers.
+        """
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    buffer = self.free.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                item = self._read(buffer if self.reuse_buffer else None)
+                if item is None:
+                    break
+                self._hand_over(item)
+        finally:
+            self._hand_over(_END)
+
+    def _hand_over(self, item):
+        """
+        Queue a decoded frame for the reader, dropping the oldest queued frame
+        when the reader is behind and frames may be dropped.
+        """
+        drop = self.drop_frames and item is not _END
+        while not self.stop_event.is_set():
+            try:
+                self.filled.put(item, not drop, 0.1)
+                return
+            except queue.Full:
+                if not drop:
+                    continue
+            try:
+                dropped = self.filled.get_nowait()
+            except queue.Empty:
+                continue
+            self.free.put(dropped[2] if self.reuse_buffer else None)
+            self.dropped += 1
+
+
+class CameraSource(FrameSource):
+    def __init__(self, index=0, width=None, height=None, reuse_buffer=True, prefetch=1, drop_frames=True):
+        """
+        Frames of a camera, timestamped in seconds since the camera was opened.
+        By default a thread keeps reading the camera so its driver never
+        queues up stale frames, and the reader gets the newest frame.
+        :param index: Camera index.
+        :param width: Requested frame width, None for the camera's default.
+        :param height: Requested frame height.
+        See FrameSource for the other parameters.
+        """
+        super().__init__(reuse_buffer, prefetch, drop_frames)
+        self.camera = cv.VideoCapture(index)
+        if not self.camera.isOpened():
+            raise IOError(f"Cannot open camera {index}")
+        if width:
+            self.camera.set(cv.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self.camera.set(cv.CAP_PROP_FRAME_HEIGHT, height)
+        self.index = 0
+        self.start = time.monotonic()
+
+    def _read(self, buffer):
+        ret, frame = self.camera.read(image=buffer)
+        if not ret:
+            print("Cannot receive frame. Exiting...")
+            return None
+        item = (self.index, time.monotonic() - self.start, frame)
+        self.index += 1
+        return item
+
+    def _release(self):
+        self.camera.release()
+
+
+class VideoSource(FrameSource):
+    def __init__(self, path, start=0, stop=None, reuse_buffer=True, prefetch=0, drop_frames=False):
+        """
+        Frames of a video file, timestamped by the container.
+        :param path: Video file.
+        :param start: Index of the first frame to read.
+        :param stop: Index of the frame to stop before, None reads to the end.
+        See FrameSource for the other parameters.
+        """
+        super().__init__(reuse_buffer, prefetch, drop_frames)
+        self.capture = cv.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise IOError(f"Cannot open video {path}")
+
+        if start:
+            self.capture.set(cv.CAP_PROP_POS_FRAMES, start)
+            if int(self.capture.get(cv.CAP_PROP_POS_FRAMES)) != start:
+                self.capture.release()
+                raise IOError(f"Cannot seek to frame {start} of {path}")
+        self.index = start
+        self.stop = stop
+
+    def _read(self, buffer):
+        if self.stop is not None and self.index >= self.stop:
+            return None
+        ret, frame = self.capture.read(image=buffer)
+        if not ret:
+            return None
+        item = (self.index, self.capture.get(cv.CAP_PROP_POS_MSEC) / 1000.0, frame)
+        self.index += 1
+        return item
+
+    def _release(self):
+        self.capture.release()
+
+
+class ImageSource(FrameSource):
+    def __init__(self, directory, fps=30.0, start=0, stop=None, prefetch=0):
+        """
+        Images of a directory in file name order, timestamped at a fixed frame
+        rate. cv.imread cannot decode into an existing buffer, so every image
+        gets its own array and the frames stay valid after the next read.
+        :param directory: Image directory.
+        :param fps: Frame rate used to timestamp the images.
+        :param start: Index of the first image to read.
+        :param stop: Index of the image to stop before, None reads to the end.
+        :param prefetch: Images decoded ahead on a background thread.
+        """
+        super().__init__(False, prefetch)
+        names = sorted(name for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+        self.directory = directory
+        self.fps = fps
+        self.names = names[:stop]
+        self.index = start
+
+    def _read(self, buffer):
+        while self.index < len(self.names):
+            index, name = self.index, self.names[self.index]
+            self.index += 1
+            frame = cv.imread(os.path.join(self.directory, name))
+            if frame is None:
+                print(f"Cannot read image {name}, skipping.")
+                continue
+            return index, index / self.fps, frame
+        return None
+
+
+class RingSource(FrameSource):
+    def __init__(self, ring, timeout=None):
+        """
+        Frames published to a SharedFrameRing by another process. A frame is
+        read in place in shared memory, its slot goes back to the producer
+        when the next frame is read.
+        :param ring: SharedFrameRing attached as its consumer.
+        :param timeout: Seconds to wait for the producer, None waits forever.
+        """
+        super().__init__(True, 0)
+        self.ring = ring
+        self.timeout = timeout
+        self.holding = False
+
+    def _read(self, buffer):
+        from src.shared_ring import END
+
+        if self.holding:
+            self.ring.release()
+            self.holding = False
+        item = self.ring.acquire(self.timeout)
+        if item is None:
+            return None
+        self.holding = True
+        if item[0] == END:
+            return None
+        return item
+
+    def _release(self):
+        if self.holding:
+            self.ring.release()
+            self.holding = False
+
+
+def open_source(source, fps=30.0, start=0, stop=None, reuse_buffer=True, prefetch=0, width=None, height=None):
+    """
+    Open the frame source matching a source description.
+    :param source: Camera index (an int or a string of digits), video file,
+                   image directory, or a SharedFrameRing.
+    :param fps: Frame rate used to timestamp image directories.
+    :param start: First frame of a video file or image directory.
+    :param stop: Frame to stop before.
+    :param reuse_buffer: Decode into pooled buffers, see FrameSource.
+    :param prefetch: Frames decoded ahead, a camera always reads ahead by at least one.
+    :param width: Requested camera frame width.
+    :param height: Requested camera frame height.
+    :return: A FrameSource.
+    """
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    if isinstance(source, int):
+        return CameraSource(source, width, height, reuse_buffer, max(prefetch, 1))
+    if not isinstance(source, str):
+        return RingSource(source)
+    if os.path.isdir(source):
+        return ImageSource(source, fps, start, stop, prefetch)
+    return VideoSource(source, start, stop, reuse_buffer, prefetch)
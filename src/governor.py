@@ -0,0 +1,189 @@
+# Adaptive quality: trade detection and drawing quality for speed to hold a target frame rate
+
+import threading
+from src.metrics import DISABLED
+
+STEPS = ("show_masks", "trail_length", "detection_interval", "dilate_iterations", "downscale")
+
+
+class QualityGovernor:
+    def __init__(self, config, detectors, tracker, interval=None, metrics=None):
+        """
+        Measure the time every frame takes against the budget of a target
+        frame rate. While frames run over budget, quality is lowered one step
+        at a time; once they run well within it again, the steps are taken
+        back in reverse order. Each step changes one setting by one notch,
+        within the configured bounds, and is printed when it is taken.
+        :param config: The governor configuration dictionary (e.g., config["governor"])
+        :param detectors: BallDetectors to adjust.
+        :param tracker: MultiBallTracker whose trail length is adjusted.
+        :param interval: Optional AdaptiveDetectionInterval whose minimum interval is raised.
+        :param metrics: Optional Metrics receiving the quality level and adjustments.
+        """
+        self.detectors = list(detectors)
+        self.tracker = tracker
+        self.interval = interval
+        self.metrics = metrics if metrics is not None else DISABLED
+        self.level = 0  # Steps of the ladder in effect
+        self.frame_time = None  # Smoothed seconds per frame
+        self.frames_since_change = 0
+        self.pending = None  # Settings from reconfigure(), swapped in by the next update()
+        self.pending_lock = threading.Lock()
+
+        detector = self.detectors[0]
+        self._configure(config, {
+            "show_masks": detector.show_masks,
+            "trail_length": tracker.trail_length,
+            "detection_interval": interval.min_interval if interval is not None else None,
+            "dilate_iterations": detector.dilate_iterations,
+            "downscale": detector.downscale,
+        })
+
+    def _configure(self, config, base):
+        """
+        Take on governor settings and the configured values of the settings it trades.
+        :param config: The governor configuration dictionary.
+        :param base: {setting: configured value}, the top of the ladder.
+        """
+        self.config = config
+        self.enabled = config.get("enabled", True)
+        self.budget = 1.0 / config.get("target_fps", 30.0)  # Seconds per frame
+        self.degrade_above = config.get("degrade_above", 1.0)  # Fraction of the budget that lowers quality
+        self.restore_below = config.get("restore_below", 0.7)  # Fraction of the budget that raises it again
+        self.smoothing = config.get("smoothing", 0.1)  # Weight of the latest frame in the frame time average
+        self.cooldown_frames = config.get("cooldown_frames", 30)  # Frames to measure a step before the next one
+        self.base = base
+        self.ladder = self._build_ladder(config.get("steps", list(STEPS)))
+        self.level = min(self.level, len(self.ladder)) if self.enabled else 0
+
+    def reconfigure(self, config, compiled_detector, compiled_tracker, compiled_interval=None):
+        """
+        Hand the governor new settings after a hot reload, with the newly
+        configured values of the settings it trades as the top of its ladder.
+        They are swapped in by the next update(), which hands the current
+        quality level out again on top of them.
+        :param config: The governor configuration dictionary.
+        :param compiled_detector: Result of BallDetector.compile().
+        :param compiled_tracker: Result of MultiBallTracker.compile() for the governed tracker.
+        :param compiled_interval: Result of AdaptiveDetectionInterval.compile().
+        """
+        base = {
+            "show_masks": self.base["show_masks"],  # Kept by the running detectors across reloads
+            "trail_length": compiled_tracker["trail_length"],
+            "detection_interval": compiled_interval["min_interval"] if self.interval is not None else None,
+            "dilate_iterations": compiled_detector["dilate_iterations"],
+            "downscale": compiled_detector["downscale"],
+        }
+        with self.pending_lock:
+            self.pending = (config, base)
+
+    def _apply_pending(self):
+        with self.pending_lock:
+            pending, self.pending = self.pending, None
+        if pending is None:
+            return
+        self._configure(*pending)
+        self._hand_out(self.settings())
+        self.frames_since_change = 0
+        self.metrics.set("governor_level", self.level)
+        print(f"Quality governor: settings reloaded, level {self.level}/{len(self.ladder)}"
+              f"{'' if self.enabled else ' (disabled)'}")
+
+    def _build_ladder(self, steps):
+        """
+        List every notch of every step, in the order they are taken.
+        :param steps: Names of the settings to trade, cheapest loss of quality first.
+        :return: List of (setting, value) pairs.
+        """
+        ladder = []
+        for step in steps:
+            if step not in STEPS:
+                raise ValueError(f"Unknown governor step '{step}', expected one of {STEPS}")
+            base = self.base[step]
+            if step == "show_masks":
+                if base:
+                    ladder.append((step, False))
+            elif step == "trail_length":
+                # Halved each notch, a trail shorter than two positions draws nothing
+                length = base
+                while length // 2 >= max(self.config.get("min_trail_length", 8), 2):
+                    length //= 2
+                    ladder.append((step, length))
+            elif step == "detection_interval":
+                if base is not None:
+                    for value in range(base + 1, self.config.get("max_detection_interval", 3) + 1):
+                        ladder.append((step, value))
+            elif step == "dilate_iterations":
+                for value in range(base - 1, self.config.get("min_dilate_iterations", 1) - 1, -1):
+                    ladder.append((step, value))
+            elif step == "downscale":
+                for value in range(base + 1, self.config.get("max_downscale", 4) + 1):
+                    ladder.append((step, value))
+        return ladder
+
+    def settings(self, level=None):
+        """
+        :param level: Number of ladder steps in effect, defaults to the current level.
+        :return: {setting: value} at that level.
+        """
+        settings = dict(self.base)
+        settings.update(self.ladder[:self.level if level is None else level])
+        return settings
+
+    def update(self, frame_seconds):
+        """
+        Account for one frame and step the quality if needed.
+        :param frame_seconds: Time the frame took.
+        :return: (setting, old value, new value) of the step taken, or None.
+        """
+        if self.pending is not None:
+            self._apply_pending()
+        if not self.enabled:
+            return None
+        if self.frame_time is None:
+            self.frame_time = frame_seconds
+        else:
+            self.frame_time += self.smoothing * (frame_seconds - self.frame_time)
+        self.frames_since_change += 1
+        if self.frames_since_change < self.cooldown_frames:
+            return None
+
+        if self.frame_time > self.degrade_above * self.budget and self.level < len(self.ladder):
+            return self._step(1)
+        if self.frame_time < self.restore_below * self.budget and self.level > 0:
+            return self._step(-1)
+        return None
+
+    def _step(self, direction):
+        """
+        Move one step up or down the ladder and hand the new settings out.
+        :param direction: 1 to lower quality, -1 to raise it.
+        """
+        before = self.settings()
+        self.level += direction
+        after = self.settings()
+        setting = self.ladder[self.level - 1 if direction > 0 else self.level][0]
+        self._hand_out(after)
+        self.frames_since_change = 0
+
+        print(f"Quality governor: {setting} {before[setting]} -> {after[setting]} "
+              f"(frame time {self.frame_time * 1000:.1f} ms, budget {self.budget * 1000:.1f} ms, "
+              f"level {self.level}/{len(self.ladder)})")
+        self.metrics.increment("governor_adjustments_total", direction="lower" if direction > 0 else "raise", setting=setting)
+        self.metrics.set("governor_level", self.level)
+        return setting, before[setting], after[setting]
+
+    def _hand_out(self, settings):
+        """
+        Pass the settings that differ from the configured ones to the detectors,
+        the tracker and the detection interval.
+        """
+        changed = {name: value for name, value in settings.items() if value != self.base[name]}
+        detector_overrides = {name: changed[name] for name in ("show_masks", "dilate_iterations", "downscale") if name in changed}
+        for detector in self.detectors:
+            detector.adjust(detector_overrides)
+        self.tracker.adjust({"trail_length": changed["trail_length"]} if "trail_length" in changed else {})
+
+        if self.interval is not None:
+            # The interval raises its maximum to match, and keeps its configured one for later
+            self.interval.adjust({"min_interval": changed["detection_interval"]} if "detection_interval" in changed else {})
@@ -1,61 +1,240 @@
 # Main script
 
 import cv2 as cv
+import time
 import argparse
 from src.detection import BallDetector
-from src.tracking import MultiBallTracker
+from src.tracking import MultiBallTracker, track_frame
+from src.physics import AdaptiveDetectionInterval
+from src.table_boundary import TableBoundary
+from src.batch import run_batch
+from src.metrics import Metrics
+from src.governor import QualityGovernor
+from src.frame_source import open_source
 from config.config import load_config
 
+# The chunked, pipelined, streaming and hot reload modes are imported when
+# they are used, so short batch jobs do not pay for multiprocessing or asyncio
+
 def main():
-    profile = parse_args()
-    config = load_config(profile)
+    args = parse_args()
+    config = load_config(args.profile)
 
     # Ensure the profile was correctly loaded
     if config is None:
         print("Error: Profile configuration could not be loaded.")
         return
 
+    # Instrumentation is off unless the profile or --metrics turns it on
+    metrics_config = dict(config.get("metrics", {}))
+    if args.metrics:
+        metrics_config["enabled"] = True
+    metrics = Metrics(metrics_config)
+
+    if args.track_log:
+        config["tracking"] = dict(config.get("tracking", {}), log_path=args.track_log)
+    metrics.start()
+    try:
+        run(args, config, metrics)
+    finally:
+        metrics.stop()
+
+def run(args, config, metrics):
+    """
+    Run the mode selected on the command line.
+    :param args: Parsed command line arguments.
+    :param config: Profile configuration.
+    :param metrics: Metrics the detector and tracker report to.
+    """
+    if args.serve:
+        run_served(args, config, metrics)
+        return
+
+    # Recorded footage is processed headless, without any HighGUI calls
+    if args.input is not None:
+        if args.output is None:
+            print("Error: --output is required when processing --input.")
+            return
+
+        if args.chunked:
+            from src.chunked import run_chunked
+            frames, elapsed = run_chunked(args.input, args.output, config, args.fps)
+        else:
+            frames, elapsed = run_batch(args.input, args.output, config, args.fps, metrics)
+        throughput = frames / elapsed if elapsed > 0 else 0.0
+        print(f"Processed {frames} frames in {elapsed:.2f}s ({throughput:.1f} fps)")
+        return
+
+    if args.pipelined:
+        run_pipelined(config, metrics=metrics, profile=args.profile, source=args.source)
+        return
+
     # Extract the configuration for detector and tracker from the loaded profile
     detector_config = config.get("detector", {})
     tracker_config = config.get("tracking", {})
 
     # Initialize the BallDetector and MultiBallTracker with the extracted configuration
-    detector = BallDetector(detector_config)
-    tracker = MultiBallTracker(tracker_config)
-
-    # Open the camera
-    camera = cv.VideoCapture(0)
+    detector = BallDetector(detector_config, metrics=metrics)
+    tracker = MultiBallTracker(tracker_config, metrics=metrics)
+    interval = AdaptiveDetectionInterval(**tracker_config.get("detection_interval", {}))
+    table = TableBoundary(config["table"]) if config.get("table", {}).get("enabled") else None
+    governor = start_governor(config, [detector], tracker, interval, metrics)
+    config_service = start_config_service(args.profile, config, [detector], [tracker], metrics, [interval], governor)
 
-    if not camera.isOpened():
-        print("Cannot open camera")
+    # Open the camera, or the video, image directory or other camera given by --source
+    try:
+        source = open_capture(args.source, config, args.fps)
+    except IOError as error:
+        print(error)
         exit()
 
+    frame_index = 0
     while True:
-        # Capture frame by frame
-        ret, frame = camera.read()
+        # Capture frame by frame into the source's reused buffers
+        frame_start = metrics.now()
+        item = source.read()
+        metrics.observe("capture_seconds", frame_start)
 
-        if not ret:
-            print("Cannot receive frame. Exiting...")
+        if item is None:
             break
+        frame = item[2]
+
+        # Detect balls in the frame and update the tracks
+        process_start = time.perf_counter()
+        track_frame(frame, detector, tracker, interval, table)
 
-        # Detect balls in the frame
-        detected_balls = detector.detect(frame)
+        # Tracking runs on every frame, drawing and display only every render_interval frames
+        rendered = frame_index % tracker.render_interval == 0
+        frame_index += 1
+        if rendered:
+            # Draw the tracking on the frame
+            tracker.draw_tracks(frame)
 
-        # Update and draw the tracking on the frame
-        tracker.update_tracks(detected_balls)
-        tracker.draw_tracks(frame)
+            # Show the frame with tracking results
+            cv.imshow("Pool ball tracker", frame)
 
-        # Show the frame with tracking results
-        cv.imshow("Pool ball tracker", frame)
+        # Waiting on the camera is not counted against the frame budget
+        if governor is not None:
+            governor.update(time.perf_counter() - process_start)
+
+        metrics.observe("frame_seconds", frame_start)
+        metrics.increment("frames_total")
+        metrics.export()
 
         # Exit the loop if 'q' is pressed
-        if cv.waitKey(1) == ord('q'):
+        if rendered and cv.waitKey(1) == ord('q'):
             break
 
     # Release the camera and close the window
-    camera.release()
+    if config_service is not None:
+        config_service.stop()
+    tracker.close()
+    source.close()
     cv.destroyAllWindows()
 
+def open_capture(source, config, fps=30.0):
+    """
+    Open a live source with the capture settings of the profile.
+    :param source: Camera index, video file or image directory.
+    :return: The FrameSource.
+    :raises IOError: If the source cannot be opened.
+    """
+    capture_config = config.get("capture", {})
+    return open_source(source, fps, prefetch=capture_config.get("prefetch", 0),
+                       width=capture_config.get("width", 0), height=capture_config.get("height", 0))
+
+def run_pipelined(config, stats_interval=5.0, metrics=None, profile="default", source=0):
+    """
+    Run the camera loop with capture, detection and tracking in overlapping stages.
+    :param config: Profile configuration.
+    :param stats_interval: Seconds between printing the pipeline queue depths.
+    :param metrics: Optional Metrics the pipeline stages report to.
+    :param profile: Name of the profile, reloaded when hot reload is enabled.
+    :param source: Camera index, video file or image directory.
+    """
+    from src.pipeline import Pipeline
+
+    pipeline = Pipeline(config, source=source, metrics=metrics)
+    config_service = start_config_service(profile, config, pipeline.detectors, [pipeline.tracker], metrics)
+    pipeline.start()
+
+    last_stats = time.monotonic()
+    try:
+        for sequence, _, frame in pipeline.outputs():
+            if metrics is not None:
+                metrics.increment("frames_total")
+                metrics.export()
+
+            # Drawing and display only run every render_interval frames
+            if sequence % pipeline.tracker.render_interval:
+                continue
+            pipeline.draw_tracks(frame)
+            cv.imshow("Pool ball tracker", frame)
+
+            # Report where the pipeline backs up
+            if time.monotonic() - last_stats > stats_interval:
+                print(f"Pipeline stats: {pipeline.stats()}")
+                last_stats = time.monotonic()
+
+            # Exit the loop if 'q' is pressed
+            if cv.waitKey(1) == ord('q'):
+                break
+    finally:
+        if config_service is not None:
+            config_service.stop()
+        pipeline.stop()
+        cv.destroyAllWindows()
+
+def run_served(args, config, metrics=None):
+    """
+    Push live tracks to local subscribers instead of showing them, from the
+    --source, or from --input when it is given.
+    :param args: Parsed command line arguments.
+    :param config: Profile configuration, the streaming settings configure the server.
+    :param metrics: Optional Metrics the detector, tracker and server report to.
+    """
+    import asyncio
+    from src.streaming import TrackStream, serve_tracks
+
+    streaming_config = config.get("streaming", {})
+    source = args.input if args.input is not None else args.source
+    stream = TrackStream(config, source, args.fps, streaming_config.get("queue_size", 8), metrics)
+    config_service = start_config_service(args.profile, config, [stream.detector], [stream.tracker], metrics,
+                                          [stream.interval], stream.governor)
+    try:
+        asyncio.run(serve_tracks(stream, streaming_config, metrics))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if config_service is not None:
+            config_service.stop()
+
+def start_governor(config, detectors, tracker, interval=None, metrics=None):
+    """
+    Create a QualityGovernor if the governor settings of the profile enable it.
+    :return: The QualityGovernor, or None.
+    """
+    governor_config = config.get("governor", {})
+    if not governor_config.get("enabled"):
+        return None
+    return QualityGovernor(governor_config, detectors, tracker, interval, metrics)
+
+def start_config_service(profile, config, detectors, trackers, metrics=None, intervals=(), governor=None):
+    """
+    Start reloading config.yaml and colors.yaml into the running detectors,
+    trackers, detection intervals and governor, if the hot_reload settings of the profile enable it.
+    :return: The running ConfigService, or None.
+    """
+    hot_reload_config = config.get("hot_reload", {})
+    if not hot_reload_config.get("enabled"):
+        return None
+    from src.config_service import ConfigService
+
+    config_service = ConfigService(profile, hot_reload_config.get("poll_interval", 0.5), metrics=metrics, config=config)
+    config_service.watch(detectors, trackers, intervals, [governor] if governor is not None else [])
+    config_service.start()
+    return config_service
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Select a config profile to use.")
     parser.add_argument(
@@ -64,10 +243,60 @@ def parse_args():
         default='default',
         help="The name of the profile to use (default: `default`)"
     )
+    parser.add_argument(
+        "--input",
+        type=str,
+        default=None,
+        help="Video file or image directory to process headless instead of the camera"
+    )
+    parser.add_argument(
+        "--source",
+        type=str,
+        default="0",
+        help="Camera index, video file or image directory to track live (default: camera 0)"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Track output file for --input, .jsonl or .csv"
+    )
+    parser.add_argument(
+        "--fps",
+        type=float,
+        default=30.0,
+        help="Frame rate used to timestamp image directories (default: 30)"
+    )
+    parser.add_argument(
+        "--chunked",
+        action="store_true",
+        help="Process --input in overlapping chunks on all cores using the chunked settings of the profile"
+    )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="Overlap capture, detection and tracking using the pipeline settings of the profile"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Push live tracks to local WebSocket and TCP subscribers using the streaming settings of the profile"
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Collect per-stage timings and counters, exported as set in the metrics settings of the profile"
+    )
+    parser.add_argument(
+        "--track-log",
+        type=str,
+        default=None,
+        help="Binary track log to append every frame's tracks to, replayed with python -m src.track_log"
+    )
 
     args = parser.parse_args()
 
-    return args.profile
+    return args
 
 if __name__ == "__main__":
     main()
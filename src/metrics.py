@@ -0,0 +1,219 @@
+# Opt-in hot path instrumentation
+
+import os
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+
+# Histogram bucket upper bounds in seconds, from 0.1 ms to 1 s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+QUANTILES = (0.5, 0.9, 0.99)
+PREFIX = "pool_"
+
+
+class Histogram:
+    def __init__(self, window=1000):
+        """
+        Cumulative bucket counts for export, plus the most recent samples for
+        rolling quantiles.
+        :param window: Number of recent samples the quantiles are taken over.
+        """
+        self.counts = [0] * (len(BUCKETS) + 1)  # Last bucket is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantiles(self):
+        """
+        :return: {quantile: value} over the recent samples.
+        """
+        ordered = sorted(self.recent)
+        if not ordered:
+            return {}
+        return {q: ordered[min(int(q * len(ordered)), len(ordered) - 1)] for q in QUANTILES}
+
+
+class Metrics:
+    def __init__(self, config):
+        """
+        Counters, gauges and timing histograms shared by the main loop, the
+        detector and the tracker. When disabled every call returns at once,
+        so instrumented code runs at full speed.
+        :param config: The metrics configuration dictionary (e.g., from load_config)
+        """
+        self.config = config
+        self.enabled = config.get("enabled", False)
+        self.path = config.get("path", "")  # Prometheus text file, empty to skip
+        self.port = config.get("port", 0)  # Localhost HTTP endpoint, 0 to skip
+        self.export_interval = config.get("export_interval", 5.0)  # Seconds between file writes
+        self.window = config.get("window", 1000)  # Samples kept for the rolling quantiles
+
+        self.counters = {}  # {(name, labels): value}
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()  # Detection workers report concurrently
+        self.server = None
+        self.last_export = None
+
+    def now(self):
+        """
+        :return: A timestamp to time a step with, 0 when disabled so no clock is read.
+        """
+        return time.perf_counter() if self.enabled else 0.0
+
+    def observe(self, name, start, **labels):
+        """
+        Record the time elapsed since a timestamp from now().
+        :param name: Histogram name.
+        :param start: Timestamp from now() taken when the step began.
+        :param labels: Label values, e.g. step="classify".
+        """
+        if not self.enabled:
+            return
+        elapsed = time.perf_counter() - start
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.window)
+            histogram.observe(elapsed)
+
+    def increment(self, name, amount=1, **labels):
+        """
+        Add to a counter.
+        :param name: Counter name.
+        :param amount: Amount to add.
+        :param labels: Label values, e.g. color="red".
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        """
+        Set a gauge to its current value.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def render(self):
+        """
+        :return: All metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted((key, histogram.counts[:], histogram.total, histogram.count, histogram.quantiles())
+                                for key, histogram in self.histograms.items())
+
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                typed.add(name)
+
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+        for (name, labels), value in gauges:
+            declare(name, "gauge")
+            lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), counts, total, count, _ in histograms:
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += bucket
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {count}")
+
+        # Rolling quantiles are exported as gauges after the histograms, each family stays contiguous
+        for (name, labels), _, _, _, quantiles in histograms:
+            declare(f"{name}_recent", "gauge")
+            for q, value in quantiles.items():
+                lines.append(f"{PREFIX}{name}_recent{_format_labels(labels + (('quantile', q),))} {value:.6f}")
+
+        return "\n".join(lines) + "\n"
+
+    def start(self):
+        """
+        Start the HTTP endpoint if a port is configured.
+        """
+        if not self.enabled or not self.port or self.server is not None:
+            return
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Slow to import, rarely used
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Scrapes would flood the console
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True).start()
+        print(f"Serving metrics on http://127.0.0.1:{self.server.server_address[1]}/metrics")
+
+    def export(self, now=None, force=False):
+        """
+        Write the metrics file if the export interval has passed.
+        :param now: Current time in seconds, defaults to time.monotonic().
+        :param force: Write regardless of the interval.
+        """
+        if not self.enabled or not self.path:
+            return
+        if now is None:
+            now = time.monotonic()
+        if not force and self.last_export is not None and now - self.last_export < self.export_interval:
+            return
+
+        # Written beside the target and renamed, so a scraper never reads half a file
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(temporary, self.path)
+        self.last_export = now
+
+    def stop(self):
+        """
+        Write the final metrics file and stop the HTTP endpoint.
+        """
+        self.export(force=True)
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def _format_labels(labels):
+    """
+    :param labels: Tuple of (name, value) pairs.
+    :return: Prometheus label set, empty when there are no labels.
+    """
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+DISABLED = Metrics({})  # Shared by everything created without metrics
@@ -0,0 +1,106 @@
+# Motion gating for incremental detection
+import cv2 as cv
+import numpy as np
+from src.util import merge_rects, grab_contours
+
+BALL_MARGIN = 16  # Pixels kept around a ball so mask cleaning sees all of its surroundings
+
+
+class MotionGate:
+    def __init__(self, config):
+        """
+        Find the parts of a frame that changed since they were last detected,
+        using a low resolution color reference image split into tiles.
+        :param config: The incremental detection configuration dictionary.
+        """
+        self.config = config
+        self.downscale = config.get("downscale", 4)  # Reference image is this many times smaller
+        self.tile_size = config.get("tile_size", 64)  # Tile edge in full resolution pixels
+        self.threshold = config.get("threshold", 25)  # Channel change that counts as motion
+        self.refresh_frames = config.get("refresh_frames", 300)  # Full detection at least this often
+
+        self.reference = None
+        self.frames_since_refresh = 0
+
+    def reset(self):
+        """
+        Drop the reference so the next frame gets a full detection.
+        """
+        self.reference = None
+
+    def changed_regions(self, frame, cached_balls):
+        """
+        Get the regions of the frame that need detecting again.
+        :param frame: Input image frame.
+        :param cached_balls: Detections from the previous frame.
+        :return: List of (x0, y0, x1, y1) rectangles, or None if the whole frame needs detecting.
+        """
+        small = self._shrink(frame)
+
+        self.frames_since_refresh += 1
+        if self.reference is None or self.reference.shape != small.shape or self.frames_since_refresh >= self.refresh_frames:
+            self.reference = small
+            self.frames_since_refresh = 0
+            return None
+
+        # Mark tiles where anything changed since the tile was last detected
+        # Largest change over the color channels, a colored ball can match the cloth in gray
+        blue, green, red = cv.split(cv.absdiff(small, self.reference))
+        moved = cv.compare(cv.max(cv.max(blue, green), red), self.threshold, cv.CMP_GT)
+        tile = max(self.tile_size // self.downscale, 1)
+        rows, cols = -(-small.shape[0] // tile), -(-small.shape[1] // tile)
+        padded = np.zeros((rows * tile, cols * tile), np.uint8)
+        padded[:small.shape[0], :small.shape[1]] = moved
+        changed = padded.reshape(rows, tile, cols, tile).max(axis=(1, 3))
+        if not changed.any():
+            return []
+
+        # Include neighbouring tiles so balls straddling a tile edge are covered
+        changed = cv.dilate(changed, np.ones((3, 3), np.uint8))
+
+        height, width = frame.shape[:2]
+        step = tile * self.downscale  # Tile edge in full resolution pixels
+        regions = []
+        for contour in grab_contours(cv.findContours(changed, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)):
+            x, y, w, h = cv.boundingRect(contour)
+            regions.append((x * step, y * step, min((x + w) * step, width), min((y + h) * step, height)))
+
+        regions = self._include_overlapping_balls(merge_rects(regions), cached_balls, width, height)
+
+        # The detected regions become the new reference, other tiles keep accumulating change
+        scale = self.downscale
+        for x0, y0, x1, y1 in regions:
+            self.reference[y0 // scale:-(-y1 // scale), x0 // scale:-(-x1 // scale)] = \
+                small[y0 // scale:-(-y1 // scale), x0 // scale:-(-x1 // scale)]
+
+        return regions
+
+    def _include_overlapping_balls(self, regions, cached_balls, width, height):
+        """
+        Grow regions to fully contain any cached ball they cut through, so a
+        ball is never detected as a partial blob at a region edge.
+        """
+        changed = True
+        while changed:
+            changed = False
+            for ball in cached_balls:
+                (x, y), radius = ball["position"], ball["radius"] + BALL_MARGIN
+                box = (max(x - radius, 0), max(y - radius, 0), min(x + radius + 1, width), min(y + radius + 1, height))
+                for i, (x0, y0, x1, y1) in enumerate(regions):
+                    overlaps = box[0] < x1 and x0 < box[2] and box[1] < y1 and y0 < box[3]
+                    contained = box[0] >= x0 and box[1] >= y0 and box[2] <= x1 and box[3] <= y1
+                    if overlaps and not contained:
+                        regions[i] = (min(x0, box[0]), min(y0, box[1]), max(x1, box[2]), max(y1, box[3]))
+                        changed = True
+            if changed:
+                regions = merge_rects(regions)
+
+        return regions
+
+    def _shrink(self, frame):
+        """
+        :return: Low resolution copy of the frame.
+        """
+        height, width = frame.shape[:2]
+        size = (max(width // self.downscale, 1), max(height // self.downscale, 1))
+        return cv.resize(frame, size, interpolation=cv.INTER_LINEAR)
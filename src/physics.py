@@ -1 +1,185 @@
-# Physics sim
\ No newline at end of file
+# Physics sim
+import threading
+import numpy as np
+
+
+class KalmanBank:
+    def __init__(self, capacity, friction=0.98, process_noise=1.0, measurement_noise=4.0):
+        """
+        Constant velocity Kalman filters for many rolling balls, with the velocity
+        decaying by a friction factor every frame. The states and covariances
+        are stacked so every step runs over all selected slots in one go.
+        :param capacity: Number of slots.
+        :param friction: Fraction of the velocity kept from one frame to the next.
+        :param process_noise: Variance of the unmodelled acceleration (px / frame^2).
+        :param measurement_noise: Variance of the detected center (px^2).
+        """
+        self.states = np.zeros((capacity, 4))  # x, y, vx, vy per slot
+        self.covariances = np.zeros((capacity, 4, 4))
+        self.configure(friction, process_noise, measurement_noise)
+
+    def configure(self, friction=0.98, process_noise=1.0, measurement_noise=4.0):
+        """
+        Set the model parameters, keeping the state of every slot.
+        """
+        self.measurement_noise = measurement_noise
+        self.transition = np.array([
+            [1.0, 0.0, 1.0, 0.0],
+            [0.0, 1.0, 0.0, 1.0],
+            [0.0, 0.0, friction, 0.0],
+            [0.0, 0.0, 0.0, friction],
+        ])
+        noise_gain = np.array([[0.5, 0.0], [0.0, 0.5], [1.0, 0.0], [0.0, 1.0]])
+        self.process_covariance = process_noise * noise_gain @ noise_gain.T
+        self.initial_covariance = np.diag([measurement_noise, measurement_noise, 100.0, 100.0])
+
+    def grow(self, capacity):
+        """
+        Make room for more slots, keeping the existing ones.
+        :param capacity: New number of slots.
+        """
+        extra = capacity - len(self.states)
+        self.states = np.concatenate([self.states, np.zeros((extra, 4))])
+        self.covariances = np.concatenate([self.covariances, np.zeros((extra, 4, 4))])
+
+    def start(self, slots, positions):
+        """
+        Start filters at rest at the given positions.
+        :param slots: Indices of the slots to start.
+        :param positions: (n, 2) array of positions.
+        """
+        self.states[slots, :2] = positions
+        self.states[slots, 2:] = 0.0
+        self.covariances[slots] = self.initial_covariance
+
+    def predict(self, slots):
+        """
+        Advance the selected filters by one frame.
+        :param slots: Indices of the slots to advance.
+        """
+        self.states[slots] = self.states[slots] @ self.transition.T
+        self.covariances[slots] = self.transition @ self.covariances[slots] @ self.transition.T + self.process_covariance
+
+    def update(self, slots, positions):
+        """
+        Correct the selected filters with detected positions.
+        :param slots: Indices of the slots to correct, each at most once.
+        :param positions: (n, 2) array of detected positions.
+        """
+        covariances = self.covariances[slots]
+        # The observation picks x and y, so its products are slices of the covariance
+        innovation_covariance = covariances[:, :2, :2] + self.measurement_noise * np.eye(2)
+        gain = covariances[:, :, :2] @ np.linalg.inv(innovation_covariance)
+        innovation = positions - self.states[slots, :2]
+
+        self.states[slots] += (gain @ innovation[:, :, None])[:, :, 0]
+        self.covariances[slots] = covariances - gain @ covariances[:, :2, :]
+
+    def positions(self, slots):
+        """
+        :return: (n, 2) array of the filtered positions of the selected slots.
+        """
+        return self.states[slots, :2]
+
+    def speeds(self, slots):
+        """
+        :return: Speeds of the selected slots in pixels per frame.
+        """
+        return np.hypot(self.states[slots, 2], self.states[slots, 3])
+
+
+class AdaptiveDetectionInterval:
+    def __init__(self, min_interval=1, max_interval=1, rest_speed=0.5, fast_speed=15.0):
+        """
+        Decide on which frames to run full detection. The interval grows by one
+        frame while every ball is at rest, drops back to the minimum as soon as
+        any ball moves fast, and shrinks gradually in between.
+        :param min_interval: Smallest number of frames between full detections.
+        :param max_interval: Largest number of frames between full detections.
+        :param rest_speed: Speed (px / frame) under which a ball is at rest.
+        :param fast_speed: Speed (px / frame) above which a ball moves fast.
+        """
+        self.interval = min_interval
+        self.frames_since_detection = None  # None until the first full detection
+        self.pending = None  # Settings from reconfigure() and adjust(), swapped in before the next frame
+        self.pending_lock = threading.Lock()
+        self.settings = {}  # Configured settings in use
+        self.overrides = {}  # Settings from adjust(), kept on top of the configured ones
+
+        self._apply({"min_interval": min_interval, "max_interval": max_interval,
+                     "rest_speed": rest_speed, "fast_speed": fast_speed})
+
+    @staticmethod
+    def compile(config):
+        """
+        :param config: The detection interval configuration dictionary (e.g., config["tracking"]["detection_interval"])
+        :return: Dictionary of settings, for reconfigure().
+        """
+        return {
+            "min_interval": config.get("min_interval", 1),
+            "max_interval": config.get("max_interval", 1),
+            "rest_speed": config.get("rest_speed", 0.5),
+            "fast_speed": config.get("fast_speed", 15.0),
+        }
+
+    def reconfigure(self, settings):
+        """
+        Hand the interval new settings from compile(), swapped in before the next frame.
+        :param settings: Result of AdaptiveDetectionInterval.compile().
+        """
+        with self.pending_lock:
+            self.pending = dict(self.pending or {}, **settings)
+
+    def adjust(self, overrides):
+        """
+        Override some settings, e.g. the minimum interval from the QualityGovernor.
+        The overrides are swapped in like reconfigure() and outlast later reconfigures.
+        :param overrides: Dictionary of settings, empty to drop all overrides.
+        """
+        with self.pending_lock:
+            self.pending = dict(self.pending or {}, overrides=dict(overrides))
+
+    def _apply(self, settings):
+        """
+        Swap in settings and overrides, keeping the current interval within the new bounds.
+        """
+        settings = dict(settings)
+        self.overrides = settings.pop("overrides", self.overrides)
+        self.settings.update(settings)
+        for name, value in dict(self.settings, **self.overrides).items():
+            setattr(self, name, value)
+        self.max_interval = max(self.max_interval, self.min_interval)
+        self.interval = min(max(self.interval, self.min_interval), self.max_interval)
+
+    def _apply_pending(self):
+        with self.pending_lock:
+            settings, self.pending = self.pending, None
+        if settings is not None:
+            self._apply(settings)
+
+    def should_detect(self):
+        """
+        :return: True if the current frame needs a full detection.
+        """
+        if self.pending is not None:
+            self._apply_pending()
+        return self.frames_since_detection is None or self.frames_since_detection + 1 >= self.interval
+
+    def update(self, speeds, detected):
+        """
+        Adapt the interval after a frame has been processed.
+        :param speeds: Speeds of all tracked balls (px / frame).
+        :param detected: Whether the frame ran full detection.
+        :return: The new interval.
+        """
+        self.frames_since_detection = 0 if detected else self.frames_since_detection + 1
+
+        max_speed = max(speeds, default=0.0)
+        if max_speed >= self.fast_speed:
+            self.interval = self.min_interval
+        elif max_speed <= self.rest_speed:
+            self.interval = min(self.interval + 1, self.max_interval)
+        else:
+            self.interval = max(self.interval - 1, self.min_interval)
+
+        return self.interval
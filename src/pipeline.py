@@ -0,0 +1,275 @@
+# Pipelined capture / detect / track / render runner
+
+import time
+import queue
+import threading
+from src.frame_source import open_source
+from src.detection import BallDetector
+from src.tracking import MultiBallTracker
+from src.table_boundary import TableBoundary
+from src.metrics import DISABLED
+
+DROP_POLICIES = ("block", "drop_oldest", "drop_newest")
+_STOP = object()  # Sentinel passed down the queues when the source is exhausted
+
+
+class Pipeline:
+    def __init__(self, config, source=0, pipeline_config=None, metrics=None):
+        """
+        Run capture, detection, tracking and rendering as overlapping stages.
+        Frames flow through bounded queues: one capture thread, a pool of
+        detection workers (OpenCV releases the GIL while they run), a tracking
+        thread that consumes detections strictly in frame order, and an output
+        queue drained by the caller to render or store results.
+        :param config: Profile configuration (e.g., from load_config).
+        :param source: Camera index, video file or image directory.
+        :param pipeline_config: Pipeline settings, defaults to config["pipeline"].
+        :param metrics: Optional Metrics shared by the detectors and the tracker,
+                        the capture and tracking threads add capture and frame times.
+        """
+        if pipeline_config is None:
+            pipeline_config = config.get("pipeline", {})
+        self.source = source
+        self.num_workers = pipeline_config.get("workers", 2)
+        self.queue_size = pipeline_config.get("queue_size", 4)
+        self.drop_policy = pipeline_config.get("drop_policy", "drop_oldest")
+        self.max_latency = pipeline_config.get("max_latency_ms", 0) / 1000.0  # 0 disables the age check
+        if self.drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{self.drop_policy}', expected one of {DROP_POLICIES}")
+
+        # Each worker owns a detector so no state is shared between threads.
+        # HighGUI is not thread safe, so workers never show their debug masks.
+        detector_config = dict(config.get("detector", {}), show_masks=False)
+        self.detectors = [BallDetector(detector_config, metrics=metrics) for _ in range(self.num_workers)]
+        self.tracker = MultiBallTracker(config.get("tracking", {}), metrics=metrics)
+        self.table = TableBoundary(config["table"]) if config.get("table", {}).get("enabled") else None
+        self.tracker_lock = threading.Lock()  # Held while the tracks are updated or drawn
+        self.metrics = metrics if metrics is not None else DISABLED
+
+        self.capture_queue = queue.Queue(maxsize=self.queue_size)
+        self.output_queue = queue.Queue(maxsize=self.queue_size)
+        self.results = {}  # {sequence: detections or None if the frame was dropped}
+        self.results_ready = threading.Condition()
+        self.total_frames = None  # Number of sequences issued, set once capture ends
+
+        self.stop_event = threading.Event()
+        self.dropped = {"capture": 0, "stale": 0, "output": 0}
+        self.processed = 0
+        self.threads = []
+
+    def start(self):
+        """
+        Start the capture, detection and tracking threads.
+        """
+        self.threads = [threading.Thread(target=self._capture_loop, name="capture", daemon=True)]
+        for i, detector in enumerate(self.detectors):
+            self.threads.append(threading.Thread(target=self._detect_loop, args=(detector,), name=f"detect-{i}", daemon=True))
+        self.threads.append(threading.Thread(target=self._track_loop, name="track", daemon=True))
+
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Stop all stages and wait for the threads to finish.
+        """
+        self.stop_event.set()
+        with self.results_ready:
+            self.results_ready.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+        with self.tracker_lock:
+            self.tracker.close()
+
+    def outputs(self):
+        """
+        Iterate over tracked frames in order until the source is exhausted.
+        :return: Generator of (frame_index, timestamp, frame).
+        """
+        while not self.stop_event.is_set():
+            try:
+                item = self.output_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                return
+            yield item
+
+    def draw_tracks(self, frame):
+        """
+        Draw the current tracks on a frame without racing the tracking thread.
+        :param frame: Frame to draw on.
+        """
+        with self.tracker_lock:
+            self.tracker.draw_tracks(frame)
+
+    def get_tracks(self):
+        """
+        :return: Snapshot of the current tracks, see MultiBallTracker.get_tracks.
+        """
+        with self.tracker_lock:
+            return self.tracker.get_tracks()
+
+    def stats(self):
+        """
+        Report how far each stage is backed up.
+        :return: Queue depths, frames dropped per reason and frames tracked.
+        """
+        with self.results_ready:
+            return {
+                "capture_queue": self.capture_queue.qsize(),
+                "reorder_buffer": len(self.results),
+                "output_queue": self.output_queue.qsize(),
+                "dropped": dict(self.dropped),
+                "processed": self.processed,
+            }
+
+    def _capture_loop(self):
+        """
+        Read frames from the source and hand them to the detection workers.
+        """
+        metrics = self.metrics
+        sequence = 0
+        try:
+            capture_start = metrics.now()
+            for _, timestamp, frame in self._read_source():
+                if self.stop_event.is_set():
+                    break
+                metrics.observe("capture_seconds", capture_start)
+                # The table is tracked here in frame order, each frame carries its (cached) ROI to the worker
+                roi = self.table.update(frame) if self.table is not None else None
+                # Captured on the clock of Metrics, so the tracking thread can time the whole frame
+                self._offer(self.capture_queue, (sequence, timestamp, time.perf_counter(), frame, roi), "capture")
+                sequence += 1
+                capture_start = metrics.now()
+        finally:
+            with self.results_ready:
+                self.total_frames = sequence
+                self.results_ready.notify_all()
+            for _ in self.detectors:
+                self._put(self.capture_queue, _STOP)
+
+    def _detect_loop(self, detector):
+        """
+        Detect balls in queued frames and post the results for reordering.
+        :param detector: The BallDetector owned by this worker.
+        """
+        while not self.stop_event.is_set():
+            try:
+                item = self.capture_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                return
+
+            sequence, timestamp, captured_at, frame, roi = item
+            # Frames that waited too long are skipped rather than detected late
+            if self.max_latency and time.perf_counter() - captured_at > self.max_latency:
+                self._count_drop("stale")
+                self._post(sequence, None)
+                continue
+
+            # Only this worker touches its detector, so the ROI is swapped between detections
+            if detector.roi is not roi:
+                detector.set_roi(roi)
+            self._post(sequence, (timestamp, captured_at, frame, detector.detect(frame)))
+
+    def _track_loop(self):
+        """
+        Feed detections to the tracker strictly in frame order.
+        """
+        next_sequence = 0
+        while not self.stop_event.is_set():
+            with self.results_ready:
+                while next_sequence not in self.results:
+                    if self.stop_event.is_set() or self.total_frames == next_sequence:
+                        break
+                    self.results_ready.wait(timeout=0.1)
+                result = self.results.pop(next_sequence, _STOP)
+            if result is _STOP:
+                self._put(self.output_queue, _STOP)
+                return
+            next_sequence += 1
+
+            # Dropped frames leave a gap that the tracker simply steps over
+            if result is None:
+                continue
+
+            timestamp, captured_at, frame, detected_balls = result
+            with self.tracker_lock:
+                self.tracker.update_tracks(detected_balls, next_sequence - 1, timestamp, frame)
+            self.processed += 1
+            self.metrics.observe("frame_seconds", captured_at)  # From capture until the tracks are updated
+            self._offer(self.output_queue, (next_sequence - 1, timestamp, frame), "output")
+
+    def _read_source(self):
+        """
+        :return: Generator of (frame_index, timestamp, frame) from the configured source.
+        """
+        try:
+            source = open_source(self.source, reuse_buffer=False)
+        except IOError as error:
+            print(error)
+            return
+        with source:
+            yield from source
+
+    def _offer(self, target, item, stage):
+        """
+        Put an item on a bounded queue, applying the drop policy when it is full.
+        :param target: Queue to put the item on.
+        :param item: Item to queue, its first element is the frame sequence.
+        :param stage: Name of the stage, used to count drops.
+        """
+        if self.drop_policy == "block":
+            self._put(target, item)
+            return
+
+        while not self.stop_event.is_set():
+            try:
+                target.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+
+            if self.drop_policy == "drop_newest":
+                dropped = item
+            else:
+                try:
+                    dropped = target.get_nowait()
+                except queue.Empty:
+                    continue
+
+            self._count_drop(stage)
+            if target is self.capture_queue:
+                self._post(dropped[0], None)
+            if dropped is item:
+                return
+
+    def _put(self, target, item):
+        """
+        Blocking put that gives up once the pipeline is stopped.
+        """
+        while not self.stop_event.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _count_drop(self, reason):
+        """
+        :param reason: Stage or reason the frame was dropped for.
+        """
+        with self.results_ready:
+            self.dropped[reason] += 1
+
+    def _post(self, sequence, result):
+        """
+        Post the result of a frame to the reorder buffer.
+        :param sequence: Sequence number of the frame.
+        :param result: Detection result, or None if the frame was dropped.
+        """
+        with self.results_ready:
+            self.results[sequence] = result
+            self.results_ready.notify_all()
@@ -1 +1,156 @@
-# Occlusion handling and ball reidendification
+# Occlusion handling and ball reidentification
+import numpy as np
+import cv2 as cv
+from src.util import solve_assignment
+
+GATED_COST = 1e9  # Cost of a detection/gallery pair that may not match
+
+
+class ReIdentifier:
+    def __init__(self, config, capacity=64):
+        """
+        Keep an appearance signature per track, and a gallery of lost tracks
+        that new detections are matched against before a new ID is minted.
+        A signature is the color label plus a hue / saturation histogram of
+        the pixels inside the contour, stored as its square root so the
+        Bhattacharyya similarity of all pairs is one matrix product.
+        :param config: The reid configuration dictionary (e.g., config["tracking"]["reid"])
+        :param capacity: Track store capacity, signatures are kept per store slot.
+        """
+        self.bins = tuple(config.get("bins", [8, 4]))  # Hue and saturation bins
+        self.gallery_size = config.get("gallery_size", 32)  # Lost tracks remembered, oldest evicted first
+        self.configure(config)
+
+        size = int(np.prod(self.bins))
+        self.signatures = np.zeros((capacity, size), np.float32)
+
+        # Gallery of lost tracks, one row each
+        self.gallery_active = np.zeros(self.gallery_size, bool)
+        self.gallery_ids = np.full(self.gallery_size, -1, np.int64)
+        self.gallery_colors = [None] * self.gallery_size
+        self.gallery_signatures = np.zeros((self.gallery_size, size), np.float32)
+        self.gallery_positions = np.zeros((self.gallery_size, 2))
+        self.gallery_lost_at = np.zeros(self.gallery_size, np.int64)
+
+    def configure(self, config):
+        """
+        Set the matching parameters. The histogram bins and gallery size are
+        fixed when the ReIdentifier is created.
+        """
+        self.config = config
+        self.enabled = config.get("enabled", False)
+        self.max_lost_frames = config.get("max_lost_frames", 90)  # Frames a lost track stays in the gallery
+        self.min_similarity = config.get("min_similarity", 0.8)
+        self.max_distance = config.get("max_distance", 0)  # Pixels from where the track was lost, 0 for no limit
+        self.update_interval = config.get("update_interval", 5)  # Frames between signature updates of a track
+        self.blend = config.get("blend", 0.2)  # Weight of a new histogram in a track's signature
+
+    def describe(self, frame, balls):
+        """
+        Compute the signatures of detections.
+        :param frame: BGR frame the balls were detected in.
+        :param balls: Detected balls, the pixels inside the contour are used, or
+                      inside the circle when the detection has no contour.
+        :return: (n, bins) array of square rooted, normalized histograms.
+        """
+        signatures = np.zeros((len(balls), self.signatures.shape[1]), np.float32)
+        height, width = frame.shape[:2]
+        for i, ball in enumerate(balls):
+            contour = ball.get("contour")
+            if contour is not None:
+                x, y, w, h = cv.boundingRect(contour)
+            else:
+                (cx, cy), radius = ball["position"], ball["radius"]
+                x, y, w, h = cx - radius, cy - radius, 2 * radius + 1, 2 * radius + 1
+            x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, width), min(y + h, height)
+            if x1 <= x0 or y1 <= y0:
+                continue
+
+            # Only the pixels of the ball count, not the cloth around it
+            hsv = cv.cvtColor(frame[y0:y1, x0:x1], cv.COLOR_BGR2HSV)
+            mask = np.zeros((y1 - y0, x1 - x0), np.uint8)
+            if contour is not None:
+                cv.drawContours(mask, [contour], -1, 255, cv.FILLED, offset=(-x0, -y0))
+            else:
+                cv.circle(mask, (cx - x0, cy - y0), radius, 255, cv.FILLED)
+            histogram = cv.calcHist([hsv], [0, 1], mask, list(self.bins), [0, 180, 0, 256]).ravel()
+            total = histogram.sum()
+            if total > 0:
+                signatures[i] = np.sqrt(histogram / total)
+
+        return signatures
+
+    def grow(self, capacity):
+        """
+        Make room for signatures of a grown track store.
+        """
+        extra = capacity - len(self.signatures)
+        if extra > 0:
+            self.signatures = np.concatenate([self.signatures, np.zeros((extra, self.signatures.shape[1]), np.float32)])
+
+    def start(self, slots, signatures):
+        """
+        Set the signatures of new tracks.
+        """
+        self.signatures[slots] = signatures
+
+    def update(self, slots, signatures):
+        """
+        Blend fresh detections into the signatures of matched tracks.
+        """
+        blended = (1 - self.blend) * self.signatures[slots] ** 2 + self.blend * signatures ** 2
+        totals = blended.sum(axis=1, keepdims=True)
+        self.signatures[slots] = np.sqrt(blended / np.maximum(totals, 1e-12))
+
+    def lose(self, slots, ids, colors, positions, frame_index):
+        """
+        Move dropped tracks into the gallery, evicting the oldest entries when it is full.
+        :param slots: Store slots of the dropped tracks.
+        :param ids: Their track IDs.
+        :param colors: Their color labels.
+        :param positions: (n, 2) array of their last positions.
+        :param frame_index: Current frame number.
+        """
+        for slot, track_id, color, position in zip(slots.tolist(), ids.tolist(), colors, positions):
+            free = np.flatnonzero(~self.gallery_active)
+            row = free[0] if len(free) else int(np.argmin(self.gallery_lost_at))
+            self.gallery_active[row] = True
+            self.gallery_ids[row] = track_id
+            self.gallery_colors[row] = color
+            self.gallery_signatures[row] = self.signatures[slot]
+            self.gallery_positions[row] = position
+            self.gallery_lost_at[row] = frame_index
+
+    def recover(self, colors, signatures, positions, frame_index):
+        """
+        Match new detections against the gallery. Matched entries leave the gallery.
+        :param colors: Color label of each detection.
+        :param signatures: (n, bins) signatures of the detections.
+        :param positions: (n, 2) array of detected positions.
+        :param frame_index: Current frame number.
+        :return: Recovered track ID per detection, -1 where none matched.
+        """
+        recovered = np.full(len(colors), -1, np.int64)
+        self.gallery_active &= frame_index - self.gallery_lost_at <= self.max_lost_frames
+        rows = np.flatnonzero(self.gallery_active)
+        if not len(rows) or not len(colors):
+            return recovered
+
+        # Bhattacharyya coefficient of every detection / lost track pair
+        similarity = signatures @ self.gallery_signatures[rows].T
+        gallery_colors = np.array([self.gallery_colors[row] for row in rows.tolist()], dtype=object)
+        allowed = (np.array(colors, dtype=object)[:, None] == gallery_colors[None, :]) & (similarity >= self.min_similarity)
+        if self.max_distance:
+            distances = np.linalg.norm(positions[:, None, :] - self.gallery_positions[rows][None, :, :], axis=2)
+            allowed &= distances <= self.max_distance
+        if not allowed.any():
+            return recovered
+
+        cost = np.where(allowed, 1.0 - similarity, GATED_COST)
+        detections, matches = solve_assignment(cost)
+        valid = allowed[detections, matches]
+        detections, matches = detections[valid], rows[matches[valid]]
+
+        recovered[detections] = self.gallery_ids[matches]
+        self.gallery_active[matches] = False
+        return recovered
@@ -0,0 +1,114 @@
+# Shared memory frame ring for passing frames between processes
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+END = -1  # Sequence number that marks the end of the stream
+HEADER_ALIGN = 64
+
+
+class SharedFrameRing:
+    def __init__(self, shape, slots=4, dtype=np.uint8, context=None):
+        """
+        Fixed size ring of frames in shared memory, for one producer and one
+        consumer process. Frames are written and read in place, so they never
+        pass through a pipe or get pickled. Two semaphores count the free and
+        filled slots, which gives the producer backpressure.
+        :param shape: Shape of every frame, e.g. (1080, 1920, 3).
+        :param slots: Number of frames the ring holds.
+        :param dtype: Data type of the frames.
+        :param context: multiprocessing context the consumer is started from.
+        """
+        if context is None:
+            context = mp.get_context()
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self.free_slots = context.Semaphore(slots)
+        self.filled_slots = context.Semaphore(0)
+
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.header_bytes = -(-slots * 16 // HEADER_ALIGN) * HEADER_ALIGN
+        self.memory = shared_memory.SharedMemory(create=True, size=self.header_bytes + slots * frame_bytes)
+        self.owner = True
+        self._map()
+
+        self.write_index = 0  # Next slot of the producer
+        self.read_index = 0  # Next slot of the consumer
+
+    def __getstate__(self):
+        # Only valid while starting a process, the semaphores cannot be sent any other way
+        return {
+            "shape": self.shape, "dtype": self.dtype.str, "slots": self.slots, "name": self.memory.name,
+            "free_slots": self.free_slots, "filled_slots": self.filled_slots,
+        }
+
+    def __setstate__(self, state):
+        self.shape, self.dtype, self.slots = state["shape"], np.dtype(state["dtype"]), state["slots"]
+        self.free_slots, self.filled_slots = state["free_slots"], state["filled_slots"]
+        self.header_bytes = -(-self.slots * 16 // HEADER_ALIGN) * HEADER_ALIGN
+        # Child processes share the resource tracker of the creator, which unlinks the block
+        self.memory = shared_memory.SharedMemory(name=state["name"])
+        self.owner = False
+        self._map()
+        self.write_index = 0
+        self.read_index = 0
+
+    def _map(self):
+        """
+        Create the numpy views of the header and the frames.
+        """
+        buffer = self.memory.buf
+        self.sequences = np.ndarray((self.slots,), np.int64, buffer, 0)
+        self.timestamps = np.ndarray((self.slots,), np.float64, buffer, self.slots * 8)
+        self.frames = np.ndarray((self.slots,) + self.shape, self.dtype, buffer, self.header_bytes)
+
+    def reserve(self, timeout=None):
+        """
+        Producer: claim the next slot to write a frame into.
+        :param timeout: Seconds to wait for a free slot, None waits forever and 0 never waits.
+        :return: The slot's frame array, or None if the ring stayed full.
+        """
+        if not self.free_slots.acquire(timeout != 0, timeout if timeout else None):
+            return None
+        return self.frames[self.write_index]
+
+    def publish(self, sequence, timestamp):
+        """
+        Producer: hand the reserved slot to the consumer.
+        :param sequence: Frame number, END marks the end of the stream.
+        :param timestamp: Timestamp of the frame in seconds.
+        """
+        self.sequences[self.write_index] = sequence
+        self.timestamps[self.write_index] = timestamp
+        self.write_index = (self.write_index + 1) % self.slots
+        self.filled_slots.release()
+
+    def acquire(self, timeout=None):
+        """
+        Consumer: wait for the next frame. The frame is read in place and must
+        be released before the slot can be written again.
+        :param timeout: Seconds to wait, None waits forever.
+        :return: Tuple of (sequence, timestamp, frame), or None on timeout.
+                 The sequence is END once the stream is over.
+        """
+        if not self.filled_slots.acquire(True, timeout):
+            return None
+        slot = self.read_index
+        return int(self.sequences[slot]), float(self.timestamps[slot]), self.frames[slot]
+
+    def release(self):
+        """
+        Consumer: give the slot of the last acquired frame back to the producer.
+        """
+        self.read_index = (self.read_index + 1) % self.slots
+        self.free_slots.release()
+
+    def close(self):
+        """
+        Detach from the shared memory, and free it if this process created it.
+        """
+        self.sequences = self.timestamps = self.frames = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
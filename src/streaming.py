@@ -0,0 +1,459 @@
+# Live track streaming: an asyncio API over the detector and tracker, and a localhost push server
+#
+# Serve the camera (or a recording) to subscribers from the repository root:
+#   python -m src.main --serve
+#   python -m src.main --serve --input match.mp4
+# Subscribers connect with a WebSocket client to ws://127.0.0.1:8765, or with a
+# plain TCP socket that receives one JSON message per line.
+
+import json
+import time
+import base64
+import struct
+import asyncio
+import hashlib
+import threading
+from src.frame_source import open_source
+from src.detection import BallDetector
+from src.tracking import MultiBallTracker, track_frame
+from src.physics import AdaptiveDetectionInterval
+from src.table_boundary import TableBoundary
+from src.governor import QualityGovernor
+from src.metrics import DISABLED
+
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_CLIENT_FRAME = 1 << 16  # Largest client frame accepted, clients only ever send control frames
+MAX_HEADERS = 100  # Header lines accepted in an upgrade request
+_END = object()  # Posted to the snapshot queue when the source is exhausted
+
+
+class TrackStream:
+    def __init__(self, config, source=0, fps=30.0, queue_size=8, metrics=None):
+        """
+        Run detection and tracking on a thread of its own and hand a snapshot
+        of the tracks after every frame to asyncio code. The capture thread
+        never waits for the event loop: when the consumer falls behind, the
+        oldest queued snapshot is dropped.
+        :param config: Profile configuration (e.g., from load_config).
+        :param source: Camera index, video file or image directory.
+        :param fps: Frame rate used to timestamp image sequences.
+        :param queue_size: Snapshots queued for the consumer.
+        :param metrics: Optional Metrics shared by the detector and the tracker.
+        """
+        self.source = source
+        self.fps = fps
+        self.queue_size = queue_size
+        self.metrics = metrics if metrics is not None else DISABLED
+
+        # Nothing is shown from the capture thread, HighGUI is not thread safe
+        self.detector = BallDetector(dict(config.get("detector", {}), show_masks=False), metrics=metrics)
+        self.tracker = MultiBallTracker(config.get("tracking", {}), metrics=metrics)
+        self.interval = AdaptiveDetectionInterval(**config.get("tracking", {}).get("detection_interval", {}))
+        self.table = TableBoundary(config["table"]) if config.get("table", {}).get("enabled") else None
+        governor_config = config.get("governor", {})
+        self.governor = None
+        if governor_config.get("enabled"):
+            self.governor = QualityGovernor(governor_config, [self.detector], self.tracker, self.interval, metrics)
+
+        self.stop_event = threading.Event()
+        self.dropped = 0
+
+    async def snapshots(self):
+        """
+        Track the source until it is exhausted or the generator is closed.
+        :return: Async generator of {"frame", "timestamp", "tracks"} dictionaries,
+                 tracks as in MultiBallTracker.get_tracks.
+        """
+        loop = asyncio.get_running_loop()
+        snapshots = asyncio.Queue(maxsize=self.queue_size)
+        thread = threading.Thread(target=self._capture_loop, args=(loop, snapshots), name="stream", daemon=True)
+        thread.start()
+        try:
+            while True:
+                snapshot = await snapshots.get()
+                if snapshot is _END:
+                    return
+                yield snapshot
+        finally:
+            self.stop_event.set()
+            await asyncio.to_thread(thread.join, 1.0)
+
+    def _capture_loop(self, loop, snapshots):
+        """
+        Read, detect and track frames, posting a snapshot after each one.
+        """
+        try:
+            for frame_index, timestamp, frame in self._read_source():
+                if self.stop_event.is_set():
+                    break
+                process_start = time.perf_counter()
+                track_frame(frame, self.detector, self.tracker, self.interval, self.table, frame_index, timestamp)
+                if self.governor is not None:
+                    self.governor.update(time.perf_counter() - process_start)
+                snapshot = {"frame": frame_index, "timestamp": round(timestamp, 4), "tracks": self.tracker.get_tracks()}
+                try:
+                    loop.call_soon_threadsafe(self._offer, snapshots, snapshot)
+                except RuntimeError:
+                    break  # The event loop is closed
+        finally:
+            self.tracker.close()
+            try:
+                loop.call_soon_threadsafe(self._offer, snapshots, _END)
+            except RuntimeError:
+                pass
+
+    def _offer(self, snapshots, snapshot):
+        """
+        Queue a snapshot on the event loop, dropping the oldest one when the queue is full.
+        """
+        if snapshots.full():
+            snapshots.get_nowait()
+            self.dropped += 1
+            self.metrics.increment("stream_dropped_total", stage="snapshot")
+        snapshots.put_nowait(snapshot)
+
+    def _read_source(self):
+        """
+        :return: Generator of (frame_index, timestamp, frame) from the configured source.
+        """
+        try:
+            source = open_source(self.source, self.fps)
+        except IOError as error:
+            print(error)
+            return
+        with source:
+            yield from source
+
+
+async def stream_tracks(config, source=0, fps=30.0, queue_size=8, metrics=None):
+    """
+    Track a source and yield a snapshot of the tracks after every frame.
+    See TrackStream for the parameters.
+    :return: Async generator of {"frame", "timestamp", "tracks"} dictionaries.
+    """
+    async for snapshot in TrackStream(config, source, fps, queue_size, metrics).snapshots():
+        yield snapshot
+
+
+def diff_tracks(sent, tracks, min_move=1.0):
+    """
+    Find the tracks that changed since they were last sent.
+    :param sent: {track ID: track} as last sent to the subscribers.
+    :param tracks: Current tracks, as in MultiBallTracker.get_tracks.
+    :param min_move: Pixels a ball has to move before it is sent again.
+    :return: Tuple of (new or changed tracks, IDs of the tracks that ended).
+    """
+    moved = []
+    for track in tracks:
+        previous = sent.get(track["id"])
+        if previous is not None and previous["radius"] == track["radius"] and previous["color"] == track["color"]:
+            (x, y), (px, py) = track["position"], previous["position"]
+            if (x - px) ** 2 + (y - py) ** 2 < min_move ** 2:
+                continue
+        moved.append(track)
+
+    current = {track["id"] for track in tracks}
+    removed = [track_id for track_id in sent if track_id not in current]
+    return moved, removed
+
+
+class Subscriber:
+    def __init__(self, writer, websocket, queue_size=8):
+        """
+        A connected client and the messages queued for it.
+        :param writer: asyncio StreamWriter of the connection.
+        :param websocket: Frame the messages as WebSocket text frames instead of lines.
+        :param queue_size: Messages queued before the client counts as too slow.
+        """
+        self.writer = writer
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.resync = True  # The next message has to be a keyframe
+        self.dropped = 0
+
+    def offer(self, delta, keyframe):
+        """
+        Queue the next message without waiting. A client that cannot keep up
+        loses its queued deltas and gets a single keyframe in their place.
+        :param delta: Encoded delta message, None when nothing changed.
+        :param keyframe: Callable returning the encoded keyframe message.
+        :return: True if the client had fallen behind.
+        """
+        behind = self.queue.full()
+        if behind:
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.resync = True
+
+        if self.resync:
+            self.queue.put_nowait(keyframe())
+            self.resync = False
+        elif delta is not None:
+            self.queue.put_nowait(delta)
+        return behind
+
+
+class TrackServer:
+    def __init__(self, host="127.0.0.1", port=8765, queue_size=8, min_move=1.0, handshake_timeout=0.5, metrics=None):
+        """
+        Push track updates to any number of local subscribers. A subscriber
+        first receives a keyframe holding every track, then deltas holding
+        only the balls that moved and the IDs of tracks that ended. Every
+        subscriber has a bounded queue and its own writer task, so a slow
+        client only ever delays itself.
+        :param host: Interface to listen on, localhost by default.
+        :param port: Port to listen on, 0 picks a free one.
+        :param queue_size: Messages queued per subscriber.
+        :param min_move: Pixels a ball has to move before it is sent again.
+        :param handshake_timeout: Seconds to wait for a WebSocket upgrade
+                                  request before treating the client as plain TCP.
+        :param metrics: Optional Metrics counting subscribers and dropped messages.
+        """
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.min_move = min_move
+        self.handshake_timeout = handshake_timeout
+        self.metrics = metrics if metrics is not None else DISABLED
+
+        self.server = None
+        self.subscribers = set()
+        self.handlers = set()  # Connection tasks, waited for on close
+        self.sent = {}  # {track ID: track} as last sent, so small moves never add up unseen
+        self.last = None  # Latest snapshot, the source of keyframes
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"Streaming tracks on {self.host}:{self.port}")
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        # Aborted rather than closed, a stalled client would keep its unsent data waiting forever
+        for subscriber in list(self.subscribers):
+            subscriber.writer.transport.abort()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+
+    async def serve(self, snapshots):
+        """
+        Publish every snapshot of an async iterable, e.g. TrackStream.snapshots().
+        """
+        async for snapshot in snapshots:
+            self.publish(snapshot)
+
+    def publish(self, snapshot):
+        """
+        Hand a snapshot to every subscriber. Never waits on a client.
+        :param snapshot: {"frame", "timestamp", "tracks"} dictionary.
+        """
+        moved, removed = diff_tracks(self.sent, snapshot["tracks"], self.min_move)
+        for track in moved:
+            self.sent[track["id"]] = track
+        for track_id in removed:
+            del self.sent[track_id]
+        self.last = snapshot
+
+        delta = None
+        if moved or removed:
+            delta = self._encode({"type": "delta", "frame": snapshot["frame"], "timestamp": snapshot["timestamp"],
+                                  "moved": moved, "removed": removed})
+
+        # Keyframes are only encoded for subscribers that need one
+        encoded = []
+
+        def keyframe():
+            if not encoded:
+                encoded.append(self._keyframe())
+            return encoded[0]
+
+        for subscriber in self.subscribers:
+            if subscriber.offer(delta, keyframe):
+                self.metrics.increment("stream_dropped_total", stage="subscriber")
+
+    def _keyframe(self):
+        """
+        :return: Encoded keyframe holding the tracks as last sent.
+        """
+        snapshot = self.last or {"frame": None, "timestamp": None}
+        return self._encode({"type": "keyframe", "frame": snapshot["frame"], "timestamp": snapshot["timestamp"],
+                             "tracks": list(self.sent.values())})
+
+    @staticmethod
+    def _encode(message):
+        return json.dumps(message, separators=(",", ":")).encode()
+
+    async def _handle(self, reader, writer):
+        """
+        Serve one connection until the client leaves or the server closes.
+        """
+        self.handlers.add(asyncio.current_task())
+        try:
+            await self._serve_connection(reader, writer)
+        except ConnectionError:
+            writer.transport.abort()  # Lost during the handshake
+        finally:
+            self.handlers.discard(asyncio.current_task())
+
+    async def _serve_connection(self, reader, writer):
+        websocket = await self._handshake(reader, writer)
+        if websocket is None:
+            writer.close()
+            return
+
+        subscriber = Subscriber(writer, websocket, self.queue_size)
+        self.subscribers.add(subscriber)
+        self.metrics.set("stream_subscribers", len(self.subscribers))
+        if self.last is not None:
+            subscriber.offer(None, self._keyframe)
+
+        sender = asyncio.create_task(self._send_loop(subscriber))
+        try:
+            # Incoming data is only read to notice when the client leaves
+            if websocket:
+                await self._read_websocket(reader, writer)
+            else:
+                while await reader.read(4096):
+                    pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            sender.cancel()
+            self.subscribers.discard(subscriber)
+            self.metrics.set("stream_subscribers", len(self.subscribers))
+            writer.close()
+
+    async def _handshake(self, reader, writer):
+        """
+        Upgrade the connection if the client opens with a WebSocket request.
+        :return: True for a WebSocket, False for plain TCP, None for a rejected request.
+        """
+        try:
+            line = await asyncio.wait_for(reader.readline(), self.handshake_timeout)
+        except asyncio.TimeoutError:
+            return False
+        except (ValueError, asyncio.LimitOverrunError):
+            return None  # A line longer than the stream limit
+        if not line.startswith(b"GET "):
+            return False
+
+        try:
+            headers = await asyncio.wait_for(self._read_headers(reader), self.handshake_timeout)
+        except asyncio.TimeoutError:
+            return None  # A client that stalls mid-request is dropped
+        except (ValueError, asyncio.LimitOverrunError):
+            return None  # A header line longer than the stream limit
+
+        key = headers.get("sec-websocket-key") if headers is not None else None
+        if key is None:
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return None
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WEBSOCKET_GUID).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        await writer.drain()
+        return True
+
+    @staticmethod
+    async def _read_headers(reader):
+        """
+        :return: {lower case name: value} of the request headers, or None when there are too many.
+        """
+        headers = {}
+        for _ in range(MAX_HEADERS):
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                return headers
+            name, _, value = header.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return None
+
+    @staticmethod
+    async def _read_websocket(reader, writer):
+        """
+        Read client frames until a close frame or the end of the connection,
+        answering pings. A frame longer than MAX_CLIENT_FRAME closes the connection.
+        """
+        while True:
+            first, second = await reader.readexactly(2)
+            opcode, length = first & 0x0F, second & 0x7F
+            if length == 126:
+                length, = struct.unpack(">H", await reader.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack(">Q", await reader.readexactly(8))
+            if length > MAX_CLIENT_FRAME:
+                writer.write(_websocket_frame(struct.pack(">H", 1009), 0x8))  # Message too big
+                await writer.drain()
+                return
+            mask = await reader.readexactly(4) if second & 0x80 else None
+            payload = await reader.readexactly(length)
+            if mask is not None:
+                payload = _unmask(payload, mask)
+
+            if opcode == 0x8:
+                writer.write(_websocket_frame(payload[:2], 0x8))
+                await writer.drain()
+                return
+            if opcode == 0x9:
+                writer.write(_websocket_frame(payload, 0xA))
+
+    @staticmethod
+    async def _send_loop(subscriber):
+        """
+        Write the queued messages of one subscriber, waiting on that client only.
+        """
+        try:
+            while True:
+                message = await subscriber.queue.get()
+                if subscriber.websocket:
+                    subscriber.writer.write(_websocket_frame(message))
+                else:
+                    subscriber.writer.write(message + b"\n")
+                await subscriber.writer.drain()
+        except ConnectionError:
+            subscriber.writer.close()
+
+
+def _unmask(payload, mask):
+    """
+    :return: The payload XORed with the repeated 4 byte mask, as one big integer operation.
+    """
+    length = len(payload)
+    repeated = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(length, "big")
+
+
+def _websocket_frame(payload, opcode=0x1):
+    """
+    :return: An unmasked, unfragmented server frame, a text frame by default.
+    """
+    length = len(payload)
+    if length < 126:
+        header = struct.pack(">BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack(">BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def serve_tracks(stream, streaming_config, metrics=None):
+    """
+    Push the tracks of a stream to subscribers until its source is exhausted.
+    :param stream: TrackStream to publish.
+    :param streaming_config: The streaming configuration dictionary (e.g., config["streaming"])
+    :param metrics: Optional Metrics counting subscribers and dropped messages.
+    """
+    server = TrackServer(streaming_config.get("host", "127.0.0.1"), streaming_config.get("port", 8765),
+                         streaming_config.get("queue_size", 8), streaming_config.get("min_move", 1.0),
+                         streaming_config.get("handshake_timeout", 0.5), metrics)
+    await server.start()
+    try:
+        await server.serve(stream.snapshots())
+    finally:
+        await server.close()
+        if stream.dropped:
+            print(f"Dropped {stream.dropped} snapshots the server could not keep up with.")
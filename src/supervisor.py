@@ -0,0 +1,358 @@
+# Multi-table supervisor: capture per table, detection and tracking in worker processes
+#
+# Run from the repository root, one --table per camera or recording:
+#   python -m src.supervisor --table left=0 --table right=videos/right.mp4@bright --output venue.jsonl
+
+import os
+import time
+import queue
+import argparse
+import threading
+import multiprocessing as mp
+import cv2 as cv
+from src.batch import iter_frames, TrackWriter
+from src.detection import BallDetector
+from src.tracking import MultiBallTracker, track_frame
+from src.physics import AdaptiveDetectionInterval
+from src.table_boundary import TableBoundary
+from src.shared_ring import SharedFrameRing, END
+from config.config import load_config
+
+
+def run_worker(tables, results, cpus=None, opencv_threads=0):
+    """
+    Worker process: detect and track the frames of one or more tables,
+    reading them in place from their shared memory rings.
+    :param tables: List of (name, SharedFrameRing, profile configuration).
+    :param results: Queue receiving (table, sequence, timestamp, tracks, seconds) per frame.
+    :param cpus: Optional CPUs to pin the process to.
+    :param opencv_threads: OpenCV threads per worker, 0 keeps the OpenCV default.
+    """
+    if cpus is not None:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cpus)
+        else:
+            print("CPU pinning is not supported on this platform, ignoring cpu_affinity.")
+    if opencv_threads:
+        cv.setNumThreads(opencv_threads)
+
+    states = []
+    for name, ring, config in tables:
+        tracker_config = dict(config.get("tracking", {}))
+        if tracker_config.get("log_path"):
+            # A track log per table, the tables would overwrite a shared one
+            root, extension = os.path.splitext(tracker_config["log_path"])
+            tracker_config["log_path"] = f"{root}_{name}{extension}"
+        states.append({
+            "name": name,
+            "ring": ring,
+            "detector": BallDetector(dict(config.get("detector", {}), show_masks=False)),
+            "tracker": MultiBallTracker(tracker_config),
+            "interval": AdaptiveDetectionInterval(**tracker_config.get("detection_interval", {})),
+            "table": TableBoundary(config["table"]) if config.get("table", {}).get("enabled") else None,
+        })
+
+    active = list(states)
+    while active:
+        # Wait on the only ring, or poll every ring when serving several tables
+        timeout = 0.1 if len(active) == 1 else 0
+        idle = True
+        for state in list(active):
+            item = state["ring"].acquire(timeout)
+            if item is None:
+                continue
+            idle = False
+
+            sequence, timestamp, frame = item
+            if sequence == END:
+                state["ring"].release()
+                active.remove(state)
+                results.put((state["name"], END, timestamp, None, 0.0))
+                continue
+
+            start = time.perf_counter()
+            track_frame(frame, state["detector"], state["tracker"], state["interval"], state["table"], sequence, timestamp)
+            tracks = state["tracker"].get_tracks()
+            state["ring"].release()  # The frame is no longer read after this point
+            results.put((state["name"], sequence, timestamp, tracks, time.perf_counter() - start))
+
+        if idle and len(active) > 1:
+            time.sleep(0.001)
+
+    for state in states:
+        state["tracker"].close()
+        state["ring"].close()
+
+
+class Supervisor:
+    def __init__(self, tables, config):
+        """
+        Run one detector / tracker per table in a pool of worker processes.
+        A capture thread per table writes frames into a shared memory ring
+        that the table's worker reads in place, and the tracks of every table
+        are merged into one stream.
+        :param tables: List of (name, source, profile configuration), the
+                       source being a camera index, video file or image directory.
+        :param config: Supervisor settings (e.g., config["supervisor"]).
+        """
+        self.tables = tables
+        self.num_workers = min(config.get("workers", 0) or len(tables), len(tables))
+        self.cpu_affinity = config.get("cpu_affinity", [])  # CPU list per worker, reused round robin
+        self.opencv_threads = config.get("opencv_threads", 1)
+        self.ring_slots = config.get("ring_slots", 4)
+
+        self.context = mp.get_context("spawn")  # No OpenCV state is inherited by the workers
+        self.results = self.context.Queue()
+        self.stop_event = threading.Event()
+        self.rings = {}
+        self.processes = []
+        self.threads = []
+        self.stats = {name: {"captured": 0, "dropped": 0, "processed": 0, "busy": 0.0} for name, _, _ in tables}
+
+    def start(self):
+        """
+        Open every source, create the rings and start the workers and capture threads.
+        """
+        sources = {}
+        for name, source, _ in self.tables:
+            sources[name] = self._open(source)
+            first_frame = sources[name][2]
+            self.rings[name] = SharedFrameRing(first_frame.shape, self.ring_slots, first_frame.dtype, self.context)
+
+        # Tables are dealt out to the workers round robin
+        for index in range(self.num_workers):
+            assigned = [(name, self.rings[name], config) for name, _, config in self.tables[index::self.num_workers]]
+            cpus = None
+            if self.cpu_affinity:
+                cpus = self.cpu_affinity[index % len(self.cpu_affinity)]
+                cpus = [cpus] if isinstance(cpus, int) else list(cpus)  # A bare CPU pins the worker to that one
+            process = self.context.Process(target=run_worker, name=f"table-worker-{index}",
+                                           args=(assigned, self.results, cpus, self.opencv_threads), daemon=True)
+            process.start()
+            self.processes.append(process)
+
+        for name, (camera, frames, first_frame) in sources.items():
+            if camera is not None:
+                target, args = self._capture_camera, (name, camera, first_frame)
+            else:
+                target, args = self._capture_frames, (name, frames, first_frame)
+            thread = threading.Thread(target=target, args=args, name=f"capture-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def run(self, writer=None, stats_interval=5.0):
+        """
+        Merge the tracks of all tables until every source is exhausted.
+        :param writer: Optional TrackWriter created with tables=True.
+        :param stats_interval: Seconds between throughput reports, 0 disables them.
+        """
+        remaining = set(self.rings)
+        started = last_stats = time.monotonic()
+        last_counts = {name: 0 for name in self.rings}
+
+        while remaining and not self.stop_event.is_set():
+            try:
+                name, sequence, timestamp, tracks, seconds = self.results.get(timeout=0.1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in self.processes):
+                    print("All table workers exited, stopping.")
+                    break
+                continue
+
+            if sequence == END:
+                remaining.discard(name)
+            else:
+                stats = self.stats[name]
+                stats["processed"] += 1
+                stats["busy"] += seconds
+                if writer is not None:
+                    writer.write(sequence, timestamp, tracks, table=name)
+
+            now = time.monotonic()
+            if stats_interval and now - last_stats >= stats_interval:
+                self.report(now - last_stats, last_counts)
+                last_counts = {name: stats["processed"] for name, stats in self.stats.items()}
+                last_stats = now
+
+        self.report(time.monotonic() - started)
+
+    def report(self, elapsed, since=None):
+        """
+        Print the throughput of every table.
+        :param elapsed: Seconds the report covers.
+        :param since: Frames processed per table at the start of the period, all frames when omitted.
+        """
+        for name, stats in self.stats.items():
+            processed = stats["processed"] - (since or {}).get(name, 0)
+            busy_ms = 1000 * stats["busy"] / max(stats["processed"], 1)
+            print(f"[{name}] {processed / max(elapsed, 1e-9):.1f} fps, {busy_ms:.1f} ms per frame, "
+                  f"{stats['processed']}/{stats['captured']} frames processed, {stats['dropped']} dropped")
+
+    def stop(self):
+        """
+        Stop capturing, wait for the workers and free the shared memory.
+        """
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+        for process in self.processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        for ring in self.rings.values():
+            ring.close()
+
+    def _open(self, source):
+        """
+        Open a source and read its first frame, which sets the ring's frame size.
+        :return: Tuple of (camera or None, frame generator or None, first frame).
+        """
+        if isinstance(source, int):
+            camera = cv.VideoCapture(source)
+            ret, frame = camera.read() if camera.isOpened() else (False, None)
+            if not ret:
+                raise IOError(f"Cannot read from camera {source}")
+            return camera, None, frame
+
+        frames = iter_frames(source, reuse_buffer=True)
+        first = next(frames, None)
+        if first is None:
+            raise IOError(f"No frames in {source}")
+        return None, frames, first[2]
+
+    def _reserve(self, ring):
+        """
+        Wait for a free slot until the supervisor stops.
+        :return: The slot's frame array, or None when stopping.
+        """
+        while not self.stop_event.is_set():
+            slot = ring.reserve(timeout=0.1)
+            if slot is not None:
+                return slot
+        return None
+
+    def _capture_camera(self, name, camera, first_frame):
+        """
+        Read a camera straight into the ring. A live camera is never waited
+        for: when the worker falls behind, frames are grabbed and dropped.
+        """
+        ring, stats = self.rings[name], self.stats[name]
+        start = time.monotonic()
+        sequence = 0
+        try:
+            slot = self._reserve(ring)
+            if slot is None:
+                return
+            slot[:] = first_frame
+            ring.publish(sequence, 0.0)
+            stats["captured"] += 1
+
+            while not self.stop_event.is_set():
+                slot = ring.reserve(timeout=0)
+                if slot is None:
+                    # Ring is full, keep the camera from lagging behind by discarding a frame
+                    if not camera.grab():
+                        break
+                    stats["dropped"] += 1
+                    continue
+
+                ret, frame = camera.read(image=slot)
+                if not ret or frame is not slot:
+                    if ret:
+                        print(f"[{name}] Frame size changed, stopping the table.")
+                    ring.publish(END, 0.0)  # The reserved slot carries the end marker instead
+                    return
+                sequence += 1
+                ring.publish(sequence, time.monotonic() - start)
+                stats["captured"] += 1
+            self._finish(ring)
+        finally:
+            camera.release()
+
+    def _capture_frames(self, name, frames, first_frame):
+        """
+        Copy the frames of a recording into the ring, waiting for the worker
+        so no frame is lost.
+        """
+        ring, stats = self.rings[name], self.stats[name]
+        slot = self._reserve(ring)
+        if slot is None:
+            return
+        slot[:] = first_frame
+        ring.publish(0, 0.0)
+        stats["captured"] += 1
+
+        for sequence, timestamp, frame in frames:
+            slot = self._reserve(ring)
+            if slot is None:
+                return
+            if frame.shape != slot.shape:
+                print(f"[{name}] Frame size changed, stopping the table.")
+                ring.publish(END, 0.0)
+                return
+            slot[:] = frame
+            ring.publish(sequence, timestamp)
+            stats["captured"] += 1
+        self._finish(ring)
+
+    def _finish(self, ring):
+        """
+        Publish the end of a stream, unless the supervisor is stopping anyway.
+        """
+        if self._reserve(ring) is not None:
+            ring.publish(END, 0.0)
+
+
+def parse_table(spec, default_profile):
+    """
+    Parse a --table argument of the form name=source[@profile].
+    :return: Tuple of (name, source, profile name), the source as an int for cameras.
+    """
+    name, separator, source = spec.partition("=")
+    if not separator or not name or not source:
+        raise ValueError(f"Invalid table '{spec}', expected name=source[@profile]")
+    source, _, profile = source.partition("@")
+    return name, int(source) if source.isdigit() else source, profile or default_profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Track several tables at once, one worker process per table.")
+    parser.add_argument("--table", action="append", required=True,
+                        help="Table as name=source[@profile], the source a camera index, video file or image directory")
+    parser.add_argument("--profile", default="default", help="Profile for tables without one, and for the supervisor settings")
+    parser.add_argument("--output", default=None, help="Merged track output file, .jsonl or .csv")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, defaults to one per table")
+    args = parser.parse_args()
+
+    base_config = load_config(args.profile)
+    if base_config is None:
+        print("Error: Profile configuration could not be loaded.")
+        return
+    supervisor_config = dict(base_config.get("supervisor", {}))
+    if args.workers is not None:
+        supervisor_config["workers"] = args.workers
+
+    tables = []
+    for spec in args.table:
+        name, source, profile = parse_table(spec, args.profile)
+        config = base_config if profile == args.profile else load_config(profile)
+        if config is None:
+            print(f"Error: Profile '{profile}' of table '{name}' could not be loaded.")
+            return
+        tables.append((name, source, config))
+
+    supervisor = Supervisor(tables, supervisor_config)
+    writer = TrackWriter(args.output, tables=True) if args.output else None
+    supervisor.start()
+    try:
+        supervisor.run(writer, supervisor_config.get("stats_interval", 5.0))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
+        if writer is not None:
+            writer.close()
+
+
+if __name__ == "__main__":
+    main()
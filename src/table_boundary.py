@@ -1 +1,115 @@
-# Table boundary detection
\ No newline at end of file
+# Table boundary detection
+import time
+import cv2 as cv
+import numpy as np
+from src.util import get_limits, grab_contours
+
+
+class TableBoundary:
+    def __init__(self, config):
+        """
+        Find the playing surface from the cloth color and cache it as a crop
+        rectangle plus mask, so detection only runs inside the table.
+        :param config: The table configuration dictionary (e.g., from load_config)
+        """
+        self.config = config
+        self.cloth_lower, self.cloth_upper = get_limits(config["cloth"])
+        self.margin = config.get("margin", 10)  # Pixels kept around the cloth for balls on the cushion
+        self.min_area = config.get("min_area", 0.2)  # Smallest table, as a fraction of the frame
+        self.min_coverage = config.get("min_coverage", 0.6)  # Cloth fraction under which the ROI is stale
+        self.revalidate_seconds = config.get("revalidate_seconds", 5.0)
+
+        self.polygon = None
+        self.roi = None  # (rect, mask) with rect as (x0, y0, x1, y1)
+        self.last_validated = None
+
+    def update(self, frame, now=None):
+        """
+        Return the cached table ROI, finding it first if needed and re-validating
+        it every few seconds in case the camera was moved.
+        :param frame: Input image frame.
+        :param now: Current time in seconds, defaults to time.monotonic().
+        :return: Tuple of (rect, mask), or None if no table is visible.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        # Searching is also rate limited while no table is visible
+        if self.last_validated is None or now - self.last_validated >= self.revalidate_seconds:
+            if self.roi is None:
+                self.detect(frame)
+            elif not self.validate(frame):
+                print("Table boundary moved, detecting it again.")
+                self.detect(frame)
+            self.last_validated = now
+
+        return self.roi
+
+    def reset(self):
+        """
+        Forget the cached boundary so the next update detects it again.
+        """
+        self.polygon = None
+        self.roi = None
+        self.last_validated = None
+
+    def detect(self, frame):
+        """
+        Find the table as the convex hull of the largest cloth-colored region.
+        :param frame: Input image frame.
+        :return: True if a table was found.
+        """
+        hsv_frame = cv.cvtColor(frame, cv.COLOR_BGR2HSV)
+        cloth = cv.inRange(hsv_frame, self.cloth_lower, self.cloth_upper)
+        cloth = cv.morphologyEx(cloth, cv.MORPH_CLOSE, np.ones((15, 15), np.uint8))
+
+        contours = grab_contours(cv.findContours(cloth, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE))
+        height, width = frame.shape[:2]
+        if not contours:
+            self.polygon, self.roi = None, None
+            return False
+
+        # Balls leave holes in the cloth, the hull closes them
+        largest = max(contours, key=cv.contourArea)
+        if cv.contourArea(largest) < self.min_area * height * width:
+            self.polygon, self.roi = None, None
+            return False
+
+        hull = cv.convexHull(largest)
+        self.polygon = cv.approxPolyDP(hull, 0.01 * cv.arcLength(hull, True), True)
+
+        # Crop rectangle around the polygon, grown by the margin
+        x, y, w, h = cv.boundingRect(self.polygon)
+        x0, y0 = max(x - self.margin, 0), max(y - self.margin, 0)
+        x1, y1 = min(x + w + self.margin, width), min(y + h + self.margin, height)
+
+        mask = np.zeros((y1 - y0, x1 - x0), np.uint8)
+        cv.fillPoly(mask, [self.polygon], 255, offset=(-x0, -y0))
+        if self.margin > 0:
+            size = 2 * self.margin + 1
+            mask = cv.dilate(mask, cv.getStructuringElement(cv.MORPH_ELLIPSE, (size, size)))
+
+        self.roi = ((x0, y0, x1, y1), mask)
+        return True
+
+    def validate(self, frame, step=8):
+        """
+        Cheaply check that the cached ROI still covers the cloth by sampling
+        a sparse grid of pixels inside it.
+        :param frame: Input image frame.
+        :param step: Sampling stride in pixels.
+        :return: True if enough of the ROI is still cloth.
+        """
+        if self.roi is None:
+            return False
+
+        (x0, y0, x1, y1), mask = self.roi
+        samples = np.ascontiguousarray(frame[y0:y1:step, x0:x1:step])
+        inside = mask[::step, ::step] > 0
+        if not inside.any():
+            return False
+
+        cloth = cv.inRange(cv.cvtColor(samples, cv.COLOR_BGR2HSV), self.cloth_lower, self.cloth_upper) > 0
+        coverage = np.count_nonzero(cloth & inside) / np.count_nonzero(inside)
+
+        return coverage >= self.min_coverage
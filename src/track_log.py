@@ -0,0 +1,291 @@
+# Binary track log: fixed size records plus a frame index, read back through memory maps
+#
+# Summarize a log, or time replaying it through draw_tracks, from the repository root:
+#   python -m src.track_log session.trk
+#   python -m src.track_log session.trk --replay --start 1000 --stop 2000 --output clip.avi
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+MAGIC = b"POOLTRK1"
+HEADER_BYTES = 4096  # Fixed header, rewritten in place when a new color appears
+RECORD_DTYPE = np.dtype([("id", "<i4"), ("x", "<f4"), ("y", "<f4"), ("radius", "<f4"), ("color", "u1"), ("missed", "u1")])
+INDEX_DTYPE = np.dtype([("frame", "<i8"), ("timestamp", "<f8"), ("start", "<i8"), ("count", "<i4")])
+
+
+class TrackLogWriter:
+    def __init__(self, path, flush_frames=30):
+        """
+        Append the track state of every frame to a binary log. Each track is
+        a fixed size record, and an index file beside the log maps every
+        frame to its timestamp and first record.
+        :param path: Log file path, the index is written to path + ".idx".
+        :param flush_frames: Frames between flushes, so the log can be read while it grows.
+        """
+        self.path = path
+        self.flush_frames = flush_frames
+        self.file = open(path, "wb")
+        self.index_file = open(path + ".idx", "wb")
+        self.colors = []  # Color names, a record stores the position in this list
+        self.color_codes = {}
+        self.records = 0
+        self.frames = 0
+        self._write_header()
+
+    def append(self, frame_index, timestamp, ids, positions, radii, colors, missed):
+        """
+        Append the tracks of one frame.
+        :param frame_index: Frame number.
+        :param timestamp: Timestamp of the frame in seconds.
+        :param ids: Track IDs.
+        :param positions: (n, 2) array of track positions.
+        :param radii: Radius of each track.
+        :param colors: Color name of each track.
+        :param missed: Frames each track has gone undetected.
+        """
+        records = np.empty(len(ids), RECORD_DTYPE)
+        records["id"] = ids
+        records["x"], records["y"] = positions[:, 0], positions[:, 1]
+        records["radius"] = radii
+        records["color"] = [self._color_code(color) for color in colors]
+        records["missed"] = np.minimum(missed, 255)
+        self.file.write(records.tobytes())
+
+        entry = np.array([(frame_index, timestamp, self.records, len(ids))], INDEX_DTYPE)
+        self.index_file.write(entry.tobytes())
+        self.records += len(ids)
+        self.frames += 1
+
+        if self.frames % self.flush_frames == 0:
+            self.flush()
+
+    def flush(self):
+        # Records first, so an index entry never points past the end of the log
+        self.file.flush()
+        self.index_file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        self.index_file.close()
+
+    def _color_code(self, color):
+        """
+        :return: Code of a color name, registering it in the header if it is new.
+        """
+        code = self.color_codes.get(color)
+        if code is None:
+            if len(self.colors) == 255:
+                raise ValueError("A track log can hold at most 255 colors.")
+            code = self.color_codes[color] = len(self.colors)
+            self.colors.append(color)
+            self._write_header()
+        return code
+
+    def _write_header(self):
+        metadata = json.dumps({"version": 1, "colors": self.colors}).encode()
+        if len(MAGIC) + 4 + len(metadata) > HEADER_BYTES:
+            raise ValueError("Track log header is full.")
+        header = MAGIC + len(metadata).to_bytes(4, "little") + metadata
+        position = self.file.tell()
+        self.file.seek(0)
+        self.file.write(header.ljust(HEADER_BYTES, b"\0"))
+        if position:
+            self.file.seek(position)
+
+
+class TrackLog:
+    def __init__(self, path):
+        """
+        Read a track log through memory maps. Nothing is parsed up front, the
+        frame and trajectory queries return views into the mapped files.
+        :param path: Log file written by TrackLogWriter.
+        """
+        with open(path, "rb") as log_file:
+            header = log_file.read(HEADER_BYTES)
+        if not header.startswith(MAGIC):
+            raise ValueError(f"{path} is not a track log.")
+        length = int.from_bytes(header[len(MAGIC):len(MAGIC) + 4], "little")
+        self.metadata = json.loads(header[len(MAGIC) + 4:len(MAGIC) + 4 + length])
+        self.colors = self.metadata["colors"]
+
+        # A log that is still being written may end in a partial record
+        self.index = _map(path + ".idx", INDEX_DTYPE, 0)
+        self.records = _map(path, RECORD_DTYPE, HEADER_BYTES)
+        complete = np.flatnonzero(self.index["start"] + self.index["count"] <= len(self.records))
+        self.index = self.index[:complete[-1] + 1 if len(complete) else 0]
+
+    def __len__(self):
+        return len(self.index)
+
+    def frame_span(self, start=None, stop=None):
+        """
+        :param start: First frame number, defaults to the first logged frame.
+        :param stop: Frame number to stop before, defaults to after the last one.
+        :return: Tuple of (first, end) positions in the index.
+        """
+        frames = self.index["frame"]
+        first = 0 if start is None else int(np.searchsorted(frames, start))
+        end = len(frames) if stop is None else int(np.searchsorted(frames, stop))
+        return first, end
+
+    def time_span(self, start=None, stop=None):
+        """
+        :param start: First timestamp in seconds.
+        :param stop: Timestamp to stop before.
+        :return: Tuple of (first, end) positions in the index.
+        """
+        timestamps = self.index["timestamp"]
+        first = 0 if start is None else int(np.searchsorted(timestamps, start))
+        end = len(timestamps) if stop is None else int(np.searchsorted(timestamps, stop))
+        return first, end
+
+    def frames(self, start=None, stop=None):
+        """
+        Get a range of frames.
+        :param start: First frame number.
+        :param stop: Frame number to stop before.
+        :return: Tuple of (index entries, records) as views of the mapped files.
+        """
+        return self._span(*self.frame_span(start, stop))
+
+    def between(self, start=None, stop=None):
+        """
+        Get the frames within a time range.
+        :param start: First timestamp in seconds.
+        :param stop: Timestamp to stop before.
+        :return: Tuple of (index entries, records) as views of the mapped files.
+        """
+        return self._span(*self.time_span(start, stop))
+
+    def frame(self, frame_index):
+        """
+        :return: Records of a single frame, empty if the frame was not logged.
+        """
+        _, records = self.frames(frame_index, frame_index + 1)
+        return records
+
+    def trajectory(self, ball_id, start=None, stop=None):
+        """
+        Get the path of one ball.
+        :param ball_id: Track ID of the ball.
+        :param start: First frame number.
+        :param stop: Frame number to stop before.
+        :return: Dictionary of frame numbers, timestamps, (n, 2) positions,
+                 radii and missed counts, one entry per frame the ball was tracked.
+        """
+        first, end = self.frame_span(start, stop)
+        entries, records = self._span(first, end)
+        rows = np.flatnonzero(records["id"] == ball_id)
+        if len(entries):
+            rows_in_file = rows + entries["start"][0]
+            frame_rows = np.searchsorted(entries["start"], rows_in_file, side="right") - 1
+        else:
+            frame_rows = rows
+        matched = records[rows]
+
+        return {
+            "frame": entries["frame"][frame_rows],
+            "timestamp": entries["timestamp"][frame_rows],
+            "position": np.stack([matched["x"], matched["y"]], axis=1),
+            "radius": matched["radius"],
+            "missed": matched["missed"],
+        }
+
+    def _span(self, first, end):
+        """
+        :return: Index entries first .. end - 1 and all of their records.
+        """
+        entries = self.index[first:end]
+        if not len(entries):
+            return entries, self.records[:0]
+        return entries, self.records[entries["start"][0]:entries["start"][-1] + entries["count"][-1]]
+
+
+def replay(log, tracker, start=None, stop=None):
+    """
+    Restore a tracker to every logged frame in turn, so the caller can draw it.
+    Replay starts buffer_size frames early so the trails are complete.
+    :param log: TrackLog to replay.
+    :param tracker: MultiBallTracker to restore.
+    :param start: First frame number to yield.
+    :param stop: Frame number to stop before.
+    :return: Generator of (frame number, timestamp) after each restored frame.
+    """
+    first, end = log.frame_span(start, stop)
+    warm_up = max(first - tracker.buffer_size, 0)
+    entries = log.index[warm_up:end]
+    colors = np.array(log.colors + [None], dtype=object)
+
+    for position, entry in enumerate(entries):
+        records = log.records[entry["start"]:entry["start"] + entry["count"]]
+        tracker.restore(records["id"], np.stack([records["x"], records["y"]], axis=1).astype(np.float64),
+                        records["radius"], colors[records["color"]].tolist(), records["missed"])
+        if warm_up + position >= first:
+            yield int(entry["frame"]), float(entry["timestamp"])
+
+
+def _map(path, dtype, offset):
+    """
+    Memory map the complete records of a file.
+    :return: Read-only array of records, empty if the file holds none.
+    """
+    count = max(os.path.getsize(path) - offset, 0) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype)
+    return np.memmap(path, dtype, "r", offset=offset, shape=(count,))
+
+
+def main():
+    import cv2 as cv
+    from config.config import load_config
+    from src.tracking import MultiBallTracker
+
+    parser = argparse.ArgumentParser(description="Summarize or replay a binary track log.")
+    parser.add_argument("path", help="Track log written with tracking log_path")
+    parser.add_argument("--replay", action="store_true", help="Replay the tracks through draw_tracks")
+    parser.add_argument("--start", type=int, default=None, help="First frame to replay")
+    parser.add_argument("--stop", type=int, default=None, help="Frame to stop replaying before")
+    parser.add_argument("--size", type=int, nargs=2, default=(1920, 1080), help="Canvas width and height")
+    parser.add_argument("--output", default=None, help="Video file to write the replay to")
+    parser.add_argument("--profile", default="default", help="Profile whose drawing settings are used")
+    args = parser.parse_args()
+
+    log = TrackLog(args.path)
+    if not len(log):
+        print("The log holds no frames.")
+        return
+    ids = np.unique(log.records["id"])
+    print(f"{len(log)} frames, {len(log.records)} track records, {len(ids)} tracks, "
+          f"frames {log.index['frame'][0]}-{log.index['frame'][-1]}, "
+          f"{log.index['timestamp'][-1] - log.index['timestamp'][0]:.1f}s, colors {log.colors}")
+    if not args.replay:
+        return
+
+    tracking_config = dict(load_config(args.profile)["tracking"], log_path="")
+    tracker = MultiBallTracker(tracking_config)
+    width, height = args.size
+    canvas = np.zeros((height, width, 3), np.uint8)
+    writer = None
+    if args.output:
+        writer = cv.VideoWriter(args.output, cv.VideoWriter_fourcc(*"MJPG"), 30.0, (width, height))
+
+    frames = 0
+    start = time.perf_counter()
+    for _ in replay(log, tracker, args.start, args.stop):
+        canvas[:] = 0
+        tracker.draw_tracks(canvas)
+        if writer is not None:
+            writer.write(canvas)
+        frames += 1
+    elapsed = time.perf_counter() - start
+    if writer is not None:
+        writer.release()
+    print(f"Replayed {frames} frames in {elapsed:.2f}s ({frames / max(elapsed, 1e-9):.0f} fps)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# Structure-of-arrays storage for ball tracks
+import numpy as np
+
+
+class TrackView:
+    __slots__ = ("store", "slot")
+
+    def __init__(self, store, slot):
+        """
+        Read-only view of a single track in a TrackStore.
+        :param store: The TrackStore holding the track.
+        :param slot: Index of the track in the store.
+        """
+        self.store = store
+        self.slot = slot
+
+    @property
+    def id(self):
+        return int(self.store.ids[self.slot])
+
+    @property
+    def position(self):
+        return self.store.latest(self.slot)
+
+    @property
+    def positions(self):
+        return self.store.history(self.slot)
+
+    @property
+    def radius(self):
+        return float(self.store.radii[self.slot])
+
+    @property
+    def color(self):
+        return self.store.colors[self.slot]
+
+    @property
+    def missed(self):
+        return int(self.store.missed[self.slot])
+
+    @property
+    def age(self):
+        return int(self.store.ages[self.slot])
+
+
+class TrackStore:
+    def __init__(self, capacity=64, buffer_size=64):
+        """
+        Tracks kept as preallocated arrays, one row (slot) per track, with the
+        position history of every track in a ring buffer. Slots of dropped
+        tracks are reused, so memory stays flat however long the session runs.
+        :param capacity: Number of tracks allocated up front, doubled when exceeded.
+        :param buffer_size: Positions kept in the history of each track.
+        """
+        self.buffer_size = buffer_size
+        self.capacity = capacity
+
+        self.active = np.zeros(capacity, bool)
+        self.ids = np.full(capacity, -1, np.int64)
+        self.trail = np.zeros((capacity, buffer_size, 2))  # Ring buffer of positions
+        self.heads = np.zeros(capacity, np.int64)  # Index of the latest position in the ring
+        self.lengths = np.zeros(capacity, np.int64)  # Number of positions in the ring
+        self.velocities = np.zeros((capacity, 2))  # Last change in position, px / frame
+        self.radii = np.zeros(capacity)
+        self.missed = np.zeros(capacity, np.int64)
+        self.ages = np.zeros(capacity, np.int64)  # Frames since the track started
+        self.colors = [None] * capacity
+
+    def slots(self):
+        """
+        :return: Indices of the live tracks, ordered by track ID.
+        """
+        slots = np.flatnonzero(self.active)
+        return slots[np.argsort(self.ids[slots], kind="stable")]
+
+    def views(self):
+        """
+        :return: A TrackView for every live track, ordered by track ID.
+        """
+        return [TrackView(self, slot) for slot in self.slots()]
+
+    def allocate(self, count):
+        """
+        Find free slots for new tracks, growing the store when it is full.
+        :param count: Number of slots needed.
+        :return: Indices of the free slots.
+        """
+        free = np.flatnonzero(~self.active)
+        if len(free) < count:
+            self._grow(max(2 * self.capacity, self.capacity + count))
+            free = np.flatnonzero(~self.active)
+
+        return free[:count]
+
+    def start(self, slots, ids, positions, radii, colors):
+        """
+        Start new tracks.
+        :param slots: Free slots from allocate().
+        :param ids: Track IDs.
+        :param positions: (n, 2) array of first positions.
+        :param radii: Radius of each track.
+        :param colors: Color of each track.
+        """
+        self.active[slots] = True
+        self.ids[slots] = ids
+        self.heads[slots] = 0
+        self.trail[slots, 0] = positions
+        self.lengths[slots] = 1
+        self.velocities[slots] = 0.0
+        self.radii[slots] = radii
+        self.missed[slots] = 0
+        self.ages[slots] = 0
+        for slot, color in zip(slots.tolist(), colors):
+            self.colors[slot] = color
+
+    def push(self, slots, positions, radii, colors):
+        """
+        Append a detection to each of the given tracks.
+        :param slots: Slots of the matched tracks, each at most once.
+        :param positions: (n, 2) array of detected positions.
+        :param radii: Detected radius of each track.
+        :param colors: Detected color of each track.
+        """
+        self.velocities[slots] = positions - self.trail[slots, self.heads[slots]]
+        self.heads[slots] = (self.heads[slots] + 1) % self.buffer_size
+        self.trail[slots, self.heads[slots]] = positions
+        self.lengths[slots] = np.minimum(self.lengths[slots] + 1, self.buffer_size)
+        self.radii[slots] = radii
+        self.missed[slots] = 0
+        for slot, color in zip(slots.tolist(), colors):
+            self.colors[slot] = color
+
+    def drop(self, slots):
+        """
+        Free the slots of tracks that ended.
+        """
+        self.active[slots] = False
+        self.ids[slots] = -1
+        for slot in slots.tolist():
+            self.colors[slot] = None
+
+    def latest(self, slots):
+        """
+        :return: Latest position of one slot, or (n, 2) array for an array of slots.
+        """
+        return self.trail[slots, self.heads[slots]]
+
+    def history(self, slot):
+        """
+        :return: (length, 2) array of the positions of a track, oldest first.
+        """
+        length = self.lengths[slot]
+        order = (self.heads[slot] - length + 1 + np.arange(length)) % self.buffer_size
+        return self.trail[slot, order]
+
+    def histories(self, slots):
+        """
+        Position histories of many tracks at once, each oldest first.
+        :param slots: Store slots of the tracks.
+        :return: Tuple of ((n, buffer_size, 2) array, length of each history),
+                 rows past a track's length hold stale positions.
+        """
+        lengths = self.lengths[slots]
+        order = (self.heads[slots] - lengths + 1)[:, None] + np.arange(self.buffer_size)
+        return self.trail[slots[:, None], order % self.buffer_size], lengths
+
+    def _grow(self, capacity):
+        """
+        Reallocate every array with room for `capacity` tracks.
+        """
+        extra = capacity - self.capacity
+        for name in ("active", "ids", "trail", "heads", "lengths", "velocities", "radii", "missed", "ages"):
+            array = getattr(self, name)
+            filler = np.full((extra,) + array.shape[1:], -1 if name == "ids" else 0, array.dtype)
+            setattr(self, name, np.concatenate([array, filler]))
+        self.colors.extend([None] * extra)
+        self.capacity = capacity
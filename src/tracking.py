@@ -1,81 +1,454 @@
+import time
+import threading
 import numpy as np
-from collections import deque
 import cv2 as cv
+from src.util import solve_assignment
+from src.physics import KalmanBank
+from src.track_store import TrackStore
+from src.reidentification import ReIdentifier
+from src.metrics import DISABLED
+
+GATED_COST = 1e9  # Cost of a detection/track pair farther apart than max_distance
+
+
+def track_frame(frame, detector, tracker, interval=None, table=None, frame_index=None, timestamp=None):
+    """
+    Update the tracks with a frame. Full detection runs when the interval asks
+    for it, otherwise only the windows around the predicted positions are searched.
+    :param frame: Input image frame.
+    :param detector: BallDetector used on the frame.
+    :param tracker: MultiBallTracker to update.
+    :param interval: Optional AdaptiveDetectionInterval, full detection on every frame when omitted.
+    :param table: Optional TableBoundary limiting detection to the table.
+    :param frame_index: Frame number written to the track log, see MultiBallTracker.update_tracks.
+    :param timestamp: Frame timestamp in seconds written to the track log.
+    :return: The detections the tracks were updated with.
+    """
+    if table is not None:
+        detector.set_roi(table.update(frame))
+
+    full_detection = interval is None or interval.should_detect()
+    if full_detection:
+        detected_balls = detector.detect(frame)
+    else:
+        detected_balls = detector.refine(frame, tracker.get_predictions(), tracker.refine_scale)
+
+    tracker.update_tracks(detected_balls, frame_index, timestamp, frame)
+
+    if interval is not None:
+        interval.update(tracker.get_speeds(), full_detection)
+
+    return detected_balls
+
+def _area(ball):
+    """
+    :return: Area of a detection, measured from its contour if the detector did not record it.
+    """
+    area = ball.get("area")
+    return cv.contourArea(ball["contour"]) if area is None else area
 
 class MultiBallTracker:
-    def __init__(self, config):
+    def __init__(self, config, metrics=None):
         """
         Initialize multi-ball tracker.
         :param buffer_size: Maximum trajectory points to store for each ball.
         :param max_distance: Maximum distance to associate a detection with an existing ball.
         :param min_area: Minimum contour area to consider it as a valid detection.
+        :param assignment: "greedy" or "optimal" matching of detections to tracks.
+        :param max_missed_frames: Frames an unmatched track survives before it is dropped.
+        :param motion_model: "linear" extrapolation or "kalman" filtering of each track.
+        :param kalman: Parameters of the Kalman filter used by the "kalman" model.
+        :param refine_scale: Window half size, in radii, for refining predicted positions.
+        :param max_tracks: Tracks preallocated in the track store, grown when exceeded.
+        :param reid: Settings of the appearance based re-identification of lost tracks.
+        :param log_path: Optional binary track log every frame's tracks are appended to.
+        :param log_flush_frames: Frames between flushes of the track log.
+        :param metrics: Optional Metrics receiving step timings and track counters.
         """
-        self.config = config
+        self.metrics = metrics if metrics is not None else DISABLED
         self.buffer_size = config["buffer_size"]
-        self.max_distance = config["max_distance"]
-        self.min_area = config["min_area"]  # Ignore contours smaller than this area
-        self.ball_tracks = {}  # {ball_id: {"positions": deque, "radius": radius, "velocity": velocity}}
+
+        # Every track lives in a row of preallocated arrays, updated for all tracks at once
+        self.store = TrackStore(config.get("max_tracks", 64), self.buffer_size)
+        self.kalman = None
+        self.reid = None
         self.next_ball_id = 0
+        self.pending = None  # Settings from reconfigure() and adjust(), swapped in before the next update
+        self.pending_lock = threading.Lock()
+        self.settings = {}  # Compiled settings in use
+        self.overrides = {}  # Settings from adjust(), kept on top of the compiled ones
+
+        self._apply(self.compile(config))
+
+        # Optional binary log of every frame's tracks, read back with src.track_log.TrackLog
+        self.log = None
+        self.frames_tracked = 0
+        self.started = time.monotonic()
+        if config.get("log_path"):
+            from src.track_log import TrackLogWriter
+            self.log = TrackLogWriter(config["log_path"], config.get("log_flush_frames", 30))
+
+    @staticmethod
+    def compile(config, buffer_size=None):
+        """
+        Build everything the tracker derives from its settings, without
+        touching a running tracker.
+        :param config: The tracking configuration dictionary.
+        :param buffer_size: Trail length of a running tracker, which cannot change.
+        :return: Dictionary of tracker settings, for reconfigure().
+        """
+        if buffer_size is None:
+            buffer_size = config["buffer_size"]
+        elif config["buffer_size"] != buffer_size:
+            print(f"buffer_size cannot change while tracking, keeping {buffer_size}.")
+
+        trail_thickness = (np.sqrt(buffer_size / np.arange(1, buffer_size + 1)) * 2.5).astype(int)
+        return {
+            "config": config,
+            "max_distance": config["max_distance"],
+            "min_area": config["min_area"],  # Ignore contours smaller than this area
+            "assignment": config.get("assignment", "greedy"),
+            "max_missed_frames": config.get("max_missed_frames", 0),
+            "motion_model": config.get("motion_model", "linear"),
+            "kalman_params": config.get("kalman", {}),
+            "refine_scale": config.get("refine_scale", 2.0),
+            "render_interval": config.get("render_interval", 1),  # Frames between drawn frames in the display loops
+            # Trails are drawn with one polylines call per thickness band, or one line per segment
+            "trail_mode": config.get("trail_mode", "bands"),
+            "trail_length": min(config.get("trail_length", buffer_size), buffer_size),  # Newest positions drawn per trail
+            "trail_thickness": trail_thickness,
+            "trail_bands": MultiBallTracker._thickness_bands(trail_thickness),
+        }
+
+    def reconfigure(self, compiled):
+        """
+        Hand the tracker new settings from compile(). They are swapped in at
+        the start of the next update, so the tracks are kept.
+        :param compiled: Result of MultiBallTracker.compile().
+        """
+        with self.pending_lock:
+            self.pending = dict(self.pending or {}, **compiled)
+
+    def adjust(self, overrides):
+        """
+        Override some compiled settings, e.g. from the QualityGovernor. The
+        overrides are swapped in like reconfigure() and outlast later reconfigures.
+        :param overrides: Dictionary of settings, e.g. {"trail_length": 16}, empty to drop all overrides.
+        """
+        with self.pending_lock:
+            self.pending = dict(self.pending or {}, overrides=dict(overrides))
+
+    def _apply(self, compiled):
+        """
+        Swap in compiled settings and overrides, starting or stopping the
+        Kalman filters and re-identification when they are switched on or off.
+        """
+        compiled = dict(compiled)
+        self.overrides = compiled.pop("overrides", self.overrides)
+        self.settings.update(compiled)
+        for name, value in dict(self.settings, **self.overrides).items():
+            setattr(self, name, value)
+
+        if self.motion_model != "kalman":
+            self.kalman = None
+        elif self.kalman is None:
+            # Filters of running tracks start at rest at their latest position
+            self.kalman = KalmanBank(self.store.capacity, **self.kalman_params)
+            slots = np.flatnonzero(self.store.active)
+            self.kalman.start(slots, self.store.latest(slots))
+        else:
+            self.kalman.configure(**self.kalman_params)
+
+        # Lost tracks are remembered by appearance, so a ball hidden for a while keeps its ID
+        reid_config = self.config.get("reid", {})
+        if not reid_config.get("enabled"):
+            self.reid = None
+        elif self.reid is None or self.reid.bins != tuple(reid_config.get("bins", [8, 4])):
+            self.reid = ReIdentifier(reid_config, self.store.capacity)
+        else:
+            self.reid.configure(reid_config)
+
+    @property
+    def ball_tracks(self):
+        """
+        :return: {ball_id: TrackView} of the live tracks.
+        """
+        return {view.id: view for view in self.store.views()}
 
-    def update_tracks(self, detected_balls):
+    def update_tracks(self, detected_balls, frame_index=None, timestamp=None, frame=None):
         """
         Update ball tracks with the latest detections.
         :param detected_balls: List of detected balls from BallDetector.
+        :param frame_index: Frame number for the track log, defaults to the number of frames tracked.
+        :param timestamp: Frame timestamp for the track log, defaults to seconds since the tracker started.
+        :param frame: Frame the detections came from, needed for re-identification.
         """
-        new_tracks = {}
-
-        for ball in detected_balls:
-            position = np.array(ball["position"])
-            radius = ball["radius"]
-            matched_id = None
-
-            # Skip small detections that are likely noise
-            if cv.contourArea(ball["contour"]) < self.min_area:
-                continue
-
-            # Try to match the ball with an existing track
-            for ball_id, track in self.ball_tracks.items():
-                # Prediction: the predicted position based on the last known velocity
-                if len(track["positions"]) > 1:
-                    velocity = (track["positions"][-1] - track["positions"][-2])
-                    predicted_position = track["positions"][-1] + velocity
-                    predicted_distance = np.linalg.norm(position - predicted_position)
-
-                    # Match if the predicted distance is within the max_distance threshold
-                    if predicted_distance < self.max_distance:
-                        matched_id = ball_id
-                        break
-                else:
-                    # First frame for this ball, use the last position
-                    if np.linalg.norm(position - np.array(track["positions"][-1])) < self.max_distance:
-                        matched_id = ball_id
-                        break
-
-            if matched_id is not None:
-                # Update the existing track
-                new_tracks[matched_id] = self.ball_tracks[matched_id]
-                new_tracks[matched_id]["positions"].append(position)
-                new_tracks[matched_id]["radius"] = radius
-            else:
-                # Start a new track
-                new_tracks[self.next_ball_id] = {
-                    "positions": deque([position], maxlen=self.buffer_size),
-                    "radius": radius
-                }
-                self.next_ball_id += 1
+        if self.pending is not None:
+            with self.pending_lock:
+                compiled, self.pending = self.pending, None
+            self._apply(compiled)
+
+        metrics = self.metrics
+        start = metrics.now()
+        detection_count, created_before = len(detected_balls), self.next_ball_id
+        store = self.store
+        reid = self.reid if frame is not None else None
+
+        # Skip small detections that are likely noise
+        detected_balls = [ball for ball in detected_balls if _area(ball) >= self.min_area]
+        positions = np.array([ball["position"] for ball in detected_balls], dtype=np.float64).reshape(-1, 2)
+        slots = store.slots()
+
+        step_start = metrics.now()
+        if self.assignment == "optimal":
+            rows, cols = self._assign_optimal(positions, slots)
+        else:
+            rows, cols = self._assign_greedy(positions, slots)
+        metrics.observe("track_step_seconds", step_start, step="associate")
+
+        # Extend the history and correct the filter of every matched track at once
+        matched = slots[cols]
+        store.push(matched, positions[rows], [detected_balls[i]["radius"] for i in rows],
+                   [detected_balls[i]["color"] for i in rows])
+        if self.kalman is not None:
+            self.kalman.update(matched, positions[rows])
+        if reid is not None and len(rows) and self.frames_tracked % reid.update_interval == 0:
+            reid.update(matched, reid.describe(frame, [detected_balls[i] for i in rows]))
+
+        # Keep unmatched tracks alive for a few frames, e.g. while a ball is occluded
+        unmatched = slots[~np.isin(slots, matched)]
+        store.missed[unmatched] += 1
+        expired = unmatched[store.missed[unmatched] > self.max_missed_frames]
+        if reid is not None and len(expired):
+            reid.lose(expired, store.ids[expired], [store.colors[slot] for slot in expired.tolist()],
+                      store.latest(expired), self.frames_tracked)
+        store.drop(expired)
+        store.ages[store.active] += 1
+
+        # Start a track for every detection that matched none
+        new = np.flatnonzero(~np.isin(np.arange(len(detected_balls)), rows))
+        recovered = 0
+        if len(new):
+            recovered = self._start_tracks(new, positions, detected_balls, frame if reid is not None else None)
+
+        # Advance the motion model so it holds the prediction for the next frame
+        step_start = metrics.now()
+        if self.kalman is not None:
+            self.kalman.predict(np.flatnonzero(store.active))
+        metrics.observe("track_step_seconds", step_start, step="predict")
+
+        if self.log is not None:
+            self._log_frame(frame_index, timestamp)
+        self.frames_tracked += 1
+
+        metrics.increment("detections_rejected_total", detection_count - len(detected_balls))
+        metrics.increment("tracks_created_total", self.next_ball_id - created_before)
+        metrics.increment("tracks_dropped_total", len(expired))
+        metrics.increment("tracks_recovered_total", recovered)
+        metrics.set("tracks_active", int(np.count_nonzero(store.active)))
+        metrics.observe("update_tracks_seconds", start)
+
+    def _assign_greedy(self, positions, slots):
+        """
+        Match each detection to the first free track whose prediction is close enough.
+        :param positions: (n, 2) array of detected positions, already filtered by area.
+        :param slots: Store slots of the live tracks, ordered by track ID.
+        :return: Tuple of (detection indices, indices into slots) of the matches.
+        """
+        rows, cols = [], []
+        if len(positions) and len(slots):
+            # Distance from every detection to every predicted position in one operation
+            distances = np.linalg.norm(positions[:, None, :] - self._predict(slots)[None, :, :], axis=2)
+            close = distances < self.max_distance
+            free = np.ones(len(slots), bool)
+            for i in range(len(positions)):
+                candidates = np.flatnonzero(close[i] & free)
+                if len(candidates):
+                    rows.append(i)
+                    cols.append(candidates[0])
+                    free[candidates[0]] = False
+
+        return np.array(rows, np.int64), np.array(cols, np.int64)
+
+    def _assign_optimal(self, positions, slots):
+        """
+        Match detections to tracks with a globally optimal assignment of the
+        distances between detections and predicted track positions.
+        :param positions: (n, 2) array of detected positions, already filtered by area.
+        :param slots: Store slots of the live tracks, ordered by track ID.
+        :return: Tuple of (detection indices, indices into slots) of the matches.
+        """
+        if not len(positions) or not len(slots):
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
 
-        # Update the tracker state
-        self.ball_tracks = new_tracks
+        # Distance from every detection to every predicted position in one operation
+        cost = np.linalg.norm(positions[:, None, :] - self._predict(slots)[None, :, :], axis=2)
+
+        # Detections and tracks without a single pair inside the gate can never match,
+        # leaving them out keeps the assignment problem small
+        gated = cost >= self.max_distance
+        live_rows, live_cols = np.flatnonzero(~gated.all(axis=1)), np.flatnonzero(~gated.all(axis=0))
+        if not len(live_rows):
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        cost, gated = cost[np.ix_(live_rows, live_cols)], gated[np.ix_(live_rows, live_cols)]
+
+        # Pairs outside the gate may still be assigned, but are discarded afterwards
+        cost[gated] = GATED_COST
+        rows, cols = solve_assignment(cost)
+        valid = ~gated[rows, cols]
+
+        return live_rows[rows[valid]], live_cols[cols[valid]]
+
+    def _predict(self, slots):
+        """
+        Predict where tracks are in the current frame from their last known velocity.
+        :param slots: Store slots of the tracks to predict.
+        :return: (n, 2) array of predicted positions.
+        """
+        if self.kalman is not None:
+            return self.kalman.positions(slots)
+
+        # New tracks have no velocity yet and stay at their last position
+        missed = self.store.missed[slots]
+        return self.store.latest(slots) + self.store.velocities[slots] * (missed + 1)[:, None]
+
+    def _start_tracks(self, new, positions, detected_balls, frame=None):
+        """
+        Start a track for each of the given detections, reusing the ID of a
+        lost track when re-identification recognizes the ball.
+        :param new: Indices of the detections that start a track.
+        :param positions: (n, 2) array of all detected positions.
+        :param detected_balls: All detections, already filtered by area.
+        :param frame: Frame of the detections, None skips re-identification.
+        :return: Number of tracks that got a lost track's ID back.
+        """
+        balls = [detected_balls[i] for i in new]
+        colors = [ball["color"] for ball in balls]
+        ids = np.full(len(new), -1, np.int64)
+        signatures = None
+        if frame is not None:
+            signatures = self.reid.describe(frame, balls)
+            ids = self.reid.recover(colors, signatures, positions[new], self.frames_tracked)
+
+        # Every detection the gallery did not recognize gets the next free ID
+        fresh = ids < 0
+        ids[fresh] = np.arange(self.next_ball_id, self.next_ball_id + np.count_nonzero(fresh))
+        self.next_ball_id += int(np.count_nonzero(fresh))
+
+        slots = self.store.allocate(len(new))
+        if self.kalman is not None and len(self.kalman.states) < self.store.capacity:
+            self.kalman.grow(self.store.capacity)
+        self.store.start(slots, ids, positions[new], [ball["radius"] for ball in balls], colors)
+        if self.kalman is not None:
+            self.kalman.start(slots, positions[new])
+        if signatures is not None:
+            self.reid.grow(self.store.capacity)
+            self.reid.start(slots, signatures)
+
+        return len(new) - int(np.count_nonzero(fresh))
+
+    def _log_frame(self, frame_index, timestamp):
+        """
+        Append the live tracks to the track log.
+        """
+        if frame_index is None:
+            frame_index = self.frames_tracked
+        if timestamp is None:
+            timestamp = time.monotonic() - self.started
+        slots = self.store.slots()
+        self.log.append(frame_index, timestamp, self.store.ids[slots], self.store.latest(slots),
+                        self.store.radii[slots], [self.store.colors[slot] for slot in slots.tolist()],
+                        self.store.missed[slots])
+
+    def restore(self, ids, positions, radii, colors, missed):
+        """
+        Set the tracks to a logged frame, e.g. when replaying a track log.
+        Tracks seen in the previous frame keep their history, so trails build
+        up as consecutive frames are restored.
+        :param ids: Track IDs of the frame.
+        :param positions: (n, 2) array of track positions.
+        :param radii: Radius of each track.
+        :param colors: Color of each track.
+        :param missed: Frames each track had gone undetected.
+        """
+        store = self.store
+        ids, missed = np.asarray(ids, np.int64), np.asarray(missed, np.int64)
+        slots = store.slots()
+        live_ids = store.ids[slots]  # Ascending, slots are ordered by ID
+        store.drop(slots[~np.isin(live_ids, ids)])
+
+        known = np.isin(ids, live_ids)
+        existing = slots[np.searchsorted(live_ids, ids[known])]
+        # Tracks that were missed kept their last position, only detections extend the history
+        moved = missed[known] == 0
+        known_rows = np.flatnonzero(known)[moved]
+        store.push(existing[moved], positions[known_rows], radii[known_rows], [colors[i] for i in known_rows.tolist()])
+        store.missed[existing] = missed[known]
+        store.ages[existing] += 1
+
+        new_rows = np.flatnonzero(~known)
+        if len(new_rows):
+            new = store.allocate(len(new_rows))
+            store.start(new, ids[new_rows], positions[new_rows], radii[new_rows], [colors[i] for i in new_rows.tolist()])
+            store.missed[new] = missed[new_rows]
+        if len(ids):
+            self.next_ball_id = max(self.next_ball_id, int(ids.max()) + 1)
+
+    def close(self):
+        """
+        Flush and close the track log, if there is one.
+        """
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def get_predictions(self):
+        """
+        Get where each tracked ball is expected in the next frame.
+        :return: List of (predicted position, radius) per track.
+        """
+        slots = self.store.slots()
+        return list(zip(self._predict(slots), self.store.radii[slots].tolist()))
+
+    def get_speeds(self):
+        """
+        Get the current speed of each tracked ball.
+        :return: List of speeds in pixels per frame.
+        """
+        slots = self.store.slots()
+        if self.kalman is not None:
+            return self.kalman.speeds(slots).tolist()
+
+        velocities = self.store.velocities[slots]
+        return np.hypot(velocities[:, 0], velocities[:, 1]).tolist()
+
+    def get_tracks(self):
+        """
+        Get a snapshot of the current ball tracks.
+        :return: List of tracks with their ID, latest position, radius and color.
+        """
+        slots = self.store.slots()
+        positions = self.store.latest(slots).astype(int).tolist()
+        tracks = []
+        for slot, (x, y), radius in zip(slots.tolist(), positions, self.store.radii[slots].tolist()):
+            tracks.append({
+                "id": int(self.store.ids[slot]),
+                "position": (x, y),
+                "radius": int(radius),
+                "color": self.store.colors[slot]
+            })
+
+        return tracks
 
     def draw_tracks(self, frame):
         """
         Draw ball tracks and current positions on the frame.
         :param frame: Frame to draw on.
         """
-        for ball_id, track_data in self.ball_tracks.items():
-            positions = track_data["positions"]
-            radius = track_data["radius"]
-            center = tuple(positions[-1].astype(int))
+        start = self.metrics.now()
+        for track in self.store.views():
+            ball_id, radius = track.id, track.radius
+            center = tuple(track.position.astype(int).tolist())
 
             # Draw the circle outline
             cv.circle(frame, center, int(radius), self.config["circle_outline_color"], self.config["circle_thickness"])
@@ -91,11 +464,60 @@ class MultiBallTracker:
             cv.putText(frame, f"ID: {ball_id}", (center[0] - 20, center[1] - 20),
                        cv.FONT_HERSHEY_SIMPLEX, self.config["font_scale"], self.config["font_color"], self.config["font_thickness"])
 
-            # Draw the trajectory
-            for i in range(1, len(positions)):
-                if positions[i - 1] is None or positions[i] is None:
-                    continue
+        # Draw the trajectories
+        if self.trail_mode == "segments":
+            self._draw_trail_segments(frame)
+        else:
+            self._draw_trail_bands(frame)
 
-                thickness = int(np.sqrt(self.buffer_size / float(i + 1)) * 2.5)
-                cv.line(frame, tuple(positions[i - 1].astype(int)), tuple(positions[i].astype(int)), self.config["tracking_line_color"], thickness)
+        self.metrics.observe("draw_tracks_seconds", start)
+
+    @staticmethod
+    def _thickness_bands(trail_thickness):
+        """
+        Group trail segments into runs of equal thickness. Segment i joins
+        positions i - 1 and i of a trail, oldest first.
+        :param trail_thickness: Thickness of every segment.
+        :return: List of (thickness, first segment, end segment).
+        """
+        bands = []
+        for i in range(1, len(trail_thickness)):
+            thickness = int(trail_thickness[i])
+            if bands and bands[-1][0] == thickness:
+                bands[-1][2] = i + 1
+            else:
+                bands.append([thickness, i, i + 1])
+
+        return [tuple(band) for band in bands]
+
+    def _draw_trail_segments(self, frame):
+        """
+        Draw every trail one segment at a time.
+        """
+        color = self.config["tracking_line_color"]
+        for track in self.store.views():
+            positions = track.positions.astype(int).tolist()
+            for i in range(max(len(positions) - self.trail_length, 0) + 1, len(positions)):
+                cv.line(frame, tuple(positions[i - 1]), tuple(positions[i]), color, int(self.trail_thickness[i]))
+
+    def _draw_trail_bands(self, frame):
+        """
+        Draw all trails with one polylines call per thickness band.
+        """
+        slots = self.store.slots()
+        if not len(slots):
+            return
+        histories, lengths = self.store.histories(slots)
+        histories = histories.astype(np.int32)
+        lengths = lengths.tolist()
 
+        trail_length = self.trail_length
+        for thickness, first, end in self.trail_bands:
+            # The band joins positions first - 1 .. end - 1 of every trail long enough to reach it,
+            # leaving out positions older than the newest trail_length
+            if all(length <= first for length in lengths):
+                break  # Later bands start further along every trail
+            lines = [history[max(first - 1, length - trail_length):min(end, length)]
+                     for history, length in zip(histories, lengths) if min(end, length) - max(first - 1, length - trail_length) >= 2]
+            if lines:
+                cv.polylines(frame, lines, False, self.config["tracking_line_color"], thickness)
@@ -1,4 +1,3 @@
-from turtle import up
 import numpy as np
 import cv2 as cv
 
@@ -13,3 +12,125 @@ def get_limits(color):
     upper_limit = np.array(upper_limit, dtype=np.uint8)
 
     return lower_limit, upper_limit
+
+# Contours from cv.findContours, which returns (contours, hierarchy) in OpenCV 2 and 4
+# but (image, contours, hierarchy) in OpenCV 3
+def grab_contours(result):
+    return result[1] if len(result) == 3 else result[0]
+
+# Format version of the tables build_label_lut builds, bump it when the labeling
+# changes so tables cached by an older version are not reused
+LUT_FORMAT = 1
+
+# Compile every color range of a profile into a single HSV -> label lookup table
+def build_label_lut(color_ranges):
+    """
+    Build a 3D lookup table mapping every HSV triple to a color label.
+    Label 0 is background, label i is the i-th color of the profile. Where
+    ranges overlap the color listed first in the profile wins.
+    The table is stored as a flat array indexed by h | s << 8 | v << 16,
+    which is the layout of an HSV frame packed into 32-bit pixels.
+    :param color_ranges: Color ranges of a profile (e.g., from colors.yaml).
+    :return: Flat lookup table of 256 ** 3 labels.
+    """
+    if len(color_ranges) > 255:
+        raise ValueError("A profile can hold at most 255 colors.")
+
+    lut = np.zeros((256, 256, 256), dtype=np.uint8)  # Indexed as [v, s, h]
+
+    # Paint in reverse order so earlier colors overwrite later ones
+    for label, color in reversed(list(enumerate(color_ranges.values(), start=1))):
+        (h_low, s_low, v_low), (h_high, s_high, v_high) = [limit.tolist() for limit in get_limits(color)]
+        lut[v_low:v_high + 1, s_low:s_high + 1, h_low:h_high + 1] = label
+
+    return lut.ravel()
+
+# Optimal assignment between rows and columns of a cost matrix
+def solve_assignment(cost):
+    """
+    Solve the minimum cost assignment problem (Hungarian method, shortest
+    augmenting paths) with the column scan of every step vectorized.
+    :param cost: Cost matrix of shape (rows, cols), need not be square.
+    :return: Tuple of (row_indices, col_indices) of the assigned pairs, sorted by row.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    if n == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    # Potentials and matching use 1-based indices, column 0 is a virtual start column
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    assigned_row = np.zeros(m + 1, dtype=int)  # Row matched to each column, 0 when free
+    way = np.zeros(m + 1, dtype=int)
+
+    for row in range(1, n + 1):
+        assigned_row[0] = row
+        column = 0
+        min_reduced = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+
+        # Grow the alternating tree until it reaches a free column
+        while True:
+            used[column] = True
+            current_row = assigned_row[column]
+            free = ~used[1:]
+
+            reduced = cost[current_row - 1] - u[current_row] - v[1:]
+            improved = free & (reduced < min_reduced[1:])
+            min_reduced[1:][improved] = reduced[improved]
+            way[1:][improved] = column
+
+            candidates = np.where(free, min_reduced[1:], np.inf)
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+
+            u[assigned_row[used]] += delta
+            v[used] -= delta
+            min_reduced[1:][free] -= delta
+
+            column = next_column
+            if assigned_row[column] == 0:
+                break
+
+        # Flip the augmenting path
+        while column:
+            previous = way[column]
+            assigned_row[column] = assigned_row[previous]
+            column = previous
+
+    cols = np.nonzero(assigned_row[1:])[0]
+    rows = assigned_row[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+
+    return rows[order], cols[order]
+
+# Merge overlapping rectangles given as (x0, y0, x1, y1)
+def merge_rects(rects):
+    """
+    Merge overlapping rectangles until none of the results overlap.
+    :param rects: List of (x0, y0, x1, y1) rectangles.
+    :return: List of disjoint rectangles covering the input.
+    """
+    merged = list(rects)
+    changed = True
+    while changed:
+        changed = False
+        result = []
+        for rect in merged:
+            for i, other in enumerate(result):
+                if rect[0] < other[2] and other[0] < rect[2] and rect[1] < other[3] and other[1] < rect[3]:
+                    result[i] = (min(rect[0], other[0]), min(rect[1], other[1]),
+                                 max(rect[2], other[2]), max(rect[3], other[3]))
+                    changed = True
+                    break
+            else:
+                result.append(rect)
+        merged = result
+
+    return merged